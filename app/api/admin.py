@@ -0,0 +1,198 @@
+import asyncio
+import hmac
+from typing import Literal
+
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import PlainTextResponse, Response
+
+from ..core import metrics_store
+from ..core.admission import upload_stats
+from ..core.config import get_active_password, get_active_password_token, get_settings
+from ..core.metrics import registry
+from ..core.profiling import (
+    MAX_SAMPLE_INTERVAL_MS,
+    MAX_SAMPLE_SECONDS,
+    MIN_SAMPLE_INTERVAL_MS,
+    memory_tracker,
+    profile_store,
+    sample_process,
+)
+from ..core.transport import telegram_transport
+from ..services.orphan_gc import OrphanCollectorBusy, orphan_collector
+from .common import COOKIE_NAME, http_error
+
+router = APIRouter()
+
+
+@router.get("/api/admin/transport")
+async def get_transport_stats():
+    """
+    返回共享 Telegram 传输层的连接池使用情况（需网页登录）。
+    """
+    return {"status": "ok", "transport": telegram_transport.stats()}
+
+
+@router.get("/api/admin/uploads")
+async def get_upload_stats():
+    """
+    返回上传准入控制的状态：处理中的上传数、排队深度、预留的暂存字节数与发往 Telegram 的分块字节数（需网页登录）。
+    """
+    return {"status": "ok", "uploads": upload_stats()}
+
+
+@router.get("/api/admin/orphans")
+async def get_orphan_stats():
+    """
+    返回孤儿消息回收的状态：消息台账大小、扫描游标、进行中与最近一轮的报告（需网页登录）。
+    """
+    return {"status": "ok", "orphans": await orphan_collector.stats()}
+
+
+@router.post("/api/admin/orphans/scan")
+async def scan_orphans(dry_run: bool = True):
+    """
+    手动触发一轮孤儿回收。
+
+    dry_run=true（默认）立即扫描并返回报告，不删除任何消息；dry_run=false 在后台删除孤儿消息，
+    进度与结果通过 GET /api/admin/orphans 查看。
+    """
+    try:
+        if dry_run:
+            return {"status": "ok", "report": await orphan_collector.run_pass(dry_run=True)}
+        orphan_collector.start_pass()
+    except OrphanCollectorBusy as e:
+        raise http_error(409, str(e), code="orphan_gc_busy") from e
+    return {"status": "ok", "started": True}
+
+
+def _ensure_metrics_auth(request: Request) -> None:
+    """
+    /metrics 鉴权：Authorization: Bearer <METRICS_TOKEN>，或已登录的网页会话。
+    既未设置密码也未设置 METRICS_TOKEN 时与其他接口一样放行。
+    """
+    metrics_token = (get_settings().METRICS_TOKEN or "").strip()
+    if metrics_token:
+        scheme, _, credentials = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and hmac.compare_digest(credentials.strip(), metrics_token):
+            return
+
+    active_password = get_active_password()
+    if active_password:
+        session_password = request.cookies.get(COOKIE_NAME)
+        if session_password and session_password in (get_active_password_token(), active_password):
+            return
+    elif not metrics_token:
+        return
+
+    raise http_error(401, "需要登录或有效的 METRICS_TOKEN", code="metrics_unauthorized")
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics(request: Request):
+    """Prometheus 文本格式的指标；多 worker 部署时为所有 worker 的汇总。"""
+    _ensure_metrics_auth(request)
+    if metrics_store.is_enabled():
+        text = await asyncio.to_thread(metrics_store.render_all)
+    else:
+        text = registry.render()
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _ensure_profiling_enabled() -> None:
+    if not get_settings().PROFILING_ENABLED:
+        raise http_error(403, "未开启性能分析（PROFILING_ENABLED）", code="profiling_disabled")
+
+
+def _attachment(profile_id: str, filename: str, media_type: str, content: bytes) -> Response:
+    return Response(
+        content,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Profile-Id": profile_id,
+            "Cache-Control": "no-store",
+        },
+    )
+
+
+@router.get("/api/admin/profiles")
+async def list_profiles():
+    """
+    列出最近的分析结果（单请求分析与进程级采样），需网页登录。
+    """
+    _ensure_profiling_enabled()
+    return {"status": "ok", "profiles": await asyncio.to_thread(profile_store.list)}
+
+
+@router.get("/api/admin/profiles/{profile_id}")
+async def download_profile(profile_id: str):
+    """
+    下载分析结果：speedscope JSON（可在 https://www.speedscope.app 打开）、折叠栈文本或 pstats 文件。
+    """
+    _ensure_profiling_enabled()
+    item = await asyncio.to_thread(profile_store.get, profile_id)
+    if item is None:
+        raise http_error(404, "分析结果不存在或已被淘汰", code="profile_not_found")
+    return _attachment(profile_id, *item)
+
+
+@router.post("/api/admin/profile/cpu")
+async def profile_cpu(
+    seconds: float = Query(10, gt=0, le=MAX_SAMPLE_SECONDS),
+    interval_ms: float = Query(5, ge=MIN_SAMPLE_INTERVAL_MS, le=MAX_SAMPLE_INTERVAL_MS),
+    format: Literal["speedscope", "collapsed"] = "speedscope",
+):
+    """
+    对整个进程采样 seconds 秒（所有线程的调用栈），完成后直接返回结果文件，并保存在最近结果中。
+    """
+    _ensure_profiling_enabled()
+    try:
+        filename, media_type, content = await asyncio.to_thread(sample_process, seconds, interval_ms, format)
+    except RuntimeError as e:
+        raise http_error(409, str(e), code="profiling_busy") from e
+    profile_id = profile_store.new_id()
+    await asyncio.to_thread(profile_store.put, profile_id, filename, media_type, content)
+    return _attachment(profile_id, filename, media_type, content)
+
+
+@router.get("/api/admin/profile/memory")
+async def memory_status():
+    """
+    tracemalloc 状态与当前跟踪到的内存。
+    """
+    _ensure_profiling_enabled()
+    return {"status": "ok", "memory": memory_tracker.status()}
+
+
+@router.post("/api/admin/profile/memory/start")
+async def memory_start(frames: int = Query(10, ge=1, le=50)):
+    """
+    开启 tracemalloc（frames 为每次分配记录的调用栈深度）。开启期间所有内存分配都有额外开销。
+    """
+    _ensure_profiling_enabled()
+    return {"status": "ok", "memory": memory_tracker.start(frames)}
+
+
+@router.post("/api/admin/profile/memory/snapshot")
+async def memory_snapshot(
+    limit: int = Query(30, ge=1, le=500),
+    key_type: Literal["lineno", "filename", "traceback"] = "lineno",
+):
+    """
+    拍摄 tracemalloc 快照，返回相对上一次快照增长最多的分配位置。
+    """
+    _ensure_profiling_enabled()
+    try:
+        result = await asyncio.to_thread(memory_tracker.snapshot, limit, key_type)
+    except RuntimeError as e:
+        raise http_error(409, str(e), code="tracemalloc_not_started") from e
+    return {"status": "ok", "memory": result}
+
+
+@router.post("/api/admin/profile/memory/stop")
+async def memory_stop():
+    """
+    关闭 tracemalloc 并丢弃已保存的快照。
+    """
+    _ensure_profiling_enabled()
+    return {"status": "ok", "memory": memory_tracker.stop()}
@@ -1,10 +1,13 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+from collections.abc import Awaitable
 from fastapi import HTTPException, Request
-from typing import Any
+from starlette.requests import ClientDisconnect
+from typing import Any, TypeVar
 
-from ..core.config import get_active_password
+from ..core.config import get_active_password, get_active_password_token
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +23,40 @@ def http_error(status_code: int, message: str, *, code: str = "error", details:
     return HTTPException(status_code=status_code, detail=error_payload(message, code=code, details=details))
 
 
+T = TypeVar("T")
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def run_until_disconnected(request: Request, awaitable: Awaitable[T], *, cancel_msg: str | None = None) -> T:
+    """
+    运行 awaitable；期间客户端断开连接时以 cancel_msg 为原因取消它（等待其清理完成）并抛出 ClientDisconnect。
+
+    只能在请求体读取完毕之后使用，此时 receive() 只会返回 http.disconnect。
+    """
+    task = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        await asyncio.wait((task, watcher), return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        # 请求本身被取消（例如服务关闭）：不带原因地取消，由 awaitable 自行决定如何收尾
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        raise
+    finally:
+        watcher.cancel()
+    if not task.done():
+        task.cancel(cancel_msg)
+        await asyncio.gather(task, return_exceptions=True)
+        raise ClientDisconnect()
+    return task.result()
+
+
 def is_web_upload_request(request: Request) -> bool:
     return "referer" in request.headers
 
@@ -28,6 +65,14 @@ import re
 
 COOKIE_NAME = "tgstate_session"
 
+def _is_session_valid(request: Request, active_password: str) -> bool:
+    # Cookie 为 SHA256(password)（新版）或明文密码（旧版），与鉴权中间件保持一致
+    session_password = request.cookies.get(COOKIE_NAME)
+    if not session_password:
+        return False
+    return session_password in (get_active_password_token(), active_password)
+
+
 def ensure_upload_auth(request: Request, app_settings: dict, submitted_key: str | None) -> None:
     picgo_api_key = app_settings.get("PICGO_API_KEY")
     active_password = app_settings.get("PASS_WORD") or get_active_password()
@@ -48,15 +93,13 @@ def ensure_upload_auth(request: Request, app_settings: dict, submitted_key: str
         if not web_request:
             return
         # Fix: use correct cookie name
-        session_password = request.cookies.get(COOKIE_NAME)
-        if active_password == session_password:
+        if _is_session_valid(request, active_password):
             return
         logger.warning("Web 上传鉴权失败：需要登录")
         raise http_error(401, "需要网页登录", code="login_required")
 
     if web_request:
-        session_password = request.cookies.get(COOKIE_NAME)
-        if active_password == session_password:
+        if _is_session_valid(request, active_password):
             return
         logger.warning("Web 上传鉴权失败：需要登录")
         raise http_error(401, "需要网页登录", code="login_required")
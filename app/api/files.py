@@ -1,39 +1,123 @@
 from __future__ import annotations
 
 import asyncio
-import mimetypes
 import logging
+import os
+import time
 from typing import List, Optional
 from urllib.parse import quote
 
+import anyio
 import httpx
 from fastapi import APIRouter, Depends, Query, Request, Response
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
+from starlette.types import Receive, Scope, Send
 
 from .. import database
 from ..core.http_client import get_http_client
-from ..core.config import get_app_settings
+from ..core.config import get_app_settings, get_settings
 from ..core.channels import get_primary_channel
-from ..services.telegram_service import TelegramService, get_telegram_service, get_telegram_service_for_channel
+from ..core.filetypes import classify_file
+from ..core.metrics import download_aborted, download_bytes, download_throughput_bytes, download_ttfb_seconds
+from ..core.signing import sign_download, verify_download
+from ..core.tracing import add_span, span
+from ..services.telegram_service import (
+    MANIFEST_MIN_FILESIZE,
+    TelegramService,
+    get_telegram_service,
+    get_telegram_service_for_channel,
+    is_local_file_path,
+    parse_manifest,
+    read_local_file,
+)
 from .common import http_error
 
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+MANIFEST_MAGIC = b"tgstate-blob\n"
+# 本地模式下流式读取分块文件时每次读取的字节数
+LOCAL_READ_SIZE = 1024 * 1024
+
+
+def parse_range_header(range_header: str, file_size: int) -> tuple[int, int] | None:
+    """
+    解析单段 Range 请求头（bytes=start-end / bytes=start- / bytes=-suffix）。
+
+    返回闭区间 (start, end)；格式无法识别时返回 None（回退为完整内容），
+    起点超出文件大小时抛出 ValueError（应返回 416）。
+    """
+    try:
+        unit, ranges = range_header.split("=", 1)
+        if unit.strip() != "bytes":
+            return None
+        start_str, end_str = ranges.split(",", 1)[0].split("-", 1)
+        start_str, end_str = start_str.strip(), end_str.strip()
+        if not start_str:
+            # bytes=-500：最后 500 字节
+            suffix = int(end_str)
+            if suffix <= 0:
+                return None
+            return max(0, file_size - suffix), file_size - 1
+        start = int(start_str)
+        end = int(end_str) if end_str else file_size - 1
+    except ValueError:
+        return None
+
+    if start >= file_size:
+        raise ValueError("range not satisfiable")
+    # Correct end if out of bounds
+    if end >= file_size:
+        end = file_size - 1
+    if end < start:
+        return None
+    return start, end
+
+
+async def probe_is_manifest(client: httpx.AsyncClient, download_url: str) -> bool:
+    """
+    读取文件前 128 字节，判断是否为分块文件的清单（manifest）。
+    """
+    if is_local_file_path(download_url):
+        try:
+            head = await asyncio.to_thread(read_local_file, download_url, 128)
+        except OSError as e:
+            raise http_error(502, "无法读取本地 Bot API 服务器的文件。", code="local_file_unavailable", details=str(e))
+        return head.startswith(MANIFEST_MAGIC)
+
+    try:
+        head_resp = await client.get(download_url, headers={"Range": "bytes=0-127"})
+        head_resp.raise_for_status()
+    except httpx.RequestError as e:
+        raise http_error(503, "无法连接到 Telegram 服务器。", code="tg_unreachable", details=str(e))
+    return head_resp.content.startswith(MANIFEST_MAGIC)
+
+
 async def serve_file(
     file_id: str,
     filename: str,
     telegram_service: TelegramService,
     client: httpx.AsyncClient,
     request: Request,
-    force_download: bool = False
+    force_download: bool = False,
+    *,
+    filesize: int | None = None,
+    is_manifest: bool | None = None,
+    mime_type: str | None = None,
+    previewable: bool | None = None,
+    extra_headers: dict | None = None,
 ):
     """
     Common logic to serve a file given its file_id (composite) and filename.
     Supports Range requests, Content-Disposition customization.
+
+    已知 is_manifest 时跳过 128 字节的清单探测；对单文件同时已知 filesize 时跳过 HEAD 取大小
+    （签名下载链接会携带这两项信息）。
+    mime_type / previewable 通常取自入库时预先计算的元数据，未提供时按文件名推断。
     """
+    started = time.perf_counter()
     try:
         _, real_file_id = file_id.split(":", 1)
     except ValueError:
@@ -46,82 +130,47 @@ async def serve_file(
     # --- Header Preparation ---
     filename_encoded = quote(str(filename))
     
-    # 1. Content-Type
-    content_type, _ = mimetypes.guess_type(filename)
-    if not content_type:
-        # 兜底逻辑
-        ext = filename.lower().split('.')[-1] if '.' in filename else ''
-        if ext in ('txt', 'log', 'md', 'json', 'yml', 'yaml', 'ini', 'conf'):
-             content_type = "text/plain; charset=utf-8"
-        else:
-             content_type = "application/octet-stream"
-    else:
-        # 如果是 text 类型，补充 charset
-        if content_type.startswith("text/") and "charset" not in content_type:
-             content_type += "; charset=utf-8"
-
-    # 2. Content-Disposition
-    # 定义可预览类型白名单
-    preview_extensions = (
-        # Images
-        ".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp", ".svg", ".ico",
-        # Text/Code
-        ".txt", ".md", ".json", ".xml", ".html", ".css", ".js", ".py", ".log",
-        # Media
-        ".mp4", ".mp3", ".webm", ".ogg", ".wav",
-        # Documents
-        ".pdf"
-    )
-    
-    is_previewable = filename.lower().endswith(preview_extensions)
-    
+    # 1. Content-Type / 2. Content-Disposition
+    if mime_type is None or previewable is None:
+        file_type = classify_file(filename)
+        mime_type = mime_type or file_type.mime_type
+        previewable = file_type.previewable if previewable is None else previewable
+
     if force_download:
         disposition_type = "attachment"
     else:
-        disposition_type = "inline" if is_previewable else "attachment"
+        disposition_type = "inline" if previewable else "attachment"
 
     common_headers = {
         "Content-Disposition": f"{disposition_type}; filename*=UTF-8''{filename_encoded}",
-        "Content-Type": content_type,
+        "Content-Type": mime_type,
         "X-Content-Type-Options": "nosniff",
         "Accept-Ranges": "bytes"
     }
+    if extra_headers:
+        common_headers.update(extra_headers)
 
     # --- Range Handling ---
     range_header = request.headers.get("Range")
     
     # First, peek content to check if it's a manifest (TG split file)
     # We only read a small chunk to identify manifest
-    try:
-        # Use a separate request for head check to avoid consuming the stream
-        # However, getting Content-Length for Range support is tricky with TG API if we don't know it.
-        # DB has `filesize`, let's use it if possible, but serve_file signature relies on passing it or fetching.
-        # Here we just fetch head.
-        
-        # Optimization: We need to know if it's manifest.
-        # Note: If it's a HEAD request from client, we still might need to fetch a bit from TG to know if it's manifest.
-        # But if we just want to return headers for a simple file, maybe we can skip?
-        # No, because if it's manifest, content-type and size are different (manifest is text, real file is binary).
-        # So we MUST fetch head from TG even for HEAD request.
-        
-        head_resp = await client.get(download_url, headers={"Range": "bytes=0-127"})
-        head_resp.raise_for_status()
-        first_bytes = head_resp.content
-    except httpx.RequestError as e:
-        raise http_error(503, "无法连接到 Telegram 服务器。", code="tg_unreachable", details=str(e))
+    # Note: If it's a HEAD request from client, we still might need to fetch a bit from TG to know if it's manifest,
+    # because if it's manifest, content-type and size are different (manifest is text, real file is binary).
+    if is_manifest is None:
+        with span("probe"):
+            is_manifest = await probe_is_manifest(client, download_url)
 
     # Check for manifest (large file split)
-    if first_bytes.startswith(b"tgstate-blob\n"):
+    if is_manifest:
         # Manifest processing (No Range support for split files yet, complex to implement)
-        manifest_resp = await client.get(download_url)
-        manifest_resp.raise_for_status()
-        manifest_content = manifest_resp.content
+        with span("manifest"):
+            manifest_content = await telegram_service.read_file(download_url)
 
-        lines = manifest_content.decode("utf-8").strip().split("\n")
-        if len(lines) < 3:
+        try:
+            _, chunk_file_ids = parse_manifest(manifest_content)
+        except ValueError:
             raise http_error(500, "清单文件格式错误。", code="manifest_invalid")
-        # original_filename = lines[1] 
-        chunk_file_ids = [cid for cid in lines[2:] if cid.strip()]
 
         # Force attachment for split files usually, but respect user preference if previewable (e.g. large video?)
         # For now, let's keep basic logic. Streaming split files with Range is hard.
@@ -130,13 +179,19 @@ async def serve_file(
         if request.method == "HEAD":
              return Response(status_code=200, headers=common_headers)
 
-        return StreamingResponse(
-            stream_chunks(chunk_file_ids, telegram_service, client), 
+        return DownloadStreamingResponse(
+            measure_download(stream_chunks(chunk_file_ids, telegram_service, client), "manifest", started),
             headers=common_headers
         )
 
     # Standard Single File
-    
+
+    # 本地模式：直接从 Bot API 服务器的数据目录读取，FileResponse 自行处理 Range 与 HEAD
+    if is_local_file_path(download_url):
+        response = await serve_local_file(download_url, common_headers)
+        download_ttfb_seconds.labels("local").observe(time.perf_counter() - started)
+        return response
+
     # Get total size for Range
     async def get_remote_file_size():
         # Try HEAD
@@ -148,44 +203,39 @@ async def serve_file(
              pass
         return None
 
-    file_size = await get_remote_file_size()
+    if filesize:
+        file_size = filesize
+    else:
+        with span("head"):
+            file_size = await get_remote_file_size()
 
     # Handle Range (Only for GET)
     if range_header and file_size and request.method != "HEAD":
-        # Parse Range: bytes=0-1024
         try:
-            unit, ranges = range_header.split("=")
-            if unit != "bytes": raise ValueError
-            start_str, end_str = ranges.split("-")
-            start = int(start_str)
-            end = int(end_str) if end_str else file_size - 1
-            
-            if start >= file_size:
-                return Response(status_code=416, headers={"Content-Range": f"bytes */{file_size}"})
-            
-            # Correct end if out of bounds
-            if end >= file_size:
-                end = file_size - 1
-                
+            byte_range = parse_range_header(range_header, file_size)
+        except ValueError:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{file_size}"})
+
+        # Fallback to full content if Range parsing fails
+        if byte_range:
+            start, end = byte_range
             length = end - start + 1
-            
+
             common_headers.update({
                 "Content-Range": f"bytes {start}-{end}/{file_size}",
                 "Content-Length": str(length)
             })
-            
+
             # Stream partial content
             async def range_streamer():
                 async with client.stream("GET", download_url, headers={"Range": f"bytes={start}-{end}"}) as resp:
                     resp.raise_for_status()
                     async for chunk in resp.aiter_bytes():
                         yield chunk
-            
-            return StreamingResponse(range_streamer(), status_code=206, headers=common_headers)
-            
-        except (ValueError, Exception):
-            # Fallback to full content if Range parsing fails
-            pass
+
+            return DownloadStreamingResponse(
+                measure_download(range_streamer(), "range", started), status_code=206, headers=common_headers
+            )
 
     # Full content stream
     if file_size:
@@ -200,7 +250,7 @@ async def serve_file(
             async for chunk in resp.aiter_bytes():
                 yield chunk
 
-    return StreamingResponse(single_file_streamer(), headers=common_headers)
+    return DownloadStreamingResponse(measure_download(single_file_streamer(), "single", started), headers=common_headers)
 
 
 @router.api_route("/d/{file_id}/{filename}", methods=["GET", "HEAD"])
@@ -244,14 +294,181 @@ async def download_file_short(
          raise http_error(404, "文件不存在", code="file_not_found")
 
     force_download = download == "1" or download == "true"
-    return await serve_file(meta['file_id'], meta['filename'], telegram_service, client, request, force_download)
+    return await serve_file(
+        meta['file_id'],
+        meta['filename'],
+        telegram_service,
+        client,
+        request,
+        force_download,
+        mime_type=meta['mime_type'],
+        previewable=meta['previewable'],
+    )
+
+
+@router.api_route("/s/{token}/{filename}", methods=["GET", "HEAD"])
+async def download_file_signed(
+    token: str,
+    filename: str,
+    request: Request,
+    download: Optional[str] = Query(None), # ?download=1
+    client: httpx.AsyncClient = Depends(get_http_client),
+):
+    """
+    通过签名链接下载文件：仅做 HMAC 校验，不查询数据库。
+    路径中的 filename 仅用于美化链接，实际文件名以签名内容为准。
+    """
+    payload, reason = verify_download(token)
+    if not payload:
+        if reason == "expired":
+            raise http_error(410, "下载链接已过期", code="link_expired")
+        raise http_error(403, "下载链接无效", code="invalid_signature")
+
+    try:
+        telegram_service = get_telegram_service()
+    except Exception:
+        raise http_error(503, "未配置 BOT_TOKEN/CHANNEL_NAME，下载不可用", code="cfg_missing")
+
+    # 链接内容在有效期内不变，允许 CDN / 浏览器按签名 URL 缓存到过期为止
+    remaining = max(0, payload["expires_at"] - int(time.time()))
+    force_download = download == "1" or download == "true"
+    return await serve_file(
+        payload["file_id"],
+        payload["filename"],
+        telegram_service,
+        client,
+        request,
+        force_download,
+        filesize=payload["filesize"],
+        is_manifest=payload["is_manifest"],
+        extra_headers={"Cache-Control": f"public, max-age={remaining}"},
+    )
+
+
+class SignRequest(BaseModel):
+    expires_in: int = 3600
+
+
+@router.post("/api/files/{file_id}/sign")
+async def sign_file_url(
+    file_id: str,
+    payload: SignRequest,
+    client: httpx.AsyncClient = Depends(get_http_client),
+):
+    """
+    为指定文件生成限时签名下载链接（/s/{token}/{filename}）。
+    """
+    meta = database.get_file_by_id(file_id)
+    if not meta:
+        raise http_error(404, "文件不存在", code="file_not_found")
+
+    max_ttl = get_settings().SIGNED_URL_MAX_TTL
+    expires_in = min(max(payload.expires_in, 60), max_ttl)
+
+    # 只有达到分块阈值的文件才可能是清单，签名时探测一次，下载时即可跳过探测
+    is_manifest = False
+    if meta["filesize"] >= MANIFEST_MIN_FILESIZE:
+        try:
+            telegram_service = get_telegram_service()
+        except Exception:
+            raise http_error(503, "未配置 BOT_TOKEN/CHANNEL_NAME，无法生成链接", code="cfg_missing") from None
+        try:
+            _, real_file_id = meta["file_id"].split(":", 1)
+        except ValueError:
+            real_file_id = meta["file_id"]
+        download_url = await telegram_service.get_download_url(real_file_id)
+        if not download_url:
+            raise http_error(404, "文件未找到或下载链接已过期。", code="file_not_found")
+        is_manifest = await probe_is_manifest(client, download_url)
+
+    expires_at = int(time.time()) + expires_in
+    token = sign_download(
+        file_id=meta["file_id"],
+        filename=meta["filename"],
+        filesize=meta["filesize"],
+        is_manifest=is_manifest,
+        expires_at=expires_at,
+    )
+    return {
+        "status": "ok",
+        "url": f"/s/{token}/{quote(meta['filename'])}",
+        "expires_at": expires_at,
+    }
 
 
 @router.get("/api/files")
-async def get_files_list():
+async def get_files_list(response: Response):
+    # 先读取版本号再读取列表：两者之间的变更会在下次增量同步时重复下发（幂等）
+    response.headers["X-Files-Version"] = str(database.get_files_version())
     return database.get_all_files()
 
 
+def _split_csv(value: Optional[str]) -> list[str]:
+    return [part.strip() for part in (value or "").split(",") if part.strip()]
+
+
+@router.get("/api/files/page")
+async def get_files_page(
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(database.DEFAULT_PAGE_SIZE, ge=1, le=500),
+    q: Optional[str] = Query(None),
+    date_from: Optional[str] = Query(None),
+    date_to: Optional[str] = Query(None),
+    size_min: Optional[int] = Query(None, ge=0),
+    size_max: Optional[int] = Query(None, ge=0),
+    types: Optional[str] = Query(None),
+    sources: Optional[str] = Query(None),
+    tags: Optional[str] = Query(None),
+):
+    """
+    游标分页获取文件列表（按上传时间倒序），供前端滚动加载。
+
+    types / sources / tags 为逗号分隔的多选项；大小单位为字节。
+    返回 next_cursor 为 null 时表示没有更多数据。
+    """
+    after = None
+    if cursor:
+        try:
+            after = database.decode_page_cursor(cursor)
+        except ValueError:
+            raise http_error(400, "无效的分页游标", code="invalid_cursor") from None
+
+    files, next_after = await asyncio.to_thread(
+        database.get_files_page,
+        after=after,
+        limit=limit,
+        search=(q or "").strip() or None,
+        date_from=date_from or None,
+        date_to=date_to or None,
+        size_min=size_min,
+        size_max=size_max,
+        categories=_split_csv(types),
+        sources=_split_csv(sources),
+        tags=_split_csv(tags),
+    )
+    return {"files": files, "next_cursor": database.encode_page_cursor(next_after)}
+
+
+@router.get("/api/files/facets")
+async def get_files_facets():
+    """返回筛选面板可选的来源频道与标签。"""
+    return await asyncio.to_thread(database.get_file_facets)
+
+
+@router.get("/api/files/changes")
+async def get_files_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=5000),
+):
+    """
+    增量同步：返回版本号 since 之后的新增、删除与标签变更。
+
+    客户端以 GET /api/files 的 X-Files-Version 响应头（或上次返回的 version）作为 since；
+    返回 reset=true 时需重新拉取完整列表。
+    """
+    return database.get_file_changes(since, limit)
+
+
 @router.delete("/api/files/{file_id}")
 async def delete_file(
     file_id: str,
@@ -279,7 +496,7 @@ async def delete_file(
     try:
         telegram_service = get_telegram_service_for_channel(channel_name)
     except Exception:
-        raise http_error(503, "未配置 BOT_TOKEN/CHANNEL_NAME，删除不可用", code="cfg_missing")
+        raise http_error(503, "未配置 BOT_TOKEN/CHANNEL_NAME，删除不可用", code="cfg_missing") from None
 
     logger.info("请求删除文件: %s (channel=%s)", file_id, channel_name)
     delete_result = await telegram_service.delete_file_with_chunks(file_id)
@@ -362,6 +579,91 @@ async def batch_delete_files(
     return {"status": "completed", "deleted": successful_deletions, "failed": failed_deletions}
 
 
+class DownloadStreamingResponse(StreamingResponse):
+    """
+    下载用的流式响应：不论 ASGI 服务器的 spec_version，始终同时监听 http.disconnect。
+
+    客户端断开时立即取消正在等待上游数据的读取，并显式关闭响应体生成器，
+    上游的 httpx 流随之关闭、连接归还连接池，而不是等到下一次 send 失败或生成器被垃圾回收。
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            async with anyio.create_task_group() as task_group:
+
+                async def stream() -> None:
+                    try:
+                        await self.stream_response(send)
+                    except OSError:
+                        # ASGI 2.4 的服务器在客户端断开后 send 会抛出 OSError
+                        pass
+                    task_group.cancel_scope.cancel()
+
+                task_group.start_soon(stream)
+                await self.listen_for_disconnect(receive)
+                task_group.cancel_scope.cancel()
+        finally:
+            await self.body_iterator.aclose()
+
+        if self.background is not None:
+            await self.background()
+
+
+async def measure_download(stream, kind: str, started: float):
+    """
+    记录下载的首字节耗时、字节数与完整下载的平均吞吐量。
+    每个数据块只做一次长度累加，统计在首块与结束时各写入一次。
+    """
+    sent = 0
+    first = True
+    completed = False
+    try:
+        async for chunk in stream:
+            if first:
+                ttfb = time.perf_counter() - started
+                download_ttfb_seconds.labels(kind).observe(ttfb)
+                # 响应头此时已发送，首字节耗时只出现在追踪日志中
+                add_span("first_byte", started, ttfb)
+                first = False
+            sent += len(chunk)
+            yield chunk
+        completed = True
+    finally:
+        # 提前结束（客户端断开）时关闭上游生成器，释放其中的 httpx 流
+        await stream.aclose()
+        if not completed:
+            download_aborted.labels(kind).inc()
+        download_bytes.labels(kind).inc(sent)
+        elapsed = time.perf_counter() - started
+        if completed and sent and elapsed > 0:
+            download_throughput_bytes.labels(kind).observe(sent / elapsed)
+
+
+async def serve_local_file(path: str, headers: dict) -> FileResponse:
+    """
+    直接提供本地模式下 Bot API 服务器存放在磁盘上的文件（需与本服务共享数据目录）。
+    """
+    try:
+        stat_result = await asyncio.to_thread(os.stat, path)
+    except OSError as e:
+        logger.error("本地文件不可访问: %s (%s)", path, e)
+        raise http_error(502, "无法读取本地 Bot API 服务器的文件。", code="local_file_unavailable") from e
+
+    # Content-Type / Accept-Ranges / Content-Length 由 FileResponse 按文件与 Range 设置
+    media_type = headers.get("Content-Type")
+    headers = {k: v for k, v in headers.items() if k not in ("Content-Type", "Accept-Ranges")}
+    return FileResponse(path, headers=headers, media_type=media_type, stat_result=stat_result)
+
+
+async def iter_local_file(path: str):
+    with open(path, "rb") as f:
+        while True:
+            data = await asyncio.to_thread(f.read, LOCAL_READ_SIZE)
+            if not data:
+                break
+            yield data
+
+
 async def stream_chunks(chunk_composite_ids, telegram_service: TelegramService, client: httpx.AsyncClient):
     for chunk_id in chunk_composite_ids:
         try:
@@ -373,6 +675,15 @@ async def stream_chunks(chunk_composite_ids, telegram_service: TelegramService,
         if not chunk_url:
             continue
 
+        if is_local_file_path(chunk_url):
+            try:
+                async for chunk_data in iter_local_file(chunk_url):
+                    yield chunk_data
+            except OSError as e:
+                logger.error("读取本地分块 %s 失败: %s", chunk_url, e)
+                break
+            continue
+
         try:
             async with client.stream("GET", chunk_url) as chunk_resp:
                 if chunk_resp.status_code != 200:
@@ -5,6 +5,8 @@ from .settings import router as settings_router
 from .sse import router as sse_router
 from .upload import router as upload_router
 from .auth import router as auth_router
+from .admin import router as admin_router
+from .webhook import router as webhook_router
 
 router = APIRouter()
 
@@ -13,3 +15,5 @@ router.include_router(files_router)
 router.include_router(sse_router)
 router.include_router(settings_router)
 router.include_router(auth_router)
+router.include_router(admin_router)
+router.include_router(webhook_router)
@@ -1,19 +1,18 @@
 from __future__ import annotations
 
 import logging
-import hashlib
 from fastapi import APIRouter, Request
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
 from .common import http_error
 from .. import database
-from ..core.config import get_app_settings
+from ..core.config import get_active_password_token, get_app_settings
 from ..core.channels import split_channel_config, validate_channel_config
-from ..core.http_client import apply_runtime_settings
+from ..core.http_client import apply_runtime_settings, notify_settings_changed
+from ..core.transport import bot_api_options, telegram_request
 
 import telegram
-from telegram.request import HTTPXRequest
 
 
 router = APIRouter()
@@ -68,6 +67,7 @@ async def get_app_config(request: Request):
         "bot": {
             "ready": bot_ready,
             "running": bool(getattr(request.app.state, "bot_app", None)),
+            "leader": bool(getattr(request.app.state, "bot_leader", False)),
             "error": getattr(request.app.state, "bot_error", None),
         },
     }
@@ -95,6 +95,7 @@ async def save_config_only(payload: AppConfigRequest, request: Request):
     # Partial validation is implicit in _validate_config (it skips empty values)
     _validate_config(merged)
     database.save_app_settings_to_db(merged)
+    await notify_settings_changed(request.app, apply=False)
     logger.info("配置已保存（未应用）")
     return {"status": "ok", "message": "已保存（未应用）"}
 
@@ -127,7 +128,7 @@ async def save_and_apply(payload: AppConfigRequest, request: Request):
     # 如有更新 PASS_WORD，這裡同步更新登入 Cookie（與 /api/auth/login 保持一致的哈希策略）
     pwd = (merged.get("PASS_WORD") or "").strip()
     if pwd:
-        token = hashlib.sha256(pwd.encode("utf-8")).hexdigest()
+        token = get_active_password_token()
         resp.set_cookie(
             key="tgstate_session",
             value=token,
@@ -185,8 +186,11 @@ async def verify_bot(payload: VerifyRequest):
         return {"status": "ok", "available": False, "message": "未提供 BOT_TOKEN"}
 
     # _validate_config({"BOT_TOKEN": token})  # 暂时跳过严格格式验证，让 Telegram API 决定
-    req = HTTPXRequest(connect_timeout=10.0, read_timeout=10.0, write_timeout=10.0)
-    bot = telegram.Bot(token=token, request=req)
+    bot = telegram.Bot(
+        token=token,
+        request=telegram_request("verify", media_profile="verify"),
+        **bot_api_options(),
+    )
     try:
         me = await bot.get_me()
         return {"status": "ok", "ok": True, "available": True, "result": {"username": getattr(me, "username", None)}}
@@ -215,8 +219,11 @@ async def verify_channel(payload: VerifyRequest):
     channel = channels[0]
 
     _validate_config({"BOT_TOKEN": token, "CHANNEL_NAME": channel})
-    req = HTTPXRequest(connect_timeout=10.0, read_timeout=10.0, write_timeout=10.0)
-    bot = telegram.Bot(token=token, request=req)
+    bot = telegram.Bot(
+        token=token,
+        request=telegram_request("verify", media_profile="verify"),
+        **bot_api_options(),
+    )
     try:
         msg = await bot.send_message(chat_id=channel, text="tgState channel check")
         try:
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
-import asyncio
+import json
+from typing import Optional
 
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Query, Request
 from sse_starlette.sse import EventSourceResponse
 
 from ..events import file_update_queue
@@ -11,26 +12,59 @@ from ..events import file_update_queue
 router = APIRouter()
 
 
+def _parse_event_id(raw: str | None) -> int | None:
+    try:
+        return int((raw or "").strip())
+    except ValueError:
+        return None
+
+
 @router.get("/api/file-updates")
-async def file_updates(request: Request):
+async def file_updates(
+    request: Request,
+    last_event_id: Optional[str] = Query(None),
+):
+    """
+    文件变更事件流。
+
+    每个事件带有 id；重连时通过 Last-Event-ID 请求头（或 last_event_id 查询参数，
+    供手动重建 EventSource 的前端使用）补发断线期间的事件。
+    无法补发时发送 resync 事件，客户端应重新拉取完整列表。
+    """
+    resume_from = _parse_event_id(request.headers.get("last-event-id") or last_event_id)
+
     async def event_generator():
-        subscriber_queue = await file_update_queue.subscribe()
+        cursor = await file_update_queue.subscribe()
+        resync = False
         try:
+            if resume_from is not None:
+                cursor = resume_from
+                resync = await file_update_queue.is_ahead(cursor)
             while True:
                 if await request.is_disconnected():
                     break
 
-                try:
-                    update_json = await asyncio.wait_for(subscriber_queue.get(), timeout=15)
-                    yield {"data": update_json}
-                except asyncio.TimeoutError:
-                    yield {"comment": "keepalive"}
-                except asyncio.CancelledError:
-                    break
-                except Exception:
+                if not resync:
+                    events, resync = file_update_queue.read_since(cursor)
+                if resync:
+                    resync = False
+                    cursor = file_update_queue.last_id
+                    yield {
+                        "event": "resync",
+                        "id": str(cursor),
+                        "data": json.dumps({"action": "resync"}),
+                    }
+                    continue
+
+                if events:
+                    for event_id, data in events:
+                        cursor = event_id
+                        yield {"id": str(event_id), "data": data}
+                    continue
+
+                if not await file_update_queue.wait(cursor, timeout=15):
                     yield {"comment": "keepalive"}
         finally:
-            await file_update_queue.unsubscribe(subscriber_queue)
+            await file_update_queue.unsubscribe()
 
     return EventSourceResponse(event_generator())
-
@@ -1,17 +1,25 @@
 from __future__ import annotations
 
+import asyncio
 import logging
-import os
 import shutil
-import tempfile
+import time
 from typing import Optional
 
 from fastapi import APIRouter, Depends, File, Form, Header, Request, UploadFile
 
 from ..core.config import Settings, get_app_settings, get_settings
 from ..core.channels import get_primary_channel, split_channel_config
-from ..services.telegram_service import get_telegram_service, get_telegram_service_for_channel
-from .common import ensure_upload_auth, http_error
+from ..core.metrics import upload_duration_seconds, upload_size_label
+from ..core.upload_staging import create_staged_file, remove_staged_file
+from ..services.telegram_service import (
+    UPLOAD_CANCELLED_BY_CLIENT,
+    get_telegram_service,
+    get_telegram_service_for_channel,
+)
+from starlette.requests import ClientDisconnect
+
+from .common import ensure_upload_auth, http_error, run_until_disconnected
 
 
 router = APIRouter()
@@ -64,11 +72,13 @@ async def upload_file(
         target_channel = get_primary_channel(channel_cfg) or channels[0]
 
     temp_file_path: Optional[str] = None
+    keep_staged = False
     try:
-        # 将上传内容落地到临时文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f"_{file.filename}") as temp_file:
+        # 将上传内容落地到持久的暂存目录（在线程中复制，避免大文件阻塞事件循环），上传日志据此续传
+        with create_staged_file(file.filename) as temp_file:
             temp_file_path = temp_file.name
-            shutil.copyfileobj(file.file, temp_file)
+            await asyncio.to_thread(shutil.copyfileobj, file.file, temp_file)
+            upload_size = temp_file.tell()
 
         # 基于目标频道创建 TelegramService
         try:
@@ -77,16 +87,38 @@ async def upload_file(
             # 理论上不应触发，仅作兜底，回退到默认频道
             telegram_service = get_telegram_service()
 
-        short_id = await telegram_service.upload_file(temp_file_path, file.filename)
+        started = time.perf_counter()
+        short_id = None
+        result = "error"
+        try:
+            # 客户端中途断开时立即取消，不再把没人等待的文件继续推送到 Telegram
+            short_id = await run_until_disconnected(
+                request,
+                telegram_service.upload_file(temp_file_path, file.filename),
+                cancel_msg=UPLOAD_CANCELLED_BY_CLIENT,
+            )
+            result = "ok" if short_id else "error"
+        except ClientDisconnect:
+            result = "cancelled"
+            raise
+        finally:
+            upload_duration_seconds.labels(upload_size_label(upload_size), result).observe(
+                time.perf_counter() - started
+            )
+    except asyncio.CancelledError:
+        # 服务关闭等原因中断：保留暂存文件与上传日志，由重启后的进程续传
+        keep_staged = True
+        raise
+    except ClientDisconnect:
+        logger.info("客户端已断开，已取消上传: %s", file.filename)
+        # 499：客户端已关闭连接，响应不会被接收，仅用于访问日志
+        raise http_error(499, "客户端已断开连接。", code="client_disconnected") from None
     except Exception as e:
         logger.error("上传失败: %s: %s", file.filename, e)
         raise http_error(500, "文件上传失败。", code="upload_failed", details=str(e))
     finally:
-        if temp_file_path and os.path.exists(temp_file_path):
-            try:
-                os.unlink(temp_file_path)
-            except OSError:
-                pass
+        if temp_file_path and not keep_staged:
+            await asyncio.to_thread(remove_staged_file, temp_file_path)
 
     if not short_id:
         logger.error("上传失败（未返回 short_id）: %s", file.filename)
@@ -0,0 +1,45 @@
+import hmac
+import logging
+
+from fastapi import APIRouter, Request
+from telegram import Update
+
+from ..bot_handler import WEBHOOK_PATH, get_webhook_secret, is_webhook_mode
+from .common import http_error
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = "x-telegram-bot-api-secret-token"
+
+
+@router.post(WEBHOOK_PATH, include_in_schema=False)
+async def telegram_webhook(request: Request):
+    """
+    接收 Telegram 推送的更新（TELEGRAM_UPDATE_MODE=webhook）。
+
+    校验 secret_token 后放入机器人的更新队列即返回，由已注册的处理器
+    （handle_new_file / handle_deleted_message 等）异步处理；机器人未就绪时返回 503，Telegram 会稍后重试。
+    """
+    if not is_webhook_mode():
+        raise http_error(404, "未启用 Webhook 模式", code="webhook_disabled")
+
+    token = request.headers.get(SECRET_TOKEN_HEADER, "")
+    if not hmac.compare_digest(token.encode("utf-8"), get_webhook_secret().encode("utf-8")):
+        logger.warning("拒绝 secret_token 无效的 Webhook 请求")
+        raise http_error(403, "无效的 secret_token", code="invalid_webhook_secret")
+
+    bot_app = getattr(request.app.state, "bot_app", None)
+    if bot_app is None:
+        raise http_error(503, "机器人未就绪", code="bot_not_ready")
+
+    try:
+        data = await request.json()
+    except ValueError:
+        raise http_error(400, "无效的更新内容", code="invalid_update") from None
+
+    update = Update.de_json(data, bot_app.bot)
+    if update is None:
+        raise http_error(400, "无效的更新内容", code="invalid_update")
+    await bot_app.update_queue.put(update)
+    return {"status": "ok"}
@@ -1,6 +1,9 @@
+import hashlib
+import hmac
 import logging
 import json
 from datetime import timezone
+from functools import lru_cache
 from urllib.parse import quote
 
 from telegram import Update
@@ -9,10 +12,41 @@ from telegram.ext import Application, MessageHandler, filters, ContextTypes
 from .services.telegram_service import get_telegram_service
 from . import database
 from .events import file_update_queue, build_file_event
+from .ingest import metadata_writer
 from .core.channels import split_channel_config
+from .core.config import get_settings
+from .core.signing import get_signing_key
+from .core.transport import bot_api_options, telegram_request
 
 logger = logging.getLogger(__name__)
 
+WEBHOOK_PATH = "/api/telegram/webhook"
+# 处理器用到的更新类型；Webhook 只订阅这些，减少无用推送
+WEBHOOK_ALLOWED_UPDATES = ["message", "channel_post", "edited_message", "edited_channel_post"]
+
+
+def is_webhook_mode() -> bool:
+    return get_settings().TELEGRAM_UPDATE_MODE.strip().lower() == "webhook"
+
+
+def get_webhook_url(settings: dict) -> str:
+    configured = (get_settings().TELEGRAM_WEBHOOK_URL or "").strip()
+    if configured:
+        return configured
+    return (settings.get("BASE_URL") or "").rstrip("/") + WEBHOOK_PATH
+
+
+@lru_cache()
+def get_webhook_secret() -> str:
+    """
+    Webhook 的 secret_token：优先使用 TELEGRAM_WEBHOOK_SECRET，
+    否则由下载链接签名密钥派生（该密钥持久化在 DATA_DIR，多个 worker 与重启之间一致）。
+    """
+    configured = (get_settings().TELEGRAM_WEBHOOK_SECRET or "").strip()
+    if configured:
+        return configured
+    return hmac.new(get_signing_key(), b"telegram-webhook", hashlib.sha256).hexdigest()
+
 def _get_bot_settings(context: ContextTypes.DEFAULT_TYPE) -> dict:
     try:
         return dict(context.application.bot_data.get("settings") or {})
@@ -90,13 +124,17 @@ async def handle_new_file(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             # 使用复合ID "message_id:file_id"
             composite_id = f"{message.message_id}:{file_obj.file_id}"
             
-            short_id = database.add_file_metadata(
+            # 经写缓冲队列批量入库；返回时所在批次已提交
+            short_id = await metadata_writer.submit(
                 filename=file_name,
                 file_id=composite_id,
                 filesize=file_obj.file_size,
                 channel_name=channel_tag,
             )
-            
+            if not short_id:
+                logger.error("文件元数据入库失败: %s", composite_id)
+                return
+
             upload_date = message.date.astimezone(timezone.utc).isoformat()
             file_event = build_file_event(
                 action="add",
@@ -173,7 +211,20 @@ def create_bot_app(settings: dict) -> Application:
         logger.error(".env 文件中未设置 BOT_TOKEN，机器人无法创建")
         raise ValueError("BOT_TOKEN not configured.")
 
-    application = Application.builder().token(settings["BOT_TOKEN"]).build()
+    # 允许并发处理更新：批量转发时多个 handle_new_file 可同时等待同一批次提交
+    # Bot API 请求与长轮询都走共享传输层，与文件下载复用同一连接池
+    api_options = bot_api_options()
+    builder = (
+        Application.builder()
+        .token(settings["BOT_TOKEN"])
+        .request(telegram_request("api", media_profile="upload"))
+        .get_updates_request(telegram_request("polling"))
+        .local_mode(api_options["local_mode"])
+        .concurrent_updates(True)
+    )
+    if "base_url" in api_options:
+        builder = builder.base_url(api_options["base_url"]).base_file_url(api_options["base_file_url"])
+    application = builder.build()
     application.bot_data["settings"] = settings
 
     # --- 添加处理器 ---
@@ -0,0 +1,211 @@
+"""
+上传准入控制。
+
+- upload_admission：在读取请求体之前对 POST /api/upload 做准入，限制同时处理的上传数与暂存的磁盘字节数；
+  超出限制的请求按到达顺序排队，队列已满或等待超时返回 503 与 Retry-After。
+- telegram_upload_budget：限制同时发往 Telegram 的分块字节数，避免上传占满共享连接池与带宽、拖慢下载。
+
+两者都是 FairLimiter：严格先进先出，队首放不下时后面的请求也不会插队，大文件不会被小文件饿死。
+所有状态只在事件循环线程中修改，不需要加锁。
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from ..api.common import error_payload
+from .config import get_settings
+from .metrics import Gauge, registry, upload_queue_wait_seconds, upload_rejected
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_PATH = "/api/upload"
+# Retry-After 的取值范围（秒）
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 300
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class FairLimiter:
+    """
+    同时限制持有者数量与字节数的先进先出限流器（max_count / max_bytes 为 0 表示不限制）。
+
+    单个请求的字节数超过 max_bytes 时，等到没有其他持有者时单独放行，而不是永远等待。
+    """
+
+    def __init__(self, *, max_count: int = 0, max_bytes: int = 0, queue_limit: int = 0, queue_timeout: float | None = None):
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.queue_limit = queue_limit
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.bytes = 0
+        self._waiters: deque[tuple[int, asyncio.Future]] = deque()
+        # 持有时长的指数移动平均，用于估算 Retry-After
+        self._hold_ewma = 5.0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _fits(self, amount: int) -> bool:
+        if self.max_count and self.active >= self.max_count:
+            return False
+        if self.max_bytes and self.active and self.bytes + amount > self.max_bytes:
+            return False
+        return True
+
+    def _grant(self, amount: int) -> None:
+        self.active += 1
+        self.bytes += amount
+
+    def _wake(self) -> None:
+        while self._waiters:
+            amount, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if not self._fits(amount):
+                return
+            self._waiters.popleft()
+            self._grant(amount)
+            future.set_result(None)
+
+    def retry_after(self) -> int:
+        """按平均持有时长估算排在当前队尾之后还要等多久。"""
+        slots = self.max_count or 1
+        estimate = self._hold_ewma * (len(self._waiters) + 1) / slots
+        return max(MIN_RETRY_AFTER, min(MAX_RETRY_AFTER, math.ceil(estimate)))
+
+    async def acquire(self, amount: int) -> None:
+        if not self._waiters and self._fits(amount):
+            self._grant(amount)
+            return
+        if self.queue_limit and len(self._waiters) >= self.queue_limit:
+            raise AdmissionRejected("queue_full", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((amount, future))
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await future
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # 已被放行但随即超时 / 被取消：归还额度
+                self.release(amount, 0.0)
+            else:
+                future.cancel()
+                # 队首离开后，后面的请求可能已经可以放行
+                self._wake()
+            if isinstance(e, TimeoutError):
+                raise AdmissionRejected("queue_timeout", self.retry_after()) from None
+            raise
+
+    def release(self, amount: int, held: float) -> None:
+        self.active -= 1
+        self.bytes -= amount
+        if held > 0:
+            self._hold_ewma += 0.2 * (held - self._hold_ewma)
+        self._wake()
+
+    @asynccontextmanager
+    async def hold(self, amount: int):
+        await self.acquire(amount)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(amount, time.monotonic() - started)
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "bytes": self.bytes,
+            "queue_depth": len(self._waiters),
+            "max_count": self.max_count,
+            "max_bytes": self.max_bytes,
+            "queue_limit": self.queue_limit,
+        }
+
+
+def _mb(value: float) -> int:
+    return int(value * 1024 * 1024) if value > 0 else 0
+
+
+_settings = get_settings()
+upload_admission = FairLimiter(
+    max_count=max(0, _settings.UPLOAD_MAX_CONCURRENT),
+    max_bytes=_mb(_settings.UPLOAD_MAX_STAGED_MB),
+    queue_limit=max(0, _settings.UPLOAD_QUEUE_LIMIT),
+    queue_timeout=_settings.UPLOAD_QUEUE_TIMEOUT if _settings.UPLOAD_QUEUE_TIMEOUT > 0 else None,
+)
+telegram_upload_budget = FairLimiter(max_bytes=_mb(_settings.UPLOAD_MAX_INFLIGHT_MB))
+
+registry.register(Gauge("tgstate_upload_active", "正在处理的上传请求数", lambda: upload_admission.active))
+registry.register(Gauge("tgstate_upload_queue_depth", "在准入队列中等待的上传请求数", lambda: upload_admission.queue_depth))
+registry.register(Gauge("tgstate_upload_staged_bytes", "已准入上传按 Content-Length 预留的暂存字节数", lambda: upload_admission.bytes))
+registry.register(Gauge("tgstate_upload_inflight_bytes", "正在发往 Telegram 的分块字节数", lambda: telegram_upload_budget.bytes))
+registry.register(Gauge(
+    "tgstate_upload_inflight_queue_depth",
+    "等待发往 Telegram 的分块数",
+    lambda: telegram_upload_budget.queue_depth,
+))
+
+
+def upload_stats() -> dict:
+    return {"admission": upload_admission.stats(), "telegram": telegram_upload_budget.stats()}
+
+
+class UploadAdmissionMiddleware:
+    """
+    纯 ASGI 中间件：POST /api/upload 在读取请求体之前先经过 upload_admission。
+
+    排队期间请求体留在客户端与内核缓冲区中，不占用磁盘；处理完成（包括客户端断开）后释放额度。
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] != UPLOAD_PATH:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            amount = max(0, int(Headers(scope=scope).get("content-length") or 0))
+        except ValueError:
+            amount = 0
+
+        queued = time.perf_counter()
+        try:
+            await upload_admission.acquire(amount)
+        except AdmissionRejected as e:
+            upload_rejected.labels(e.reason).inc()
+            logger.warning("上传准入被拒绝（%s），当前排队 %d 个", e.reason, upload_admission.queue_depth)
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": error_payload("上传繁忙，请稍后重试", code="upload_busy", details={"reason": e.reason})},
+                headers={"Retry-After": str(e.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        started = time.monotonic()
+        upload_queue_wait_seconds.observe(time.perf_counter() - queued)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            upload_admission.release(amount, time.monotonic() - started)
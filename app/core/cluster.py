@@ -0,0 +1,135 @@
+"""
+多进程（uvicorn --workers N）部署的协调工具。
+
+- BotLeaderLock：DATA_DIR 下的文件锁，保证同一时刻只有一个 worker 运行 Telegram 机器人；
+  持有锁的进程退出后锁由操作系统自动释放，其他 worker 重试时即可接管。
+- SQLiteEventRelay：基于 SQLite event_log 表的跨进程事件转发，
+  每个 worker 轮询新事件并分发给本进程的订阅者。
+"""
+
+import asyncio
+import logging
+import os
+from collections.abc import Awaitable, Callable
+
+from .. import database
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows 下没有 fcntl，只支持单进程
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class BotLeaderLock:
+    """基于 flock 的非阻塞进程间互斥锁。"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: int | None = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        if fcntl is None:
+            # 无法加锁的平台只支持单进程部署，直接视为 leader
+            self._fd = -1
+            return True
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode("ascii"))
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        if self._fd >= 0:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            finally:
+                os.close(self._fd)
+        self._fd = None
+
+
+EventHandler = Callable[[int, str], Awaitable[None]]
+
+
+class SQLiteEventRelay:
+    """
+    通过 SQLite 事件日志在多个 worker 之间广播事件。
+
+    append() 写入日志；每个 worker 的轮询任务按 ID 顺序读取新事件，
+    并交给对应 kind 的处理函数（参数为事件 ID 与 payload）。
+    发布方自身也通过轮询收到事件，从而保证所有 worker 看到相同的顺序与 ID。
+    """
+
+    def __init__(self, poll_interval: float = 0.25):
+        self._poll_interval = poll_interval
+        self._handlers: dict[str, EventHandler] = {}
+        self._last_id = 0
+        self._task: asyncio.Task | None = None
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    async def latest_id(self) -> int:
+        """事件日志中最新的事件 ID（直接读取数据库，不等待下一次轮询）。"""
+        return max(self._last_id, await asyncio.to_thread(database.get_last_event_id))
+
+    def register(self, kind: str, handler: EventHandler) -> None:
+        self._handlers[kind] = handler
+
+    async def append(self, kind: str, payload: str) -> int:
+        return await asyncio.to_thread(database.append_event, kind, payload)
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        # 只转发启动之后的新事件
+        self._last_id = await asyncio.to_thread(database.get_last_event_id)
+        self._task = asyncio.create_task(self._poll())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _poll(self) -> None:
+        while True:
+            try:
+                rows = await asyncio.to_thread(database.get_events_after, self._last_id)
+            except Exception as e:
+                logger.error("读取跨进程事件失败: %s", e)
+                rows = []
+
+            for event_id, kind, payload in rows:
+                self._last_id = event_id
+                handler = self._handlers.get(kind)
+                if handler is None:
+                    continue
+                try:
+                    await handler(event_id, payload)
+                except Exception as e:
+                    logger.error("处理跨进程事件 %s (%s) 失败: %s", event_id, kind, e)
+
+            if not rows:
+                await asyncio.sleep(self._poll_interval)
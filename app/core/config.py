@@ -1,4 +1,6 @@
+import hashlib
 import os
+import threading
 from functools import lru_cache
 from pydantic_settings import BaseSettings
 from typing import Optional
@@ -15,6 +17,85 @@ class Settings(BaseSettings):
     MODE: str = "p" # p 代表公开模式, m 代表私有模式
     FILE_ROUTE: str = "/d/"
 
+    # 机器人入库写缓冲：按条数或时间间隔（秒）合并为一次事务提交
+    INGEST_BATCH_SIZE: int = 200
+    INGEST_FLUSH_INTERVAL: float = 0.2
+
+    # 多进程部署：uvicorn 同样读取 WEB_CONCURRENCY 作为 --workers 的默认值，
+    # 大于 1 时启用跨进程事件转发；机器人仅在持有 leader 锁的 worker 中运行
+    WEB_CONCURRENCY: int = 1
+    BOT_LEADER_RETRY_INTERVAL: float = 5.0
+    EVENT_RELAY_POLL_INTERVAL: float = 0.25
+    # 多进程部署时各 worker 把指标快照写入数据库的间隔（秒），/metrics 汇总所有 worker
+    METRICS_SNAPSHOT_INTERVAL: float = 5.0
+
+    # SSE 事件回放缓冲区大小：断线重连时可补发的最近事件数
+    SSE_REPLAY_SIZE: int = 1000
+
+    # 文件变更日志中 delete 记录的保留天数（超过后需全量同步）
+    FILE_CHANGES_RETENTION_DAYS: int = 30
+
+    # 签名下载链接（/s/...）的 HMAC 密钥；留空时自动生成并保存在 DATA_DIR 中
+    URL_SIGNING_SECRET: Optional[str] = None
+    # 签名下载链接的最长有效期（秒）
+    SIGNED_URL_MAX_TTL: int = 30 * 24 * 3600
+
+    # 自建 Bot API 服务器（telegram-bot-api）的根地址，例如 http://telegram-bot-api:8081；留空使用官方服务器
+    TELEGRAM_API_BASE_URL: Optional[str] = None
+    # 自建服务器以 --local 模式运行：单文件上限提升到 2000MB，getFile 返回服务器上的本地路径，
+    # 下载时直接从共享的数据目录读取文件
+    TELEGRAM_LOCAL_MODE: bool = False
+    # 分块大小（MB）；留空时官方服务器为 19.5MB，本地模式为 1950MB，且不会超过对应上限
+    TELEGRAM_CHUNK_SIZE_MB: Optional[float] = None
+
+    # /metrics 的 Bearer Token，供 Prometheus 抓取；网页登录后的会话同样可以访问
+    METRICS_TOKEN: Optional[str] = None
+
+    # 请求追踪：按比例采样（0 关闭），被追踪的请求返回 Server-Timing 头并输出一行追踪日志
+    TRACE_SAMPLE_RATE: float = 0.0
+    # 允许客户端通过 X-Trace: 1 请求头主动开启追踪（会向客户端暴露内部耗时）
+    TRACE_ALLOW_REQUEST_HEADER: bool = False
+
+    # 按需性能分析（/api/admin/profile*、X-Profile: 1 请求头），仅管理员可用；关闭时没有任何开销
+    PROFILING_ENABLED: bool = False
+
+    # 机器人接收更新的方式：polling（长轮询，仅 leader 进程）或 webhook（Telegram 推送到
+    # /api/telegram/webhook，所有 worker 都可处理，由 leader 负责调用 setWebhook）
+    TELEGRAM_UPDATE_MODE: str = "polling"
+    # Webhook 的完整地址；留空时为 BASE_URL + /api/telegram/webhook（官方服务器要求 HTTPS）
+    TELEGRAM_WEBHOOK_URL: Optional[str] = None
+    # Webhook 的 secret_token（1~256 位字母、数字、_ 或 -）；留空时由签名密钥派生，各 worker 一致
+    TELEGRAM_WEBHOOK_SECRET: Optional[str] = None
+
+    # 上传准入控制（每个 worker 独立计算，0 表示不限制）：同时处理的上传数、
+    # 暂存在磁盘上的上传字节数（按请求的 Content-Length 计算），以及同时发往 Telegram 的分块字节数
+    UPLOAD_MAX_CONCURRENT: int = 4
+    UPLOAD_MAX_STAGED_MB: float = 4096
+    UPLOAD_MAX_INFLIGHT_MB: float = 100
+    # 超出上述限制的上传按到达顺序排队；队列已满或等待超过 UPLOAD_QUEUE_TIMEOUT 秒时返回 503 与 Retry-After
+    UPLOAD_QUEUE_LIMIT: int = 32
+    UPLOAD_QUEUE_TIMEOUT: float = 60.0
+
+    # 单次 Bot API 调用（getFile、deleteMessage 等）的总时限（秒），超时视为 TimedOut
+    TELEGRAM_API_DEADLINE: float = 60.0
+    # 上传请求的总时限按大小计算：30 秒 + 大小 / 该最低吞吐量（KB/s），取代固定的 300 秒读写超时
+    UPLOAD_MIN_THROUGHPUT_KBPS: float = 256
+
+    # 孤儿消息回收：删除消息台账中没有被任何文件引用的消息（上传失败、删除部分失败留下的分块等）
+    # 每轮回收的间隔（秒），0 关闭后台回收（仍可通过 /api/admin/orphans/scan 手动触发）
+    ORPHAN_GC_INTERVAL: float = 3600
+    # 消息记入台账超过该秒数后才会被回收
+    ORPHAN_GC_MIN_AGE: int = 3600
+    # 每分钟最多调用 deleteMessages 的次数（每次最多 100 条消息），0 不限制
+    ORPHAN_GC_MAX_CALLS_PER_MINUTE: float = 20
+    # 只统计与报告孤儿消息，不删除
+    ORPHAN_GC_DRY_RUN: bool = False
+
+    # 事件循环调度延迟的测量间隔（秒），0 关闭
+    LOOP_LAG_INTERVAL: float = 0.5
+    # 事件循环被阻塞超过该毫秒数时记录阻塞代码的调用栈，0 关闭（建议 100）
+    LOOP_BLOCK_THRESHOLD_MS: float = 0
+
 
 @lru_cache()
 def get_settings() -> Settings:
@@ -25,34 +106,30 @@ def get_settings() -> Settings:
     """
     return Settings()
 
-def get_active_password() -> Optional[str]:
+class _SettingsSnapshot:
     """
-    获取当前有效的密码。
-    优先从数据库读取，如果为空则回退到环境变量。
+    某一时刻生效配置的只读快照。
+
+    密码对应的会话 Token（SHA256）在构建快照时一次性算好，
+    鉴权中间件无需在每个请求上重复哈希。
     """
-    try:
-        from .. import database
 
-        db_settings = database.get_app_settings_from_db()
-        password = (db_settings.get("PASS_WORD") or "").strip()
-        if password:
-            return password
-    except Exception:
-        pass
+    __slots__ = ("version", "values", "password", "password_token")
 
-    return get_settings().PASS_WORD
+    def __init__(self, version: int, values: dict, password: Optional[str]):
+        self.version = version
+        self.values = values
+        self.password = password
+        self.password_token = (
+            hashlib.sha256(password.encode("utf-8")).hexdigest() if password else None
+        )
 
-def get_app_settings() -> dict:
-    """
-    获取当前生效的应用设置（数据库优先，环境变量兜底）。
 
-    返回字段:
-    - BOT_TOKEN
-    - CHANNEL_NAME (可以是单个标识，或多个以逗号分隔的频道/群组标识)
-    - PASS_WORD
-    - PICGO_API_KEY
-    - BASE_URL
-    """
+_snapshot: Optional[_SettingsSnapshot] = None
+_snapshot_lock = threading.Lock()
+
+
+def _load_snapshot(version: int) -> _SettingsSnapshot:
     env = get_settings()
     try:
         from .. import database
@@ -61,10 +138,70 @@ def get_app_settings() -> dict:
     except Exception:
         db_settings = {}
 
-    return {
+    values = {
         "BOT_TOKEN": (db_settings.get("BOT_TOKEN") or env.BOT_TOKEN),
         "CHANNEL_NAME": (db_settings.get("CHANNEL_NAME") or env.CHANNEL_NAME),
         "PASS_WORD": (db_settings.get("PASS_WORD") or env.PASS_WORD),
         "PICGO_API_KEY": (db_settings.get("PICGO_API_KEY") or env.PICGO_API_KEY),
         "BASE_URL": (db_settings.get("BASE_URL") or env.BASE_URL),
     }
+    # 数据库中的密码优先（去除首尾空白），为空则回退到环境变量
+    password = (db_settings.get("PASS_WORD") or "").strip() or env.PASS_WORD
+    return _SettingsSnapshot(version, values, password)
+
+
+def _get_snapshot() -> _SettingsSnapshot:
+    snapshot = _snapshot
+    if snapshot is None:
+        snapshot = reload_app_settings()
+    return snapshot
+
+
+def reload_app_settings() -> _SettingsSnapshot:
+    """
+    从数据库重新加载配置快照，并递增版本号。
+
+    仅在配置发生变化时调用（保存 / 重置配置、apply_runtime_settings），
+    其余时间所有读取都直接命中内存快照，不再访问 SQLite。
+    """
+    global _snapshot
+    with _snapshot_lock:
+        version = _snapshot.version + 1 if _snapshot else 1
+        _snapshot = _load_snapshot(version)
+        return _snapshot
+
+
+def get_settings_version() -> int:
+    """当前配置快照的版本号，每次重新加载后递增。"""
+    return _get_snapshot().version
+
+
+def get_active_password() -> Optional[str]:
+    """
+    获取当前有效的密码。
+    优先从数据库读取，如果为空则回退到环境变量。
+    """
+    return _get_snapshot().password
+
+
+def get_active_password_token() -> Optional[str]:
+    """
+    获取当前密码对应的会话 Token（SHA256 十六进制），未设置密码时为 None。
+    """
+    return _get_snapshot().password_token
+
+
+def get_app_settings() -> dict:
+    """
+    获取当前生效的应用设置（数据库优先，环境变量兜底）。
+
+    返回字段:
+    - BOT_TOKEN
+    - CHANNEL_NAME (可以是单个标识，或多个以逗号分隔的频道/群组标识)
+    - PASS_WORD
+    - PICGO_API_KEY
+    - BASE_URL
+
+    结果来自内存快照，返回副本以免调用方修改共享状态。
+    """
+    return dict(_get_snapshot().values)
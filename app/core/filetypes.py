@@ -0,0 +1,76 @@
+"""
+文件类型识别：根据文件名推断 Content-Type、分类与是否可在浏览器内预览。
+
+结果在写入元数据时计算一次并保存在 files 表中，下载与列表筛选直接使用。
+"""
+
+import mimetypes
+from functools import lru_cache
+from typing import NamedTuple
+
+from .metrics import register_lru_cache
+
+# 文件类型分类（与前端 getFileCategory 保持一致）
+FILE_CATEGORY_EXTENSIONS = {
+    "image": ("jpg", "jpeg", "png", "gif", "bmp", "webp", "svg", "ico"),
+    "video": ("mp4", "mkv", "webm", "avi", "mov", "flv"),
+    "audio": ("mp3", "aac", "ogg", "wav", "flac", "m4a"),
+    "document": ("pdf", "txt", "md", "doc", "docx", "xls", "xlsx", "ppt", "pptx"),
+    "archive": ("zip", "rar", "7z", "tar", "gz", "bz2"),
+}
+FILE_CATEGORIES = tuple(FILE_CATEGORY_EXTENSIONS) + ("other",)
+
+_EXTENSION_CATEGORY = {
+    ext: category for category, exts in FILE_CATEGORY_EXTENSIONS.items() for ext in exts
+}
+
+# 可在浏览器内联预览的类型白名单
+PREVIEW_EXTENSIONS = frozenset((
+    # Images
+    "jpg", "jpeg", "png", "gif", "webp", "bmp", "svg", "ico",
+    # Text/Code
+    "txt", "md", "json", "xml", "html", "css", "js", "py", "log",
+    # Media
+    "mp4", "mp3", "webm", "ogg", "wav",
+    # Documents
+    "pdf",
+))
+
+# mimetypes 无法识别时按纯文本处理的扩展名
+_PLAIN_TEXT_EXTENSIONS = frozenset(("txt", "log", "md", "json", "yml", "yaml", "ini", "conf"))
+
+
+class FileType(NamedTuple):
+    mime_type: str
+    category: str
+    previewable: bool
+
+
+def _extension(filename: str) -> str:
+    return filename.lower().rsplit(".", 1)[-1] if "." in filename else ""
+
+
+@lru_cache(maxsize=4096)
+def classify_file(filename: str) -> FileType:
+    """根据文件名推断 Content-Type、分类与是否可预览。"""
+    ext = _extension(filename)
+
+    content_type, _ = mimetypes.guess_type(filename)
+    if not content_type:
+        # 兜底逻辑
+        if ext in _PLAIN_TEXT_EXTENSIONS:
+            content_type = "text/plain; charset=utf-8"
+        else:
+            content_type = "application/octet-stream"
+    elif content_type.startswith("text/") and "charset" not in content_type:
+        # 如果是 text 类型，补充 charset
+        content_type += "; charset=utf-8"
+
+    return FileType(
+        mime_type=content_type,
+        category=_EXTENSION_CATEGORY.get(ext, "other"),
+        previewable=ext in PREVIEW_EXTENSIONS,
+    )
+
+
+register_lru_cache("filetype", classify_file)
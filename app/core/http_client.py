@@ -1,4 +1,6 @@
+import json
 import logging
+import os
 import httpx
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
@@ -6,14 +8,25 @@ import asyncio
 
 # 导入应用所需的其他模块
 from .. import database
-from ..bot_handler import create_bot_app
-from ..core.config import get_app_settings
+from ..bot_handler import (
+    WEBHOOK_ALLOWED_UPDATES,
+    create_bot_app,
+    get_webhook_secret,
+    get_webhook_url,
+    is_webhook_mode,
+)
+from ..events import file_update_queue
+from ..ingest import metadata_writer
+from ..core.cluster import BotLeaderLock, SQLiteEventRelay
+from ..core.config import get_app_settings, get_settings, reload_app_settings
+from ..core import metrics_store
+from ..core.loop_monitor import loop_monitor
+from ..core.transport import telegram_transport
+from ..services.orphan_gc import orphan_collector
+from ..services.telegram_service import resume_interrupted_uploads
 
 logger = logging.getLogger(__name__)
 
-# 这个变量将持有我们全局共享的客户端实例
-http_client: httpx.AsyncClient | None = None
-
 def _is_bot_ready(app_settings: dict) -> bool:
     """
     Bot 就绪的最低条件：
@@ -41,24 +54,51 @@ async def _stop_bot(app: FastAPI) -> None:
         app.state.bot_app = None
         logger.info("机器人已停止")
 
+def _runs_bot(app: FastAPI) -> bool:
+    """
+    长轮询只能由一个进程进行（leader）；Webhook 模式下更新可能推送到任意 worker，
+    因此每个 worker 都运行机器人处理更新，只有 leader 负责设置 Webhook。
+    """
+    return getattr(app.state, "bot_leader", False) or is_webhook_mode()
+
 async def _start_bot(app: FastAPI, app_settings: dict) -> None:
     await _stop_bot(app)
     bot_app = create_bot_app(app_settings)
     app.state.bot_app = bot_app
     await bot_app.initialize()
     await bot_app.start()
-    await bot_app.updater.start_polling(drop_pending_updates=True)
-    logger.info("机器人已在后台启动")
+    if not is_webhook_mode():
+        await bot_app.updater.start_polling(drop_pending_updates=True)
+        logger.info("机器人已在后台启动")
+        return
 
-async def apply_runtime_settings(app: FastAPI, *, start_bot: bool = True) -> None:
+    if getattr(app.state, "bot_leader", False):
+        # 保留重启期间积压的更新：Telegram 会在 Webhook 恢复后继续推送
+        webhook_url = get_webhook_url(app_settings)
+        await bot_app.bot.set_webhook(
+            url=webhook_url,
+            secret_token=get_webhook_secret(),
+            allowed_updates=WEBHOOK_ALLOWED_UPDATES,
+            drop_pending_updates=False,
+        )
+        logger.info("机器人已启动（Webhook 模式）: %s", webhook_url)
+    else:
+        logger.info("机器人已启动（Webhook 模式，由 leader 进程设置 Webhook）")
+
+async def apply_runtime_settings(app: FastAPI, *, start_bot: bool = True, broadcast: bool = True) -> None:
     async with app.state.settings_lock:
+        reload_app_settings()
         current = get_app_settings()
         app.state.app_settings = current
         bot_ready = _is_bot_ready(current)
         app.state.bot_ready = bot_ready
         app.state.bot_error = None
 
-        if not start_bot:
+        if broadcast:
+            await notify_settings_changed(app, apply=True, start_bot=start_bot)
+
+        # 多 worker 部署时只有持有 leader 锁的进程运行长轮询；Webhook 模式下所有进程都处理更新
+        if not start_bot or not _runs_bot(app):
             return
 
         if bot_ready:
@@ -71,62 +111,174 @@ async def apply_runtime_settings(app: FastAPI, *, start_bot: bool = True) -> Non
         else:
             await _stop_bot(app)
 
+async def notify_settings_changed(app: FastAPI, *, apply: bool, start_bot: bool = False) -> None:
+    """
+    通知其他 worker 配置已变更（仅多 worker 模式下生效）。
+    apply=False 表示只刷新配置快照，不重新应用运行时设置。
+    """
+    relay = getattr(app.state, "event_relay", None)
+    if relay is None:
+        return
+    payload = json.dumps({"pid": os.getpid(), "apply": apply, "start_bot": start_bot})
+    try:
+        await relay.append("settings", payload)
+    except Exception as e:
+        logger.error("广播配置变更失败: %s", e)
+
+async def _on_settings_event(app: FastAPI, event_id: int, payload: str) -> None:
+    data = json.loads(payload)
+    if data.get("pid") == os.getpid():
+        return
+    if data.get("apply"):
+        await apply_runtime_settings(app, start_bot=bool(data.get("start_bot")), broadcast=False)
+    else:
+        reload_app_settings()
+
+async def _leader_loop(app: FastAPI) -> None:
+    """
+    未持有 leader 锁的 worker 定期尝试接管（原 leader 退出后锁自动释放）；
+    leader 负责定期清理跨进程事件日志、归档已退出 worker 的指标、压缩文件变更日志。
+    """
+    settings = get_settings()
+    interval = max(0.5, settings.BOT_LEADER_RETRY_INTERVAL)
+    loop = asyncio.get_running_loop()
+    last_prune = last_compact = loop.time()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if not app.state.bot_leader:
+                if app.state.leader_lock.try_acquire():
+                    logger.info("本进程 (pid=%s) 已接管机器人 leader", os.getpid())
+                    app.state.bot_leader = True
+                    await apply_runtime_settings(app, start_bot=True, broadcast=False)
+                continue
+
+            now = loop.time()
+            if app.state.event_relay is not None and now - last_prune >= 60:
+                last_prune = now
+                await asyncio.to_thread(database.prune_event_log)
+                folded = await asyncio.to_thread(metrics_store.fold_exited)
+                if folded:
+                    logger.info("已将 %s 个已退出 worker 的指标并入归档", folded)
+            if now - last_compact >= 3600:
+                last_compact = now
+                removed = await asyncio.to_thread(
+                    database.compact_file_changes, settings.FILE_CHANGES_RETENTION_DAYS
+                )
+                if removed:
+                    logger.info("已压缩文件变更日志: 删除 %s 条记录", removed)
+        except Exception as e:
+            logger.error("leader 维护任务出错: %s", e)
+
+async def _resume_uploads(app: FastAPI) -> None:
+    if not app.state.bot_ready:
+        return
+    try:
+        await resume_interrupted_uploads()
+    except Exception as e:
+        logger.error("续传中断的上传时出错: %s", e)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     应用生命周期管理器。
     在应用启动时：
     1. 初始化数据库。
-    2. 创建并启动 Telegram Bot。
-    3. 创建一个共享的、支持高并发的 httpx.AsyncClient。
+    2. 启动共享的 Telegram 传输层（Bot API 与文件下载共用的 httpx.AsyncClient）。
+    3. 多 worker 模式下启动跨进程事件转发与指标快照写入。
+    4. 竞争机器人 leader 锁，持有锁时创建并启动 Telegram Bot。
+    5. 在后台续传已退出进程留下的未完成上传，并定期回收孤儿消息（仅 leader）。
     在应用关闭时：
-    1. 优雅地关闭 httpx.AsyncClient。
-    2. 优雅地停止 Telegram Bot。
+    1. 优雅地停止 Telegram Bot 并释放 leader 锁。
+    2. 关闭共享的 httpx.AsyncClient。
+    3. 提交写缓冲中剩余的元数据。
     """
     # --- 启动逻辑 ---
     logger.info("应用启动")
-    
+    settings = get_settings()
+    await loop_monitor.start()
+
     # 1. 初始化数据库
     database.init_db()
     logger.info("数据库已初始化")
 
+    # 数据库就绪后加载一次配置快照，此后仅在配置变更时刷新
+    reload_app_settings()
     app.state.settings_lock = asyncio.Lock()
     app.state.app_settings = get_app_settings()
     app.state.bot_ready = _is_bot_ready(app.state.app_settings)
+    app.state.bot_app = None
+
+    # 2. 启动共享的 Telegram 传输层
+    await telegram_transport.start()
 
-    # 2. 创建共享的 httpx.AsyncClient
-    global http_client
-    limits = httpx.Limits(max_connections=200, max_keepalive_connections=50)
-    http_client = httpx.AsyncClient(timeout=300.0, limits=limits)
-    logger.info("共享的 HTTP 客户端已创建")
+    # 3. 多 worker 模式：通过 SQLite 事件日志在进程间转发文件事件与配置变更
+    app.state.event_relay = None
+    app.state.metrics_task = None
+    if settings.WEB_CONCURRENCY > 1:
+        relay = SQLiteEventRelay(poll_interval=settings.EVENT_RELAY_POLL_INTERVAL)
+        relay.register("settings", lambda event_id, payload: _on_settings_event(app, event_id, payload))
+        file_update_queue.attach_relay(relay)
+        await relay.start()
+        # SSE 事件 ID 改用事件日志的全局 ID，各 worker 一致
+        file_update_queue.reset(relay.last_id)
+        app.state.event_relay = relay
+        app.state.metrics_task = asyncio.create_task(metrics_store.run_publisher())
+        logger.info("多进程模式 (WEB_CONCURRENCY=%s)：已启用跨进程事件转发", settings.WEB_CONCURRENCY)
 
-    # 3. 启动 Telegram Bot（仅在 BOT_TOKEN + CHANNEL_NAME 都存在时）
-    if app.state.bot_ready:
+    # 4. 启动 Telegram Bot（BOT_TOKEN + CHANNEL_NAME 都存在时；长轮询模式仅 leader）
+    app.state.leader_lock = BotLeaderLock(os.path.join(database.DATA_DIR, "bot-leader.lock"))
+    app.state.bot_leader = app.state.leader_lock.try_acquire()
+    if not _runs_bot(app):
+        logger.info("其他进程持有机器人 leader 锁，本进程 (pid=%s) 不启动机器人", os.getpid())
+    elif app.state.bot_ready:
         try:
             await _start_bot(app, app.state.app_settings)
         except Exception as e:
             logger.error("启动机器人失败: %s", e)
             app.state.bot_app = None
             app.state.bot_error = str(e)
+    leader_task = asyncio.create_task(_leader_loop(app))
+
+    # 5. 在后台续传已退出进程留下的未完成上传（上传日志与 DATA_DIR/uploads 中的暂存文件）
+    resume_task = asyncio.create_task(_resume_uploads(app))
+    orphan_gc_task = asyncio.create_task(orphan_collector.run_forever(app))
 
     yield # 应用在此处运行
 
     # --- 关闭逻辑 ---
     logger.info("应用关闭")
+    leader_task.cancel()
+    # 未完成的续传保留上传日志，由下一个进程继续
+    resume_task.cancel()
+    # 回收进度已按批写入游标，下次启动后继续
+    orphan_gc_task.cancel()
+    await asyncio.gather(resume_task, orphan_gc_task, return_exceptions=True)
 
-    # 1. 关闭共享的 httpx.AsyncClient
-    if http_client:
-        await http_client.aclose()
-        logger.info("共享的 HTTP 客户端已关闭")
-
-    # 2. 停止 Telegram Bot
+    # 1. 停止 Telegram Bot，并释放 leader 锁以便其他 worker 接管
     await _stop_bot(app)
+    app.state.leader_lock.release()
+    app.state.bot_leader = False
+
+    # 2. 关闭共享的 httpx.AsyncClient（机器人停止后再关闭，避免其请求失败）
+    await telegram_transport.aclose()
+
+    # 3. 提交写缓冲中尚未落盘的文件元数据
+    await metadata_writer.close()
+
+    if app.state.event_relay is not None:
+        await app.state.event_relay.stop()
+        file_update_queue.detach_relay()
+    if app.state.metrics_task is not None:
+        # 取消时写入最后一次快照
+        app.state.metrics_task.cancel()
+        await asyncio.gather(app.state.metrics_task, return_exceptions=True)
+
+    await loop_monitor.stop()
 
 
 def get_http_client() -> httpx.AsyncClient:
     """
     一个 FastAPI 依赖项，用于获取共享的 httpx 客户端实例。
     """
-    if http_client is None:
-        raise RuntimeError("HTTP client is not initialized. Is the app lifespan configured correctly?")
-    return http_client
+    return telegram_transport.client
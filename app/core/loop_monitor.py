@@ -0,0 +1,96 @@
+"""
+事件循环延迟监控与阻塞检测。
+
+- 延迟监控：后台任务每隔 LOOP_LAG_INTERVAL 秒 sleep 一次，实际唤醒时间与预期之差即调度延迟，
+  记录到 tgstate_event_loop_lag_seconds。开销只是一个定时器。
+- 阻塞检测（LOOP_BLOCK_THRESHOLD_MS > 0 时开启）：监控线程周期性地通过 call_soon_threadsafe 向事件循环投递
+  一个回调，超过阈值仍未执行说明循环被同步代码占住，此时读取事件循环线程的当前调用栈并记录日志
+  （即阻塞者本身），并统计阻塞次数与时长。
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from .config import get_settings
+from .metrics import event_loop_blocked, event_loop_blocked_seconds, event_loop_lag_seconds
+
+logger = logging.getLogger(__name__)
+
+# 两次阻塞调用栈日志之间的最小间隔（秒），阻塞次数照常统计
+STACK_LOG_COOLDOWN = 10.0
+
+
+class LoopMonitor:
+    def __init__(self):
+        self._lag_task: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stopping = threading.Event()
+
+    async def start(self) -> None:
+        settings = get_settings()
+        loop = asyncio.get_running_loop()
+        if settings.LOOP_LAG_INTERVAL > 0:
+            self._lag_task = asyncio.create_task(self._measure_lag(settings.LOOP_LAG_INTERVAL))
+        if settings.LOOP_BLOCK_THRESHOLD_MS > 0:
+            self._stopping.clear()
+            self._watchdog = threading.Thread(
+                target=self._watch,
+                args=(loop, threading.get_ident(), settings.LOOP_BLOCK_THRESHOLD_MS / 1000),
+                name="tgstate-loop-watchdog",
+                daemon=True,
+            )
+            self._watchdog.start()
+            logger.info("事件循环阻塞检测已开启（阈值 %.0fms）", settings.LOOP_BLOCK_THRESHOLD_MS)
+
+    async def stop(self) -> None:
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+        if self._watchdog is not None:
+            self._stopping.set()
+            await asyncio.to_thread(self._watchdog.join, 5)
+            self._watchdog = None
+
+    @staticmethod
+    async def _measure_lag(interval: float) -> None:
+        loop = asyncio.get_running_loop()
+        observe = event_loop_lag_seconds.labels().observe
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            observe(max(0.0, loop.time() - started - interval))
+
+    def _watch(self, loop: asyncio.AbstractEventLoop, loop_thread_id: int, threshold: float) -> None:
+        # 检查间隔取阈值的一半：超过 1.5 倍阈值的阻塞一定会被发现
+        check_interval = threshold / 2
+        last_logged = 0.0
+        while not self._stopping.wait(check_interval):
+            pong = threading.Event()
+            posted = time.monotonic()
+            try:
+                loop.call_soon_threadsafe(pong.set)
+            except RuntimeError:
+                # 事件循环已关闭
+                return
+            if pong.wait(threshold):
+                continue
+
+            event_loop_blocked.inc()
+            now = time.monotonic()
+            if now - last_logged >= STACK_LOG_COOLDOWN:
+                last_logged = now
+                frame = sys._current_frames().get(loop_thread_id)
+                stack = "".join(traceback.format_stack(frame)) if frame is not None else "（无法获取调用栈）\n"
+                logger.warning("事件循环已被阻塞超过 %.0fms，当前调用栈:\n%s", threshold * 1000, stack.rstrip())
+            # 等待循环恢复，记录本次阻塞的总时长
+            while not pong.wait(check_interval):
+                if self._stopping.is_set():
+                    return
+            event_loop_blocked_seconds.observe(time.monotonic() - posted)
+
+
+loop_monitor = LoopMonitor()
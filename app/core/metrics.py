@@ -0,0 +1,386 @@
+"""
+进程内指标，以 Prometheus 文本格式（0.0.4）通过 /metrics 导出。
+
+为避免引入额外依赖，这里只实现用到的 Counter / Gauge / Histogram：
+记录时只做一次字典查找与几次整数加法，热点路径上应预先调用 labels() 取得子指标。
+多 worker 部署时所有 worker 共用一个端口，每次抓取落到任意一个 worker 上，
+因此各进程把自己的指标快照（snapshot()）定期写入数据库，/metrics 汇总所有 worker（见 metrics_store）。
+"""
+
+import bisect
+import math
+import threading
+from collections.abc import Callable, Iterable
+
+# 默认的延迟分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# SQLite 查询通常在毫秒以内
+DB_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+# 上传耗时（秒），大文件分块上传可达数分钟
+UPLOAD_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+# 事件循环调度延迟 / 阻塞时长（秒）
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# 下载吞吐量（字节/秒）：256KB/s ~ 128MB/s
+THROUGHPUT_BUCKETS = tuple(256 * 1024 * 2**i for i in range(10))
+
+# 上传大小分组（用作 size 标签），上限为闭区间右端点
+UPLOAD_SIZE_BUCKETS = (
+    ("lt_1mb", 1024 * 1024),
+    ("lt_20mb", 20 * 1024 * 1024),
+    ("lt_100mb", 100 * 1024 * 1024),
+    ("lt_1gb", 1024 * 1024 * 1024),
+)
+
+
+def upload_size_label(size: int) -> str:
+    for label, limit in UPLOAD_SIZE_BUCKETS:
+        if size < limit:
+            return label
+    return "ge_1gb"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape_label(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        # 无标签的指标预先创建，未记录时也以 0 导出
+        if not self.labelnames and self.kind != "gauge":
+            self._children[()] = self._new_child()
+
+    def labels(self, *values: str):
+        """返回对应标签值的子指标（首次访问时创建），热点路径可缓存返回值。"""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} 需要标签 {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _default(self):
+        return self.labels()
+
+    @property
+    def exposed_name(self) -> str:
+        return self.name
+
+    def collect(self) -> list[str]:
+        name = self.exposed_name
+        lines = [f"# HELP {name} {self.documentation}", f"# TYPE {name} {self.kind}"]
+        for key, child in list(self._children.items()):
+            lines.extend(self._collect_child(key, child))
+        return lines
+
+    def _collect_child(self, key, child) -> list[str]:
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    @property
+    def exposed_name(self) -> str:
+        return f"{self.name}_total"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+    def _collect_child(self, key, child):
+        return [f"{self.exposed_name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"]
+
+
+class Gauge(_Metric):
+    """取值在导出时通过回调读取，记录端零开销。"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float]):
+        super().__init__(name, documentation)
+        self._callback = callback
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            lines.append(f"{self.name} {_format_value(self._callback())}")
+        except Exception:
+            pass
+        return lines
+
+
+class _HistogramChild:
+    __slots__ = ("_upper_bounds", "counts", "sum", "_lock")
+
+    def __init__(self, upper_bounds: tuple[float, ...]):
+        self._upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self._upper_bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default().observe(value)
+
+    def _collect_child(self, key, child):
+        with child._lock:
+            counts, total = list(child.counts), child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            le = 'le="' + _format_value(bound) + '"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Callable[[], list[str]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], list[str]]) -> None:
+        """注册在导出时调用的回调，返回若干行文本格式的指标。"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        for collector in self._collectors:
+            try:
+                lines.extend(collector())
+            except Exception:
+                pass
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+download_ttfb_seconds = registry.register(Histogram(
+    "tgstate_download_ttfb_seconds",
+    "从收到下载请求到发送第一个字节的耗时",
+    ["kind"],
+))
+download_throughput_bytes = registry.register(Histogram(
+    "tgstate_download_throughput_bytes_per_second",
+    "单次完整下载的平均吞吐量",
+    ["kind"],
+    buckets=THROUGHPUT_BUCKETS,
+))
+download_bytes = registry.register(Counter(
+    "tgstate_download_bytes",
+    "已发送给客户端的下载字节数",
+    ["kind"],
+))
+download_aborted = registry.register(Counter(
+    "tgstate_download_aborted",
+    "客户端中途断开、未完整发送的下载数",
+    ["kind"],
+))
+upload_duration_seconds = registry.register(Histogram(
+    "tgstate_upload_duration_seconds",
+    "上传到 Telegram 的耗时（按文件大小分组；result: ok / error / cancelled）",
+    ["size", "result"],
+    buckets=UPLOAD_BUCKETS,
+))
+telegram_api_seconds = registry.register(Histogram(
+    "tgstate_telegram_api_request_duration_seconds",
+    "Bot API 请求耗时（按方法）",
+    ["method"],
+))
+telegram_api_errors = registry.register(Counter(
+    "tgstate_telegram_api_errors",
+    "Bot API 请求失败次数（reason: rate_limited / http_error / network / deadline）",
+    ["method", "reason"],
+))
+db_query_seconds = registry.register(Histogram(
+    "tgstate_db_query_duration_seconds",
+    "SQLite 操作耗时（含等待 db_lock）",
+    ["operation"],
+    buckets=DB_LATENCY_BUCKETS,
+))
+sse_resyncs = registry.register(Counter(
+    "tgstate_sse_resyncs",
+    "SSE 订阅者落后于回放缓冲区、被迫全量重新同步的次数",
+))
+event_loop_lag_seconds = registry.register(Histogram(
+    "tgstate_event_loop_lag_seconds",
+    "事件循环定时器的调度延迟",
+    buckets=LOOP_LAG_BUCKETS,
+))
+event_loop_blocked = registry.register(Counter(
+    "tgstate_event_loop_blocked",
+    "事件循环被同步代码阻塞超过 LOOP_BLOCK_THRESHOLD_MS 的次数",
+))
+event_loop_blocked_seconds = registry.register(Histogram(
+    "tgstate_event_loop_blocked_duration_seconds",
+    "被检测到的事件循环阻塞的持续时间",
+    buckets=LOOP_LAG_BUCKETS,
+))
+upload_queue_wait_seconds = registry.register(Histogram(
+    "tgstate_upload_queue_wait_seconds",
+    "上传请求在准入队列中的等待时间",
+))
+upload_rejected = registry.register(Counter(
+    "tgstate_upload_rejected",
+    "被准入控制拒绝（503）的上传请求数（reason: queue_full / queue_timeout）",
+    ["reason"],
+))
+orphan_messages = registry.register(Counter(
+    "tgstate_orphan_messages",
+    "孤儿回收器处理的消息数（result: found / deleted / failed）",
+    ["result"],
+))
+
+
+_lru_caches: dict[str, object] = {}
+
+
+def register_lru_cache(name: str, cached_function) -> None:
+    """将 functools.lru_cache 的命中统计导出为 tgstate_cache_requests_total{cache, result}（导出时读取）。"""
+    _lru_caches[name] = cached_function
+
+
+def _collect_lru_caches() -> list[str]:
+    lines = [
+        "# HELP tgstate_cache_requests_total 进程内缓存的查询次数（result: hit / miss）",
+        "# TYPE tgstate_cache_requests_total counter",
+    ]
+    entries = [
+        "# HELP tgstate_cache_entries 进程内缓存当前的条目数",
+        "# TYPE tgstate_cache_entries gauge",
+    ]
+    for name, cached_function in _lru_caches.items():
+        info = cached_function.cache_info()
+        label = _escape_label(name)
+        lines.append(f'tgstate_cache_requests_total{{cache="{label}",result="hit"}} {info.hits}')
+        lines.append(f'tgstate_cache_requests_total{{cache="{label}",result="miss"}} {info.misses}')
+        entries.append(f'tgstate_cache_entries{{cache="{label}"}} {info.currsize}')
+    return lines + entries
+
+
+registry.register_collector(_collect_lru_caches)
+
+
+def snapshot(text: str | None = None) -> dict:
+    """
+    把文本格式的指标解析为可合并的快照（默认为本进程当前的指标）：
+    {"families": {名称: [类型, 说明]}, "samples": [[所属名称, 样本名与标签, 值], ...]}。
+    """
+    if text is None:
+        text = registry.render()
+    families: dict[str, list[str]] = {}
+    helps: dict[str, str] = {}
+    samples: list[list] = []
+    family = ""
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            name, _, documentation = line[7:].partition(" ")
+            helps[name] = documentation
+        elif line.startswith("# TYPE "):
+            family, _, kind = line[7:].partition(" ")
+            families[family] = [kind, helps.get(family, "")]
+        elif line and family:
+            key, _, value = line.rpartition(" ")
+            try:
+                samples.append([family, key, float(value)])
+            except ValueError:
+                continue
+    return {"families": families, "samples": samples}
+
+
+def merge_snapshots(snapshots: Iterable[tuple[dict, bool]]) -> dict:
+    """
+    合并多个快照：同名同标签的样本相加。
+
+    每项为 (快照, 是否包含 gauge)；已退出进程的 gauge 不再有意义，只合并其 counter 与 histogram。
+    histogram 的各分桶为累计计数，相加后仍然有效。
+    """
+    families: dict[str, list[str]] = {}
+    values: dict[tuple[str, str], float] = {}
+    for snap, with_gauges in snapshots:
+        snap_families = snap.get("families", {})
+        for family, key, value in snap.get("samples", []):
+            kind = snap_families.get(family, ["untyped"])[0]
+            if kind == "gauge" and not with_gauges:
+                continue
+            families.setdefault(family, snap_families[family])
+            values[(family, key)] = values.get((family, key), 0.0) + value
+    return {"families": families, "samples": [[family, key, value] for (family, key), value in values.items()]}
+
+
+def render_snapshot(snap: dict) -> str:
+    by_family: dict[str, list[str]] = {}
+    for family, key, value in snap["samples"]:
+        by_family.setdefault(family, []).append(f"{key} {_format_value(value)}")
+    lines: list[str] = []
+    for family, (kind, documentation) in snap["families"].items():
+        lines.append(f"# HELP {family} {documentation}")
+        lines.append(f"# TYPE {family} {kind}")
+        lines.extend(by_family.get(family, []))
+    return "\n".join(lines) + "\n"
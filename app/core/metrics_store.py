@@ -0,0 +1,98 @@
+"""
+多 worker 部署时的指标汇总。
+
+uvicorn --workers / WEB_CONCURRENCY 下所有 worker 共用一个端口，每次抓取 /metrics 会落到任意一个 worker；
+只导出本进程的值会让 counter 在两次抓取之间忽大忽小，rate() 与 histogram_quantile() 都会失真。
+
+因此每个 worker 每隔 METRICS_SNAPSHOT_INTERVAL 秒把自己的指标快照写入 metrics_snapshots 表，
+/metrics 先写入本进程的最新快照，再把所有快照相加后导出：
+- counter 与 histogram 包含所有进程（含已退出的进程），汇总值单调不减；
+- gauge 只汇总仍在运行的进程，取各 worker 之和（例如所有 worker 正在处理的上传数）。
+
+进程身份与存活判断复用上传暂存的 owner 锁（upload_owner_id / is_owner_alive）。
+leader 定期把已退出进程的 counter 与 histogram 并入 'archive' 行并删除其快照，表的大小不随重启增长。
+"""
+
+import asyncio
+import json
+import logging
+
+from .. import database
+from .config import get_settings
+from .metrics import merge_snapshots, render_snapshot, snapshot
+from .upload_staging import is_owner_alive, upload_owner_id
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_ID = "archive"
+
+
+def is_enabled() -> bool:
+    return get_settings().WEB_CONCURRENCY > 1
+
+
+def publish() -> None:
+    """把本进程当前的指标快照写入数据库。"""
+    database.save_metrics_snapshot(upload_owner_id(), json.dumps(snapshot(), ensure_ascii=False))
+
+
+def _load() -> list[tuple[str, dict]]:
+    rows = []
+    for process_id, payload in database.get_metrics_snapshots():
+        try:
+            rows.append((process_id, json.loads(payload)))
+        except ValueError:
+            logger.warning("忽略无效的指标快照: %s", process_id)
+    return rows
+
+
+def render_all() -> str:
+    """汇总所有 worker 的指标，返回文本格式。"""
+    publish()
+    parts = []
+    live = 0
+    for process_id, snap in _load():
+        alive = process_id != ARCHIVE_ID and is_owner_alive(process_id)
+        live += alive
+        parts.append((snap, alive))
+    text = render_snapshot(merge_snapshots(parts))
+    return text + (
+        "# HELP tgstate_metrics_workers 本次汇总的运行中 worker 数\n"
+        "# TYPE tgstate_metrics_workers gauge\n"
+        f"tgstate_metrics_workers {live}\n"
+    )
+
+
+def fold_exited() -> int:
+    """把已退出进程的快照并入归档（仅由 leader 调用），返回并入的进程数。"""
+    archive = {"families": {}, "samples": []}
+    exited: list[tuple[str, dict]] = []
+    for process_id, snap in _load():
+        if process_id == ARCHIVE_ID:
+            archive = snap
+        elif not is_owner_alive(process_id):
+            exited.append((process_id, snap))
+    if not exited:
+        return 0
+    merged = merge_snapshots([(archive, False)] + [(snap, False) for _, snap in exited])
+    database.replace_metrics_archive(
+        ARCHIVE_ID, json.dumps(merged, ensure_ascii=False), [process_id for process_id, _ in exited]
+    )
+    return len(exited)
+
+
+async def run_publisher() -> None:
+    """定期写入本进程的指标快照；取消（关闭）时再写入一次，退出前的计数不会丢失。"""
+    interval = max(0.5, get_settings().METRICS_SNAPSHOT_INTERVAL)
+    try:
+        while True:
+            try:
+                await asyncio.to_thread(publish)
+            except Exception as e:
+                logger.error("写入指标快照失败: %s", e)
+            await asyncio.sleep(interval)
+    finally:
+        try:
+            await asyncio.shield(asyncio.to_thread(publish))
+        except Exception as e:
+            logger.error("写入指标快照失败: %s", e)
@@ -0,0 +1,131 @@
+import re
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import cookie_parser
+from starlette.responses import JSONResponse, RedirectResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..api.common import COOKIE_NAME, error_payload
+from .config import get_active_password, get_active_password_token
+
+
+def _prefix_matcher(prefixes: tuple[str, ...]):
+    """将前缀列表预编译为一个正则，语义等同于 any(path.startswith(p) for p in prefixes)。"""
+    return re.compile("|".join(re.escape(p) for p in prefixes)).match
+
+
+# 公共路径，这些路径永远不拦截
+# /api/auth/login 用于登录，/api/auth/logout 用于登出，都应该放行
+# /s/ 为签名下载链接，由签名本身授权；/metrics 在路由中校验会话或 METRICS_TOKEN
+_is_public_path = _prefix_matcher(("/static", "/api", "/d", "/s/", "/metrics", "/favicon.ico"))
+
+# 保护 API
+# 包含了上传、删除、文件列表、配置管理等敏感接口
+_is_protected_api = _prefix_matcher((
+    "/api/upload",
+    "/api/delete",
+    "/api/files",
+    "/api/batch_delete",
+    "/api/app-config",
+    "/api/reset-config",
+    "/api/set-password",
+    "/api/admin",
+))
+
+# 明确列出需要登录才能访问的页面
+_PROTECTED_PAGES = frozenset(("/", "/image_hosting", "/files", "/settings"))
+_LOGIN_PAGES = frozenset(("/login", "/pwd"))
+_SETUP_PAGES = frozenset(("/welcome", "/settings"))
+
+_SECURITY_HEADERS = (
+    ("X-Content-Type-Options", "nosniff"),
+    ("X-Frame-Options", "DENY"),
+    ("Referrer-Policy", "no-referrer"),
+    # 简单的 Permissions-Policy
+    ("Permissions-Policy", "geolocation=(), microphone=(), camera=(), payment=(), usb=()"),
+)
+_HSTS_VALUE = "max-age=31536000; includeSubDomains"
+
+
+class SecurityAuthMiddleware:
+    """
+    纯 ASGI 中间件：为所有响应添加安全头，并在路由之前处理页面 / API 的访问权限。
+
+    只在 http.response.start 消息中注入响应头，不包装响应体，
+    因此大文件的 StreamingResponse 不会经过额外的任务与队列。
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        # Strict-Transport-Security (HSTS)
+        # Only if HTTPS
+        is_https = scope.get("scheme") == "https" or headers.get("x-forwarded-proto") == "https"
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                response_headers = MutableHeaders(scope=message)
+                for name, value in _SECURITY_HEADERS:
+                    response_headers[name] = value
+                if is_https:
+                    response_headers["Strict-Transport-Security"] = _HSTS_VALUE
+            await send(message)
+
+        response = self._check_access(scope["path"], headers)
+        if response is not None:
+            await response(scope, receive, send_with_headers)
+            return
+        await self.app(scope, receive, send_with_headers)
+
+    @staticmethod
+    def _check_access(request_path: str, headers: Headers):
+        """返回需要直接发送的拦截响应；放行时返回 None。"""
+        active_password = get_active_password()
+
+        # 情况 1：未设置密码
+        if not active_password:
+            # 如果是引导页或 API/静态资源，放行
+            if request_path in _SETUP_PAGES or _is_public_path(request_path):
+                return None
+            # 否则强制重定向到引导页
+            return RedirectResponse(url="/welcome", status_code=307)
+
+        # 情况 2：已设置密码
+        # 如果访问引导页，强制跳转到主页
+        if request_path == "/welcome":
+            return RedirectResponse(url="/", status_code=307)
+
+        # --- 鉴权逻辑 ---
+        session_password = cookie_parser(headers.get("cookie", "")).get(COOKIE_NAME)
+        # 兼容性检查：
+        # 1. Cookie == SHA256(password) (新版逻辑，Hash 随配置快照预先计算)
+        # 2. Cookie == password (旧版逻辑，避免升级踢下线)
+        is_authenticated = session_password is not None and (
+            session_password == get_active_password_token() or session_password == active_password
+        )
+
+        if _is_protected_api(request_path):
+            if not is_authenticated:
+                return JSONResponse(
+                    status_code=401,
+                    content={"detail": error_payload("需要网页登录", code="login_required")},
+                )
+
+        # 登录页特殊处理：如果已登录，跳转到主页
+        if request_path in _LOGIN_PAGES:
+            if is_authenticated:
+                return RedirectResponse(url="/", status_code=307)
+            # 未登录则允许访问登录页
+            return None
+
+        # 核心页面鉴权
+        if request_path in _PROTECTED_PAGES and not is_authenticated:
+            return RedirectResponse(url="/login", status_code=307)
+
+        return None
@@ -0,0 +1,428 @@
+"""
+按需性能分析（仅管理员，需开启 PROFILING_ENABLED）。
+
+- 单请求分析：带 X-Profile: 1 请求头的已登录请求在分析器下执行，响应头 X-Profile-Id 给出结果编号，
+  通过 /api/admin/profiles/{id} 下载。已安装 pyinstrument 时输出 speedscope 文件（只统计该请求自身的协程），
+  否则退回 cProfile，输出 pstats 文件（统计期间事件循环线程上的全部代码，包括并发的其他请求）。
+- 进程级采样：在后台线程中按固定间隔读取所有线程的调用栈（sys._current_frames），
+  持续指定秒数后输出 speedscope 文件或 flamegraph.pl 使用的折叠栈文本。
+- 内存：tracemalloc 快照，与上一次快照比较，按代码位置列出增长最多的分配。
+  tracemalloc 只作用于处理请求的进程，响应中的 pid 标明是哪个 worker。
+
+分析结果保存在 DATA_DIR/profiles，多 worker 部署时任意 worker 都能列出与下载。
+
+未开启时中间件只做一次布尔判断，采样线程与 tracemalloc 都不运行。
+"""
+
+import asyncio
+import contextlib
+import cProfile
+import io
+import json
+import logging
+import marshal
+import os
+import pstats
+import re
+import secrets
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import cookie_parser
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .. import database
+from ..api.common import COOKIE_NAME
+from .config import get_active_password, get_active_password_token, get_settings
+
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+    from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:  # pragma: no cover - 未安装 pyinstrument 时单请求分析退回 cProfile
+    PyinstrumentProfiler = None
+    SpeedscopeRenderer = None
+
+logger = logging.getLogger(__name__)
+
+PROFILE_REQUEST_HEADER = "x-profile"
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+# 进程级采样的时长上限（秒）与采样间隔范围（毫秒）
+MAX_SAMPLE_SECONDS = 120
+MIN_SAMPLE_INTERVAL_MS = 1
+MAX_SAMPLE_INTERVAL_MS = 100
+# 保留最近的分析结果数
+MAX_STORED_PROFILES = 20
+PROFILE_ID_PATTERN = re.compile(r"\d{8}-\d{6}-[0-9a-f]{6}")
+# 单个栈最多保留的帧数，避免深递归时生成过大的文件
+MAX_STACK_DEPTH = 128
+
+
+def is_admin(headers: Headers) -> bool:
+    """与鉴权中间件相同的会话判断；未设置密码时所有请求都视为管理员。"""
+    active_password = get_active_password()
+    if not active_password:
+        return True
+    session_password = cookie_parser(headers.get("cookie", "")).get(COOKIE_NAME)
+    return session_password is not None and session_password in (get_active_password_token(), active_password)
+
+
+class ProfileStore:
+    """
+    最近的分析结果，保存在 DATA_DIR/profiles 中：<编号>.json 为文件名与 MIME 类型，<编号>.bin 为内容。
+
+    多 worker 部署时分析请求与下载请求可能落在不同 worker 上，因此结果写入共享的 DATA_DIR 而不是进程内存。
+    读写都是阻塞的文件操作，异步代码中应通过 asyncio.to_thread 调用。
+    """
+
+    def __init__(self, directory: str, capacity: int = MAX_STORED_PROFILES):
+        self.directory = directory
+        self.capacity = capacity
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_id() -> str:
+        return time.strftime("%Y%m%d-%H%M%S-") + secrets.token_hex(3)
+
+    def _path(self, profile_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, profile_id + suffix)
+
+    @staticmethod
+    def _write(path: str, data: bytes) -> None:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _ids(self) -> list[str]:
+        """按时间从旧到新排列的编号（编号以时间开头）。"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-5] for name in names if name.endswith(".json"))
+
+    def put(self, profile_id: str, filename: str, media_type: str, content: bytes) -> None:
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            # 先写内容再写元数据：列表只按元数据文件枚举，不会列出写了一半的结果
+            self._write(self._path(profile_id, ".bin"), content)
+            self._write(
+                self._path(profile_id, ".json"),
+                json.dumps({"filename": filename, "media_type": media_type, "pid": os.getpid()}).encode("utf-8"),
+            )
+            ids = self._ids()
+            for old_id in ids[:max(0, len(ids) - self.capacity)]:
+                for suffix in (".json", ".bin"):
+                    with contextlib.suppress(FileNotFoundError):
+                        os.unlink(self._path(old_id, suffix))
+
+    def _meta(self, profile_id: str) -> dict | None:
+        try:
+            with open(self._path(profile_id, ".json"), "rb") as f:
+                return json.loads(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def get(self, profile_id: str) -> tuple[str, str, bytes] | None:
+        if not PROFILE_ID_PATTERN.fullmatch(profile_id):
+            return None
+        meta = self._meta(profile_id)
+        if meta is None:
+            return None
+        try:
+            with open(self._path(profile_id, ".bin"), "rb") as f:
+                content = f.read()
+        except OSError:
+            return None
+        return meta["filename"], meta["media_type"], content
+
+    def list(self) -> list[dict]:
+        items = []
+        for profile_id in reversed(self._ids()):
+            meta = self._meta(profile_id)
+            if meta is None:
+                continue
+            try:
+                size = os.path.getsize(self._path(profile_id, ".bin"))
+            except OSError:
+                continue
+            items.append({"id": profile_id, "filename": meta["filename"], "size": size, "pid": meta.get("pid")})
+        return items
+
+
+profile_store = ProfileStore(os.path.join(database.DATA_DIR, "profiles"))
+
+
+# ---------------------------------------------------------------------------
+# 进程级采样
+# ---------------------------------------------------------------------------
+
+def _frame_key(frame) -> tuple[str, str, int]:
+    code = frame.f_code
+    return (code.co_qualname, code.co_filename, code.co_firstlineno)
+
+
+class StackSampler:
+    """在后台线程中周期性读取所有线程的调用栈，按 (线程名, 调用栈) 计数。"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: Counter[tuple[str, tuple]] = Counter()
+        self.sample_count = 0
+        self.duration = 0.0
+
+    def run(self, seconds: float) -> None:
+        own_ident = threading.get_ident()
+        started = time.perf_counter()
+        deadline = started + seconds
+        while True:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(_frame_key(frame))
+                    frame = frame.f_back
+                stack.reverse()
+                self.samples[(names.get(ident, str(ident)), tuple(stack))] += 1
+            self.sample_count += 1
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            time.sleep(min(self.interval, deadline - now))
+        self.duration = time.perf_counter() - started
+
+    def to_speedscope(self, name: str) -> bytes:
+        frames: list[dict] = []
+        frame_index: dict[tuple, int] = {}
+        profiles: dict[str, dict] = {}
+        # 按实际耗时折算每次采样的权重（sleep 与读取调用栈都会让间隔略大于设定值）
+        per_sample = self.duration / self.sample_count if self.sample_count else self.interval
+        for (thread_name, stack), count in self.samples.items():
+            indices = []
+            for key in stack:
+                index = frame_index.get(key)
+                if index is None:
+                    index = frame_index[key] = len(frames)
+                    frames.append({"name": key[0], "file": key[1], "line": key[2]})
+                indices.append(index)
+            profile = profiles.setdefault(thread_name, {
+                "type": "sampled",
+                "name": thread_name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": self.duration,
+                "samples": [],
+                "weights": [],
+            })
+            profile["samples"].append(indices)
+            profile["weights"].append(count * per_sample)
+        return json.dumps({
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": name,
+            "exporter": "tgstate",
+            "shared": {"frames": frames},
+            "profiles": list(profiles.values()),
+        }).encode("utf-8")
+
+    def to_collapsed(self) -> bytes:
+        """flamegraph.pl / speedscope 均可读取的折叠栈格式：线程;帧;帧 次数。"""
+        lines = []
+        for (thread_name, stack), count in self.samples.items():
+            names = [f"{qualname} ({filename}:{line})".replace(";", ":") for qualname, filename, line in stack]
+            lines.append(";".join([thread_name.replace(";", ":"), *names]) + f" {count}")
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+_sampling_lock = threading.Lock()
+
+
+def sample_process(seconds: float, interval_ms: float, output_format: str) -> tuple[str, str, bytes]:
+    """
+    在当前线程中执行一次进程级采样（调用方应放到工作线程中运行），返回 (文件名, MIME 类型, 内容)。
+    同一时间只允许一个采样任务，已有任务运行时抛出 RuntimeError。
+    """
+    if not _sampling_lock.acquire(blocking=False):
+        raise RuntimeError("已有进程级采样正在运行")
+    try:
+        sampler = StackSampler(interval_ms / 1000)
+        logger.info("开始进程级采样：%.1f 秒，间隔 %.0fms", seconds, interval_ms)
+        sampler.run(seconds)
+    finally:
+        _sampling_lock.release()
+
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    if output_format == "collapsed":
+        return f"tgstate-cpu-{stamp}.collapsed.txt", "text/plain; charset=utf-8", sampler.to_collapsed()
+    content = sampler.to_speedscope(f"tgState 进程采样 {stamp}（{sampler.sample_count} 次）")
+    return f"tgstate-cpu-{stamp}.speedscope.json", "application/json", content
+
+
+# ---------------------------------------------------------------------------
+# tracemalloc
+# ---------------------------------------------------------------------------
+
+_MEMORY_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+class MemoryTracker:
+    """管理 tracemalloc 的开启 / 关闭，并保存上一次快照用于比较。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._previous: tracemalloc.Snapshot | None = None
+        self._previous_at: float | None = None
+
+    def status(self) -> dict:
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        return {
+            # tracemalloc 只统计本进程；多 worker 部署时据此确认各次请求落在同一个 worker 上
+            "pid": os.getpid(),
+            "tracing": tracemalloc.is_tracing(),
+            "frames": tracemalloc.get_traceback_limit(),
+            "traced_current": current,
+            "traced_peak": peak,
+            "overhead": tracemalloc.get_tracemalloc_memory() if tracemalloc.is_tracing() else 0,
+            "previous_snapshot_at": self._previous_at,
+        }
+
+    def start(self, frames: int) -> dict:
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+                logger.info("已开启 tracemalloc（%d 帧）", frames)
+            self._previous = None
+            self._previous_at = None
+        return self.status()
+
+    def stop(self) -> dict:
+        with self._lock:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+                logger.info("已关闭 tracemalloc")
+            self._previous = None
+            self._previous_at = None
+        return self.status()
+
+    def snapshot(self, limit: int, key_type: str) -> dict:
+        """拍摄快照并与上一次快照比较（第一次与空快照比较，即当前的全部分配）。"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                raise RuntimeError("tracemalloc 未开启")
+            snapshot = tracemalloc.take_snapshot().filter_traces(_MEMORY_FILTERS)
+            taken_at = time.time()
+            if self._previous is not None:
+                stats = snapshot.compare_to(self._previous, key_type)
+            else:
+                stats = [
+                    tracemalloc.StatisticDiff(s.traceback, s.size, s.size, s.count, s.count)
+                    for s in snapshot.statistics(key_type)
+                ]
+            since = self._previous_at
+            self._previous = snapshot
+            self._previous_at = taken_at
+
+        top = []
+        for stat in stats[:limit]:
+            top.append({
+                "location": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                "size": stat.size,
+                "size_diff": stat.size_diff,
+                "count": stat.count,
+                "count_diff": stat.count_diff,
+            })
+        return {**self.status(), "compared_to": since, "key_type": key_type, "top": top}
+
+
+memory_tracker = MemoryTracker()
+
+
+# ---------------------------------------------------------------------------
+# 单请求分析
+# ---------------------------------------------------------------------------
+
+class ProfilingMiddleware:
+    """
+    纯 ASGI 中间件：PROFILING_ENABLED 开启时，管理员带 X-Profile: 1 的请求在分析器下执行
+    （包括流式响应体的发送），结果存入 profile_store。未开启时直接透传。
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.enabled = get_settings().PROFILING_ENABLED
+        # cProfile 会接管整个线程的 profile 钩子，同一时间只能分析一个请求
+        self._cprofile_busy = threading.Lock()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if not self.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        if headers.get(PROFILE_REQUEST_HEADER) != "1" or not is_admin(headers):
+            await self.app(scope, receive, send)
+            return
+
+        if PyinstrumentProfiler is not None:
+            await self._profile_with_pyinstrument(scope, receive, send)
+        elif self._cprofile_busy.acquire(blocking=False):
+            try:
+                await self._profile_with_cprofile(scope, receive, send)
+            finally:
+                self._cprofile_busy.release()
+        else:
+            await self.app(scope, receive, self._with_header(send, "X-Profile-Status", "busy"))
+
+    @staticmethod
+    def _with_header(send: Send, name: str, value: str) -> Send:
+        async def send_with_header(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append(name, value)
+            await send(message)
+        return send_with_header
+
+    @staticmethod
+    def _filename(scope: Scope, profile_id: str, suffix: str) -> str:
+        path = scope["path"].strip("/").replace("/", "_") or "root"
+        return f"tgstate-{scope['method'].lower()}-{path[:60]}-{profile_id}{suffix}"
+
+    async def _profile_with_pyinstrument(self, scope: Scope, receive: Receive, send: Send) -> None:
+        profile_id = profile_store.new_id()
+        profiler = PyinstrumentProfiler(interval=0.001, async_mode="enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, self._with_header(send, "X-Profile-Id", profile_id))
+        finally:
+            profiler.stop()
+            content = profiler.output(SpeedscopeRenderer()).encode("utf-8")
+            await asyncio.to_thread(
+                profile_store.put,
+                profile_id, self._filename(scope, profile_id, ".speedscope.json"), "application/json", content,
+            )
+            logger.info("已记录请求分析 %s：%s %s", profile_id, scope["method"], scope["path"])
+
+    async def _profile_with_cprofile(self, scope: Scope, receive: Receive, send: Send) -> None:
+        profile_id = profile_store.new_id()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, self._with_header(send, "X-Profile-Id", profile_id))
+        finally:
+            profiler.disable()
+            stats = pstats.Stats(profiler, stream=io.StringIO())
+            # 与 Profile.dump_stats() 相同的格式，可用 python -m pstats / snakeviz 打开
+            content = marshal.dumps(stats.stats)
+            await asyncio.to_thread(
+                profile_store.put,
+                profile_id, self._filename(scope, profile_id, ".prof"), "application/octet-stream", content,
+            )
+            logger.info("已记录请求分析 %s（cProfile）：%s %s", profile_id, scope["method"], scope["path"])
@@ -0,0 +1,145 @@
+"""
+HMAC 签名的限时下载链接。
+
+签名 Token 内嵌复合 file_id、文件名、大小、是否为清单以及过期时间，
+下载路由只需做一次 HMAC 校验即可提供文件，无需查询数据库。
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import time
+from functools import lru_cache
+
+from .. import database
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+SIGNING_KEY_FILE = "url_signing.key"
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+SIGNING_KEY_BYTES = 32
+# 读到空文件或长度不足的密钥时的重试次数与间隔（秒）
+_KEY_READ_ATTEMPTS = 20
+_KEY_READ_INTERVAL = 0.05
+
+
+def _create_key_file(path: str) -> None:
+    """
+    原子地生成密钥文件：先在同目录写入临时文件并 fsync，再用 os.link 放到目标路径。
+
+    目标路径一旦出现即为完整密钥；多个 worker 同时生成时只有一个 link 成功，
+    进程在写入中途崩溃也只会留下临时文件，不会留下空的密钥文件。
+    """
+    tmp_path = f"{path}.{os.getpid()}.{secrets.token_hex(4)}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(secrets.token_bytes(SIGNING_KEY_BYTES))
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            return
+        logger.info("已生成下载链接签名密钥: %s", path)
+    finally:
+        os.unlink(tmp_path)
+
+
+@lru_cache()
+def get_signing_key() -> bytes:
+    """
+    获取签名密钥。
+
+    优先使用环境变量 URL_SIGNING_SECRET；否则在 DATA_DIR 中生成并持久化一个随机密钥，
+    多个 worker 与重启之间共享同一密钥。密钥文件为空或长度不足时抛出 RuntimeError，不会被缓存。
+    """
+    secret = (get_settings().URL_SIGNING_SECRET or "").strip()
+    if secret:
+        return secret.encode("utf-8")
+
+    path = os.path.join(database.DATA_DIR, SIGNING_KEY_FILE)
+    if not os.path.exists(path):
+        _create_key_file(path)
+
+    # 旧版本先创建文件再写入，可能留下正在写入或已损坏的文件；短暂重试后仍不完整则报错
+    key = b""
+    for attempt in range(_KEY_READ_ATTEMPTS):
+        with open(path, "rb") as f:
+            key = f.read()
+        if len(key) >= SIGNING_KEY_BYTES:
+            return key
+        if attempt + 1 < _KEY_READ_ATTEMPTS:
+            time.sleep(_KEY_READ_INTERVAL)
+    raise RuntimeError(f"签名密钥文件不完整（{len(key)} 字节），请删除后重启: {path}")
+
+
+def _sign(payload_b64: str) -> str:
+    digest = hmac.new(get_signing_key(), payload_b64.encode("ascii"), hashlib.sha256).digest()
+    return _b64encode(digest)
+
+
+def sign_download(
+    *, file_id: str, filename: str, filesize: int | None, is_manifest: bool, expires_at: int
+) -> str:
+    """生成签名 Token。"""
+    payload = {
+        "f": file_id,
+        "n": filename,
+        "s": filesize,
+        "m": 1 if is_manifest else 0,
+        "e": int(expires_at),
+    }
+    payload_b64 = _b64encode(json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+    return f"{payload_b64}.{_sign(payload_b64)}"
+
+
+def verify_download(token: str, now: float | None = None) -> tuple[dict | None, str | None]:
+    """
+    校验签名 Token。
+
+    返回:
+        (payload, None)：校验通过，payload 含 file_id / filename / filesize / is_manifest / expires_at；
+        (None, reason)：reason 为 'invalid' 或 'expired'。
+    """
+    try:
+        payload_b64, signature = token.split(".", 1)
+    except ValueError:
+        return None, "invalid"
+
+    # 合法 Token 只含 base64url 字符；非 ASCII 字符会让编码与 compare_digest 抛异常
+    if not (payload_b64.isascii() and signature.isascii()):
+        return None, "invalid"
+
+    if not hmac.compare_digest(signature, _sign(payload_b64)):
+        return None, "invalid"
+
+    try:
+        data = json.loads(_b64decode(payload_b64))
+        payload = {
+            "file_id": str(data["f"]),
+            "filename": str(data["n"]),
+            "filesize": int(data["s"]) if data.get("s") is not None else None,
+            "is_manifest": bool(data["m"]),
+            "expires_at": int(data["e"]),
+        }
+    except (ValueError, KeyError, TypeError):
+        return None, "invalid"
+
+    if payload["expires_at"] < (now if now is not None else time.time()):
+        return None, "expired"
+    return payload, None
@@ -0,0 +1,178 @@
+"""
+静态资源指纹与预压缩。
+
+启动时为静态目录下的每个文件计算内容哈希，生成形如 /static/js/main.3f2a9c1b7d4e.js 的指纹 URL
+（模板中通过 static_url('js/main.js') 引用），并预先生成 gzip / brotli 压缩版本保存在内存中。
+指纹 URL 的内容不可变，响应带一年的 immutable 缓存；原始路径仍可访问，但需通过 ETag 重新校验。
+"""
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - 未安装 brotli 时只提供 gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_URL_PREFIX = "/static"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+_COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+# 太小的文件压缩收益不抵响应头开销
+_MIN_COMPRESS_SIZE = 512
+
+
+class _Asset:
+    __slots__ = ("path", "fingerprinted_path", "media_type", "digest", "bodies")
+
+    def __init__(self, path: str, fingerprinted_path: str, media_type: str, digest: str, bodies: dict[str, bytes]):
+        self.path = path
+        self.fingerprinted_path = fingerprinted_path
+        self.media_type = media_type
+        self.digest = digest
+        # 编码 -> 响应体，identity 总是存在
+        self.bodies = bodies
+
+    def etag(self, encoding: str) -> str:
+        return f'"{self.digest}"' if encoding == "identity" else f'"{self.digest}-{encoding}"'
+
+
+def _compress_variants(data: bytes, media_type: str) -> dict[str, bytes]:
+    bodies = {"identity": data}
+    if len(data) < _MIN_COMPRESS_SIZE or not media_type.startswith(_COMPRESSIBLE_TYPES):
+        return bodies
+
+    # mtime=0 保证同一内容的压缩结果稳定
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data):
+        bodies["gzip"] = gz
+    if brotli is not None:
+        br = brotli.compress(data, quality=11)
+        if len(br) < len(data):
+            bodies["br"] = br
+    return bodies
+
+
+def _accepted_encodings(accept_encoding: str) -> set[str]:
+    """解析 Accept-Encoding，返回 q > 0 的编码集合。"""
+    accepted = set()
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            accepted.add(token)
+    return accepted
+
+
+class StaticAssetStore:
+    """静态文件的内存索引：原始路径与指纹路径 -> 预压缩后的资源。"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._by_path: dict[str, _Asset] = {}
+        self._by_fingerprint: dict[str, _Asset] = {}
+
+    def build(self) -> None:
+        by_path, by_fingerprint = {}, {}
+        total = compressed = 0
+        for root, _, filenames in os.walk(self.directory):
+            for name in filenames:
+                full_path = os.path.join(root, name)
+                rel_path = os.path.normpath(os.path.relpath(full_path, self.directory))
+                with open(full_path, "rb") as f:
+                    data = f.read()
+
+                digest = hashlib.sha256(data).hexdigest()[:12]
+                stem, ext = os.path.splitext(rel_path)
+                media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                if media_type.startswith("text/") or media_type == "application/javascript":
+                    media_type += "; charset=utf-8"
+
+                asset = _Asset(
+                    path=rel_path,
+                    fingerprinted_path=f"{stem}.{digest}{ext}",
+                    media_type=media_type,
+                    digest=digest,
+                    bodies=_compress_variants(data, media_type),
+                )
+                by_path[asset.path] = asset
+                by_fingerprint[asset.fingerprinted_path] = asset
+                total += len(data)
+                compressed += min(len(body) for body in asset.bodies.values())
+
+        self._by_path, self._by_fingerprint = by_path, by_fingerprint
+        logger.info(
+            "静态资源已加载: %s 个文件, %s 字节 (压缩后 %s 字节, brotli: %s)",
+            len(by_path), total, compressed, "启用" if brotli is not None else "未安装",
+        )
+
+    def url_for(self, path: str) -> str:
+        """返回静态文件的指纹 URL；文件不在索引中时退回原始 URL。"""
+        rel_path = os.path.normpath(path.lstrip("/"))
+        asset = self._by_path.get(rel_path)
+        if asset is None:
+            return f"{STATIC_URL_PREFIX}/{path.lstrip('/')}"
+        return f"{STATIC_URL_PREFIX}/{asset.fingerprinted_path.replace(os.sep, '/')}"
+
+    def lookup(self, path: str) -> tuple[_Asset | None, bool]:
+        """按请求路径查找资源，返回 (资源, 是否为指纹路径)。"""
+        asset = self._by_fingerprint.get(path)
+        if asset is not None:
+            return asset, True
+        return self._by_path.get(path), False
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    优先从 StaticAssetStore 的内存副本提供静态文件，按 Accept-Encoding 选择 br / gzip / 原文；
+    索引中不存在的文件（例如启动后新增的文件）交给 StaticFiles 从磁盘读取。
+    """
+
+    def __init__(self, *, store: StaticAssetStore, **kwargs):
+        super().__init__(directory=store.directory, **kwargs)
+        self.store = store
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        asset, immutable = self.store.lookup(path)
+        if asset is None or scope["method"] not in ("GET", "HEAD"):
+            return await super().get_response(path, scope)
+
+        request_headers = Headers(scope=scope)
+        accepted = _accepted_encodings(request_headers.get("accept-encoding", ""))
+        encoding = next((e for e in ("br", "gzip") if e in asset.bodies and e in accepted), "identity")
+
+        headers = {
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL,
+            "ETag": asset.etag(encoding),
+            "Vary": "Accept-Encoding",
+        }
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match and asset.etag(encoding) in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(asset.bodies[encoding], media_type=asset.media_type, headers=headers)
+
+
+static_assets = StaticAssetStore("app/static")
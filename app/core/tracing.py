@@ -0,0 +1,150 @@
+"""
+按请求采样的耗时追踪。
+
+TracingMiddleware 为被采样的请求创建 Trace 并放入 contextvar，下游代码通过 span() / add_span()
+记录各阶段耗时（数据库操作、Bot API 调用、清单探测、HEAD 取大小、首字节等）：
+- 响应头发送前已完成的阶段写入 Server-Timing 响应头；
+- 请求结束后输出一行 JSON 格式的追踪日志（logger: app.core.tracing），包含全部阶段。
+
+未采样的请求不创建 Trace，span() 只做一次 contextvar 读取并返回共享的空上下文。
+asyncio.to_thread 会复制 contextvar，线程中执行的数据库操作同样会记录到当前 Trace。
+"""
+
+import json
+import logging
+import random
+import secrets
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+TRACE_REQUEST_HEADER = "x-trace"
+
+_current_trace: ContextVar["Trace | None"] = ContextVar("tgstate_trace", default=None)
+_NULL_SPAN = nullcontext()
+
+
+class Trace:
+    __slots__ = ("trace_id", "started", "spans")
+
+    def __init__(self):
+        self.trace_id = secrets.token_hex(8)
+        self.started = time.perf_counter()
+        # (名称, 相对请求开始的起点秒数, 耗时秒数)
+        self.spans: list[tuple[str, float, float]] = []
+
+    def add(self, name: str, start: float, duration: float) -> None:
+        self.spans.append((name, start - self.started, duration))
+
+    def server_timing(self, total: float) -> str:
+        """按名称合并同名阶段，生成 Server-Timing 头（毫秒）。"""
+        merged: dict[str, list] = {}
+        for name, _, duration in self.spans:
+            entry = merged.setdefault(name, [0.0, 0])
+            entry[0] += duration
+            entry[1] += 1
+        parts = []
+        for name, (duration, count) in merged.items():
+            part = f"{name};dur={duration * 1000:.1f}"
+            if count > 1:
+                part += f';desc="x{count}"'
+            parts.append(part)
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+class _Span:
+    __slots__ = ("_trace", "_name", "_start")
+
+    def __init__(self, trace: Trace, name: str):
+        self._trace = trace
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._trace.add(self._name, self._start, time.perf_counter() - self._start)
+        return False
+
+
+def current_trace() -> Trace | None:
+    return _current_trace.get()
+
+
+def span(name: str):
+    """记录一段代码的耗时；当前请求未被追踪时为空操作。"""
+    trace = _current_trace.get()
+    if trace is None:
+        return _NULL_SPAN
+    return _Span(trace, name)
+
+
+def add_span(name: str, start: float, duration: float) -> None:
+    """记录一个已测量的阶段（start 为 time.perf_counter() 时刻）。"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, start, duration)
+
+
+class TracingMiddleware:
+    """
+    纯 ASGI 中间件：按 TRACE_SAMPLE_RATE 采样请求；TRACE_ALLOW_REQUEST_HEADER 开启时，
+    带有 X-Trace: 1 请求头的请求总是被追踪。两者都未开启时直接透传。
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        settings = get_settings()
+        self.sample_rate = max(0.0, min(1.0, settings.TRACE_SAMPLE_RATE))
+        self.allow_header = settings.TRACE_ALLOW_REQUEST_HEADER
+
+    def _should_trace(self, scope: Scope) -> bool:
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        if self.allow_header:
+            return Headers(scope=scope).get(TRACE_REQUEST_HEADER) == "1"
+        return False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not (self.sample_rate or self.allow_header) or not self._should_trace(scope):
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace()
+        status_code = None
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", trace.server_timing(time.perf_counter() - trace.started))
+                headers.append("X-Trace-Id", trace.trace_id)
+            await send(message)
+
+        token = _current_trace.set(trace)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_trace.reset(token)
+            total = time.perf_counter() - trace.started
+            logger.info("trace %s", json.dumps({
+                "trace_id": trace.trace_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status_code,
+                "total_ms": round(total * 1000, 2),
+                "spans": [
+                    {"name": name, "start_ms": round(start * 1000, 2), "dur_ms": round(duration * 1000, 2)}
+                    for name, start, duration in trace.spans
+                ],
+            }, ensure_ascii=False))
@@ -0,0 +1,277 @@
+"""
+Telegram 流量的共享 HTTP 传输层。
+
+Bot API 调用（getFile、sendDocument、deleteMessage 等）与文件下载共用同一个 httpx.AsyncClient，
+对 api.telegram.org 复用同一组 keep-alive 连接（安装了 h2 时使用 HTTP/2 多路复用），
+避免每次读取清单、删除文件时重新建立 TLS 连接。
+
+不同用途通过超时配置（TIMEOUT_PROFILES）区分，而不是各自创建客户端。
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+import httpx
+from telegram.error import TimedOut
+from telegram.request import BaseRequest, HTTPXRequest
+
+from .config import get_settings
+from .metrics import telegram_api_errors, telegram_api_seconds
+from .tracing import add_span
+
+try:
+    import h2  # noqa: F401  仅用于检测 HTTP/2 支持
+except ImportError:  # pragma: no cover - 未安装 httpx[http2] 时退回 HTTP/1.1
+    HTTP2_AVAILABLE = False
+else:
+    HTTP2_AVAILABLE = True
+
+logger = logging.getLogger(__name__)
+
+# 各用途的超时配置（秒）：均为单次读 / 写 / 等待的空闲上限，整个调用的总时限见 operation_deadline()
+TIMEOUT_PROFILES: dict[str, httpx.Timeout] = {
+    # 普通 Bot API 调用：getFile / deleteMessage / sendMessage 等
+    "api": httpx.Timeout(connect=10.0, read=30.0, write=30.0, pool=10.0),
+    # 上传文件（multipart）：写入停滞 60 秒视为连接失效；read 覆盖服务器接收完后保存大分块的时间
+    "upload": httpx.Timeout(connect=10.0, read=120.0, write=60.0, pool=30.0),
+    # 从 Telegram 文件服务器流式下载；read 为两次读到数据之间的最长间隔
+    "download": httpx.Timeout(connect=10.0, read=60.0, write=30.0, pool=30.0),
+    # 长轮询 getUpdates，PTB 会在此基础上加上轮询的 timeout 参数
+    "polling": httpx.Timeout(connect=10.0, read=10.0, write=10.0, pool=10.0),
+    # 设置页面中的连通性检查，尽快失败
+    "verify": httpx.Timeout(connect=10.0, read=10.0, write=10.0, pool=5.0),
+}
+
+
+# 上传总时限的固定部分（秒），其余按大小与 UPLOAD_MIN_THROUGHPUT_KBPS 计算
+UPLOAD_DEADLINE_BASE = 30.0
+# 不设总时限的用途：长轮询由 PTB 控制时长，文件下载是流式的，只受空闲超时限制
+_UNBOUNDED_PROFILES = frozenset(("polling", "download"))
+
+
+def _multipart_size(multipart_data: dict) -> int:
+    """multipart 请求中各文件的总字节数；文件对象（如 FileSlice）通过 seek 取长度，不读取内容。"""
+    total = 0
+    for _, content, *_ in multipart_data.values():
+        if isinstance(content, bytes):
+            total += len(content)
+            continue
+        try:
+            position = content.tell()
+            total += content.seek(0, os.SEEK_END) - position
+            content.seek(position)
+        except (AttributeError, OSError):
+            pass
+    return total
+
+
+def operation_deadline(profile: str, upload_bytes: int = 0) -> float | None:
+    """
+    单次 Bot API 调用的总时限（秒），None 表示不限制。
+
+    上传按大小给出时限：UPLOAD_DEADLINE_BASE + 大小 / UPLOAD_MIN_THROUGHPUT_KBPS，
+    小文件不会因为固定的长超时被卡住数分钟，大分块也不会被过早打断。
+    """
+    settings = get_settings()
+    if upload_bytes:
+        throughput = settings.UPLOAD_MIN_THROUGHPUT_KBPS * 1024
+        return UPLOAD_DEADLINE_BASE + upload_bytes / throughput if throughput > 0 else None
+    if profile in _UNBOUNDED_PROFILES or settings.TELEGRAM_API_DEADLINE <= 0:
+        return None
+    return settings.TELEGRAM_API_DEADLINE
+
+
+class TelegramTransport:
+    """持有共享的 httpx.AsyncClient，并统计连接池使用情况。"""
+
+    def __init__(self, *, max_connections: int = 200, max_keepalive_connections: int = 50):
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        self._client: httpx.AsyncClient | None = None
+        self._transport: httpx.AsyncHTTPTransport | None = None
+        self._requests_total = 0
+
+    @property
+    def started(self) -> bool:
+        return self._client is not None and not self._client.is_closed
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if not self.started:
+            raise RuntimeError("Telegram transport is not started. Is the app lifespan configured correctly?")
+        return self._client
+
+    async def start(self) -> None:
+        if self.started:
+            return
+        self._transport = httpx.AsyncHTTPTransport(http2=HTTP2_AVAILABLE, limits=self._limits)
+        self._client = httpx.AsyncClient(
+            transport=self._transport,
+            timeout=TIMEOUT_PROFILES["download"],
+            event_hooks={"request": [self._on_request]},
+        )
+        logger.info("共享的 HTTP 客户端已创建 (HTTP/2: %s)", "启用" if HTTP2_AVAILABLE else "未安装 h2，使用 HTTP/1.1")
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            logger.info("共享的 HTTP 客户端已关闭")
+        self._client = None
+        self._transport = None
+
+    async def _on_request(self, request: httpx.Request) -> None:
+        self._requests_total += 1
+
+    def stats(self) -> dict:
+        """连接池使用情况：连接数（活跃 / 空闲 / HTTP/2）、排队请求数与累计请求数。"""
+        stats = {
+            "started": self.started,
+            "http2": HTTP2_AVAILABLE,
+            "max_connections": self._limits.max_connections,
+            "max_keepalive_connections": self._limits.max_keepalive_connections,
+            "requests_total": self._requests_total,
+        }
+        # httpcore 连接池没有公开的统计接口，这里尽力读取，读取失败时只返回基础信息
+        pool = getattr(self._transport, "_pool", None)
+        if pool is None:
+            return stats
+        try:
+            connections = list(pool.connections)
+            idle = sum(1 for conn in connections if conn.is_idle())
+            stats.update(
+                connections=len(connections),
+                active=len(connections) - idle,
+                idle=idle,
+                http2_connections=sum(1 for conn in connections if "HTTP/2" in conn.info()),
+                queued_requests=sum(1 for req in getattr(pool, "_requests", []) if req.is_queued()),
+            )
+        except Exception as e:  # pragma: no cover - 依赖 httpcore 内部结构
+            logger.debug("读取连接池状态失败: %s", e)
+        return stats
+
+
+class SharedHTTPXRequest(HTTPXRequest):
+    """
+    python-telegram-bot 的请求对象，底层使用 TelegramTransport 的共享客户端。
+
+    未显式指定超时的调用按用途套用超时配置：带文件的请求使用 media_profile，其余使用 profile。
+    生命周期由 TelegramTransport 管理，Bot 的 initialize / shutdown 不会创建或关闭客户端。
+    """
+
+    def __init__(self, transport: TelegramTransport, profile: str = "api", media_profile: str = "upload"):
+        self._shared_transport = transport
+        self._profile_name = profile
+        self._profile = TIMEOUT_PROFILES[profile]
+        self._media_profile = TIMEOUT_PROFILES[media_profile]
+        super().__init__(
+            connect_timeout=self._profile.connect,
+            read_timeout=self._profile.read,
+            write_timeout=self._profile.write,
+            pool_timeout=self._profile.pool,
+            media_write_timeout=self._media_profile.write,
+        )
+
+    # HTTPXRequest 通过 self._client 发送请求；这里始终指向共享客户端，忽略父类的赋值
+    @property
+    def _client(self) -> httpx.AsyncClient:
+        return self._shared_transport.client
+
+    @_client.setter
+    def _client(self, value) -> None:
+        pass
+
+    def _build_client(self) -> None:
+        return None
+
+    @property
+    def read_timeout(self) -> float | None:
+        return self._profile.read
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data=None,
+        read_timeout=BaseRequest.DEFAULT_NONE,
+        write_timeout=BaseRequest.DEFAULT_NONE,
+        connect_timeout=BaseRequest.DEFAULT_NONE,
+        pool_timeout=BaseRequest.DEFAULT_NONE,
+    ) -> tuple[int, bytes]:
+        multipart_data = request_data.multipart_data if request_data is not None else None
+        profile = self._media_profile if multipart_data else self._profile
+        if read_timeout is BaseRequest.DEFAULT_NONE:
+            read_timeout = profile.read
+        if write_timeout is BaseRequest.DEFAULT_NONE:
+            write_timeout = profile.write
+        if connect_timeout is BaseRequest.DEFAULT_NONE:
+            connect_timeout = profile.connect
+        if pool_timeout is BaseRequest.DEFAULT_NONE:
+            pool_timeout = profile.pool
+
+        # URL 形如 .../bot<token>/getFile，最后一段即 Bot API 方法名
+        api_method = url.rsplit("/", 1)[-1]
+        deadline = operation_deadline(self._profile_name, _multipart_size(multipart_data) if multipart_data else 0)
+        started = time.perf_counter()
+        try:
+            async with asyncio.timeout(deadline):
+                code, payload = await super().do_request(
+                    url,
+                    method,
+                    request_data,
+                    read_timeout=read_timeout,
+                    write_timeout=write_timeout,
+                    connect_timeout=connect_timeout,
+                    pool_timeout=pool_timeout,
+                )
+        except TimeoutError:
+            telegram_api_errors.labels(api_method, "deadline").inc()
+            raise TimedOut(f"{api_method} 超过 {deadline:.0f} 秒的总时限") from None
+        except Exception:
+            telegram_api_errors.labels(api_method, "network").inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            telegram_api_seconds.labels(api_method).observe(elapsed)
+            add_span(f"tg.{api_method}", started, elapsed)
+
+        if code == 429:
+            telegram_api_errors.labels(api_method, "rate_limited").inc()
+        elif code >= 400:
+            telegram_api_errors.labels(api_method, "http_error").inc()
+        return code, payload
+
+
+def bot_api_options() -> dict:
+    """
+    自建 Bot API 服务器相关的 telegram.Bot 参数（base_url / base_file_url / local_mode）。
+
+    未配置 TELEGRAM_API_BASE_URL 时只返回 local_mode，使用官方服务器。
+    """
+    settings = get_settings()
+    options = {"local_mode": settings.TELEGRAM_LOCAL_MODE}
+    base_url = (settings.TELEGRAM_API_BASE_URL or "").strip().rstrip("/")
+    if base_url:
+        # 兼容填写了 PTB 风格的 .../bot 前缀
+        if base_url.endswith("/bot"):
+            base_url = base_url[: -len("/bot")]
+        options["base_url"] = f"{base_url}/bot"
+        options["base_file_url"] = f"{base_url}/file/bot"
+    return options
+
+
+def telegram_request(profile: str = "api", media_profile: str = "upload") -> SharedHTTPXRequest:
+    """创建使用共享传输层的 PTB 请求对象。"""
+    return SharedHTTPXRequest(telegram_transport, profile=profile, media_profile=media_profile)
+
+
+telegram_transport = TelegramTransport()
@@ -0,0 +1,110 @@
+"""
+上传暂存目录与上传日志的进程归属。
+
+上传内容先落地到 DATA_DIR/uploads（而不是系统临时目录，进程或容器重启后仍在），
+upload_journal 记录暂存文件位置与持有该上传的进程（owner）。
+每个进程在整个生命周期内持有 uploads/.owner-<owner>.lock 的文件锁：能拿到某个 owner 的锁，
+说明该进程已经退出，它留下的上传日志可以被接管；pid 被新进程复用也不会误判。
+"""
+
+import logging
+import os
+import secrets
+import tempfile
+
+from .. import database
+from .cluster import BotLeaderLock
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_STAGING_DIR = os.path.join(database.DATA_DIR, "uploads")
+OWNER_ID = f"{os.getpid()}-{secrets.token_hex(4)}"
+
+_OWNER_LOCK_PREFIX = ".owner-"
+_OWNER_LOCK_SUFFIX = ".lock"
+_owner_lock: BotLeaderLock | None = None
+
+
+def _owner_lock_path(owner: str) -> str:
+    return os.path.join(UPLOAD_STAGING_DIR, f"{_OWNER_LOCK_PREFIX}{owner}{_OWNER_LOCK_SUFFIX}")
+
+
+def upload_owner_id() -> str:
+    """本进程的 owner 标识；首次调用时创建暂存目录并持有 owner 锁。"""
+    global _owner_lock
+    if _owner_lock is None:
+        os.makedirs(UPLOAD_STAGING_DIR, exist_ok=True)
+        lock = BotLeaderLock(_owner_lock_path(OWNER_ID))
+        lock.try_acquire()
+        _owner_lock = lock
+    return OWNER_ID
+
+
+def is_owner_alive(owner: str) -> bool:
+    """owner 对应的进程是否仍在运行（其 owner 锁仍被持有）。"""
+    if owner == OWNER_ID:
+        return True
+    path = _owner_lock_path(owner)
+    if not os.path.exists(path):
+        return False
+    probe = BotLeaderLock(path)
+    if not probe.try_acquire():
+        return True
+    probe.release()
+    return False
+
+
+def create_staged_file(filename: str):
+    """在暂存目录中创建上传文件（文件名以 owner 开头，便于清理已退出进程留下的文件）。"""
+    owner = upload_owner_id()
+    return tempfile.NamedTemporaryFile(
+        dir=UPLOAD_STAGING_DIR,
+        prefix=f"{owner}_",
+        suffix=f"_{os.path.basename(filename or '')}",
+        delete=False,
+    )
+
+
+def remove_staged_file(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning("删除暂存文件失败: %s (%s)", path, e)
+
+
+def sweep_staging_dir(journaled_paths: set[str]) -> int:
+    """
+    删除已退出进程留下的、不属于任何上传日志的暂存文件及其 owner 锁文件，返回删除的暂存文件数。
+    """
+    try:
+        entries = os.listdir(UPLOAD_STAGING_DIR)
+    except FileNotFoundError:
+        return 0
+
+    alive: dict[str, bool] = {}
+
+    def owner_alive(owner: str) -> bool:
+        if owner not in alive:
+            alive[owner] = is_owner_alive(owner)
+        return alive[owner]
+
+    removed = 0
+    lock_files = []
+    for name in entries:
+        path = os.path.join(UPLOAD_STAGING_DIR, name)
+        if name.startswith(_OWNER_LOCK_PREFIX):
+            lock_files.append((name[len(_OWNER_LOCK_PREFIX):-len(_OWNER_LOCK_SUFFIX)], path))
+            continue
+        owner = name.split("_", 1)[0]
+        if path in journaled_paths or owner_alive(owner):
+            continue
+        remove_staged_file(path)
+        removed += 1
+
+    journaled_owners = {os.path.basename(p).split("_", 1)[0] for p in journaled_paths}
+    for owner, path in lock_files:
+        if owner not in journaled_owners and not owner_alive(owner):
+            remove_staged_file(path)
+    return removed
@@ -1,9 +1,16 @@
 import logging
+import base64
+import functools
 import os
 import sqlite3
 import threading
 import string
 import random
+import time
+
+from .core.filetypes import FILE_CATEGORIES, classify_file
+from .core.metrics import db_query_seconds
+from .core.tracing import add_span
 
 DATA_DIR = os.getenv("DATA_DIR", "app/data")
 os.makedirs(DATA_DIR, exist_ok=True)
@@ -14,6 +21,23 @@ logger = logging.getLogger(__name__)
 # 使用线程锁来确保多线程环境下的数据库访问安全
 db_lock = threading.Lock()
 
+def _timed(func):
+    """记录数据库操作耗时（含等待 db_lock），按函数名导出到 /metrics，并写入当前请求的追踪。"""
+    histogram = db_query_seconds.labels(func.__name__)
+    span_name = f"db.{func.__name__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            histogram.observe(elapsed)
+            add_span(span_name, started, elapsed)
+
+    return wrapper
+
 def get_db_connection() -> sqlite3.Connection:
     """获取数据库连接。"""
     conn = sqlite3.connect(DATABASE_URL, check_same_thread=False)
@@ -30,6 +54,12 @@ def init_db() -> None:
         conn = get_db_connection()
         try:
             cursor = conn.cursor()
+            # WAL 模式允许多个进程（多 worker）并发读写，该设置会持久化到数据库文件
+            try:
+                cursor.execute("PRAGMA journal_mode=WAL")
+            except Exception as e:
+                logger.error("Migration warning: Failed to enable WAL mode: %s", e)
+
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS files (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -39,7 +69,10 @@ def init_db() -> None:
                     upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     short_id TEXT UNIQUE,
                     channel_name TEXT,
-                    tags TEXT
+                    tags TEXT,
+                    mime_type TEXT,
+                    category TEXT,
+                    previewable INTEGER
                 );
             """)
             
@@ -86,11 +119,40 @@ def init_db() -> None:
                 except Exception as e:
                     logger.error("Migration warning: Failed to add tags column: %s", e)
 
+            # 迁移: 补充 mime_type / category / previewable 列
+            for column, column_type in (("mime_type", "TEXT"), ("category", "TEXT"), ("previewable", "INTEGER")):
+                if column not in columns:
+                    logger.info("Migrating database: adding %s column...", column)
+                    try:
+                        cursor.execute(f"ALTER TABLE files ADD COLUMN {column} {column_type}")
+                    except Exception as e:
+                        logger.error("Migration warning: Failed to add %s column: %s", column, e)
+
+            # 为历史数据补算文件类型
+            cursor.execute("SELECT id, filename FROM files WHERE category IS NULL")
+            untyped = cursor.fetchall()
+            if untyped:
+                logger.info("Migrating database: backfilling file types for %s rows...", len(untyped))
+                updates = []
+                for row_id, filename in untyped:
+                    file_type = classify_file(filename or "")
+                    updates.append((file_type.mime_type, file_type.category, int(file_type.previewable), row_id))
+                cursor.executemany(
+                    "UPDATE files SET mime_type = ?, category = ?, previewable = ? WHERE id = ?", updates
+                )
+
             # 确保唯一索引存在（幂等操作）
             try:
                 cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_files_short_id ON files(short_id)")
             except Exception as e:
                 logger.error("Migration warning: Failed to create index idx_files_short_id: %s", e)
+
+            # 列表分页按 (upload_date, id) 倒序做游标翻页
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_upload_date ON files(upload_date DESC, id DESC)")
+            # 按类型筛选（图床页面、类型过滤）时走该索引，同样按上传时间倒序
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_files_category ON files(category, upload_date DESC, id DESC)"
+            )
             
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS app_settings (
@@ -104,11 +166,167 @@ def init_db() -> None:
             """)
             # 确保存在单行设置记录
             cursor.execute("INSERT OR IGNORE INTO app_settings (id) VALUES (1)")
+
+            # 通用键值状态表（变更日志水位线等）
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS app_state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+            """)
+
+            # 文件变更日志：供客户端按版本号增量同步
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'file_changes'")
+            changes_table_exists = cursor.fetchone() is not None
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS file_changes (
+                    version INTEGER PRIMARY KEY AUTOINCREMENT,
+                    action TEXT NOT NULL,
+                    file_id TEXT NOT NULL,
+                    short_id TEXT,
+                    filename TEXT,
+                    filesize INTEGER,
+                    upload_date TIMESTAMP,
+                    channel_name TEXT,
+                    tags TEXT,
+                    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_file_changes_file_id ON file_changes(file_id)")
+            if not changes_table_exists:
+                # 迁移: 为已有文件补写 add 记录，使 since=0 的增量同步也能得到完整列表
+                logger.info("Migrating database: backfilling file_changes...")
+                cursor.execute(
+                    """
+                    INSERT INTO file_changes (action, file_id, short_id, filename, filesize, upload_date, channel_name, tags)
+                    SELECT 'add', file_id, short_id, filename, filesize, upload_date, channel_name, tags
+                    FROM files ORDER BY upload_date, id
+                    """
+                )
+
+            # 跨进程事件日志：多 worker 部署时各进程通过轮询该表互相转发事件
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS event_log (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+
+            # 上传日志：记录暂存文件位置与每个已发送的分块，进程重启后据此续传或清理
+            # file_id 为最终写入 files 表的复合 ID（清单或单个文件消息），发送成功后才写入
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS upload_journal (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    staged_path TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    filesize INTEGER NOT NULL,
+                    chunk_size INTEGER NOT NULL,
+                    channel_name TEXT NOT NULL,
+                    owner TEXT NOT NULL,
+                    file_id TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS upload_journal_parts (
+                    upload_id INTEGER NOT NULL,
+                    part_number INTEGER NOT NULL,
+                    message_id INTEGER NOT NULL,
+                    file_id TEXT NOT NULL,
+                    PRIMARY KEY (upload_id, part_number)
+                );
+            """)
+
+            # 多 worker 部署时各进程的指标快照，/metrics 汇总后导出；process_id 为 'archive' 的行保存已退出进程的累计值
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS metrics_snapshots (
+                    process_id TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+
+            # 消息台账：已发送但尚未被 files 表引用的消息（上传中的分块与文件消息、删除失败的残留），
+            # 孤儿回收器据此清理；manifest_message_id 为分块所属清单的消息 ID（清单发送前为 NULL）
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS message_ledger (
+                    channel_name TEXT NOT NULL,
+                    message_id INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    manifest_message_id INTEGER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (channel_name, message_id)
+                );
+            """)
             conn.commit()
             logger.info("数据库已成功初始化")
         finally:
             conn.close()
 
+def _log_file_change(cursor: sqlite3.Cursor, action: str, file_id: str) -> None:
+    """
+    在当前事务中追加一条文件变更记录。
+
+    add / tags 记录携带变更后的完整行（客户端按 upsert 处理），
+    delete 记录须在删除前写入。
+    """
+    cursor.execute(
+        """
+        INSERT INTO file_changes (action, file_id, short_id, filename, filesize, upload_date, channel_name, tags)
+        SELECT ?, file_id, short_id, filename, filesize, upload_date, channel_name, tags
+        FROM files WHERE file_id = ?
+        """,
+        (action, file_id),
+    )
+
+def _insert_file_row(
+    cursor: sqlite3.Cursor, filename: str, file_id: str, filesize: int, channel_name: str | None
+) -> str:
+    """
+    在当前事务中插入一条文件记录（不提交）。
+    如果 file_id 已存在，则返回已有记录的 short_id。
+    """
+    # 归一化 channel_name，允许为 None
+    ch = (channel_name or "").strip() or None
+    tags = None  # 初始无标签
+    file_type = classify_file(filename)
+
+    # 尝试生成唯一的 short_id
+    for _ in range(5):
+        short_id = generate_short_id()
+        try:
+            cursor.execute(
+                "INSERT INTO files (filename, file_id, filesize, short_id, channel_name, tags, "
+                "mime_type, category, previewable) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    filename, file_id, filesize, short_id, ch, tags,
+                    file_type.mime_type, file_type.category, int(file_type.previewable),
+                )
+            )
+            _log_file_change(cursor, "add", file_id)
+            return short_id
+        except sqlite3.IntegrityError as e:
+            if "short_id" in str(e):
+                continue  # 冲突重试
+            # 可能是 file_id 冲突，如果是这样，查询现有的 short_id
+            cursor.execute("SELECT short_id FROM files WHERE file_id = ?", (file_id,))
+            row = cursor.fetchone()
+            if row and row[0]:
+                return row[0]
+            # 如果有记录但没 short_id (旧数据)，更新它
+            if row:
+                short_id = generate_short_id()
+                cursor.execute("UPDATE files SET short_id = ? WHERE file_id = ?", (short_id, file_id))
+                _log_file_change(cursor, "add", file_id)
+                return short_id
+            raise e
+
+    # 如果多次重试失败（极低概率），抛错
+    raise Exception("Failed to generate unique short_id")
+
+@_timed
 def add_file_metadata(filename: str, file_id: str, filesize: int, channel_name: str | None = None) -> str:
     """
     向数据库中添加一个新的文件元数据记录。
@@ -119,44 +337,53 @@ def add_file_metadata(filename: str, file_id: str, filesize: int, channel_name:
         conn = get_db_connection()
         try:
             cursor = conn.cursor()
+            short_id = _insert_file_row(cursor, filename, file_id, filesize, channel_name)
+            conn.commit()
+            logger.info("已添加文件元数据: %s, short_id: %s, channel: %s", filename, short_id, channel_name)
+            return short_id
+        finally:
+            conn.close()
 
-            # 归一化 channel_name，允许为 None
-            ch = (channel_name or "").strip() or None
-            tags = None  # 初始无标签
-            
-            # 尝试生成唯一的 short_id
-            for _ in range(5):
-                short_id = generate_short_id()
+@_timed
+def add_files_metadata_batch(rows: list[dict]) -> list[str | None]:
+    """
+    在同一个事务中批量添加文件元数据，只提交（fsync）一次。
+
+    rows 中每项包含 filename / file_id / filesize / channel_name。
+    返回: 与 rows 一一对应的 short_id；单行失败时对应位置为 None，不影响其他行。
+    """
+    if not rows:
+        return []
+
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            short_ids: list[str | None] = []
+            for row in rows:
                 try:
-                    cursor.execute(
-                        "INSERT INTO files (filename, file_id, filesize, short_id, channel_name, tags) VALUES (?, ?, ?, ?, ?, ?)",
-                        (filename, file_id, filesize, short_id, ch, tags)
+                    short_ids.append(
+                        _insert_file_row(
+                            cursor,
+                            row["filename"],
+                            row["file_id"],
+                            row["filesize"],
+                            row.get("channel_name"),
+                        )
                     )
-                    conn.commit()
-                    logger.info("已添加文件元数据: %s, short_id: %s, channel: %s", filename, short_id, ch)
-                    return short_id
-                except sqlite3.IntegrityError as e:
-                    if "short_id" in str(e):
-                        continue  # 冲突重试
-                    # 可能是 file_id 冲突，如果是这样，查询现有的 short_id
-                    cursor.execute("SELECT short_id FROM files WHERE file_id = ?", (file_id,))
-                    row = cursor.fetchone()
-                    if row and row[0]:
-                        return row[0]
-                    # 如果有记录但没 short_id (旧数据)，更新它
-                    if row:
-                        short_id = generate_short_id()
-                        cursor.execute("UPDATE files SET short_id = ? WHERE file_id = ?", (short_id, file_id))
-                        conn.commit()
-                        return short_id
-                    raise e
-            
-            # 如果多次重试失败（极低概率），抛错
-            raise Exception("Failed to generate unique short_id")
-            
+                except Exception as e:
+                    logger.error("批量写入文件元数据失败: %s: %s", row.get("filename"), e)
+                    short_ids.append(None)
+            conn.commit()
+            logger.info("已批量添加文件元数据: %s 条", len(rows))
+            return short_ids
+        except Exception:
+            conn.rollback()
+            raise
         finally:
             conn.close()
 
+@_timed
 def get_all_files() -> list[dict]:
     """从数据库中获取所有文件的元数据。"""
     with db_lock:
@@ -175,6 +402,133 @@ def get_all_files() -> list[dict]:
         finally:
             conn.close()
 
+DEFAULT_PAGE_SIZE = 100
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+@_timed
+def get_files_page(
+    *,
+    after: tuple[str, int] | None = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    search: str | None = None,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    size_min: int | None = None,
+    size_max: int | None = None,
+    categories: list[str] | None = None,
+    sources: list[str] | None = None,
+    tags: list[str] | None = None,
+) -> tuple[list[dict], tuple[str, int] | None]:
+    """
+    按上传时间倒序分页获取文件，过滤条件与前端筛选面板一致。
+
+    after 为上一页最后一行的 (upload_date, id)，使用键集分页，翻页开销与页码无关。
+    返回: (本页文件列表, 下一页游标；没有更多数据时为 None)。
+    """
+    where, params = [], []
+    if after is not None:
+        where.append("(upload_date < ? OR (upload_date = ? AND id < ?))")
+        params.extend([after[0], after[0], after[1]])
+    if search:
+        term = f"%{_escape_like(search.lower())}%"
+        where.append(
+            "(lower(filename) LIKE ? ESCAPE '\\' OR lower(channel_name) LIKE ? ESCAPE '\\' "
+            "OR lower(tags) LIKE ? ESCAPE '\\')"
+        )
+        params.extend([term, term, term])
+    if date_from:
+        where.append("substr(upload_date, 1, 10) >= ?")
+        params.append(date_from)
+    if date_to:
+        where.append("substr(upload_date, 1, 10) <= ?")
+        params.append(date_to)
+    if size_min is not None:
+        where.append("filesize >= ?")
+        params.append(size_min)
+    if size_max is not None:
+        where.append("filesize <= ?")
+        params.append(size_max)
+    if categories:
+        categories = [c for c in categories if c in FILE_CATEGORIES]
+        if not categories:
+            return [], None
+        where.append("category IN (" + ",".join("?" for _ in categories) + ")")
+        params.extend(categories)
+    if sources:
+        where.append("channel_name IN (" + ",".join("?" for _ in sources) + ")")
+        params.extend(sources)
+    if tags:
+        # tags 以逗号分隔存储，前后补逗号后按整项匹配
+        where.append(
+            "(" + " OR ".join("(',' || lower(tags) || ',') LIKE ? ESCAPE '\\'" for _ in tags) + ")"
+        )
+        params.extend(f"%,{_escape_like(t.lower())},%" for t in tags)
+
+    sql = "SELECT id, filename, file_id, filesize, upload_date, short_id, channel_name, tags, category FROM files"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY upload_date DESC, id DESC LIMIT ?"
+    # 多取一行用于判断是否还有下一页
+    params.append(limit + 1)
+
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            rows = [dict(row) for row in conn.execute(sql, params).fetchall()]
+        finally:
+            conn.close()
+
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = (rows[-1]["upload_date"], rows[-1]["id"])
+    for row in rows:
+        row.pop("id")
+    return rows, next_after
+
+
+def encode_page_cursor(after: tuple[str, int] | None) -> str | None:
+    """将 (upload_date, id) 编码为不透明的分页游标。"""
+    if after is None:
+        return None
+    raw = f"{after[0]}|{after[1]}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_page_cursor(cursor: str) -> tuple[str, int]:
+    """解析分页游标，格式错误时抛出 ValueError。"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        upload_date, _, row_id = raw.rpartition("|")
+        return upload_date, int(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("invalid cursor") from e
+
+
+@_timed
+def get_file_facets() -> dict:
+    """返回筛选面板可选的来源频道与标签（去重排序）。"""
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            sources = [
+                row[0]
+                for row in conn.execute(
+                    "SELECT DISTINCT channel_name FROM files WHERE channel_name IS NOT NULL AND channel_name != ''"
+                )
+            ]
+            tag_rows = conn.execute("SELECT DISTINCT tags FROM files WHERE tags IS NOT NULL AND tags != ''")
+            tags = {t.strip() for (raw,) in tag_rows for t in raw.split(",") if t.strip()}
+        finally:
+            conn.close()
+    return {"sources": sorted(sources), "tags": sorted(tags)}
+
+
+@_timed
 def get_file_by_id(identifier: str) -> dict | None:
     """通过 file_id 或 short_id 从数据库中获取单个文件元数据。"""
     with db_lock:
@@ -183,8 +537,8 @@ def get_file_by_id(identifier: str) -> dict | None:
             cursor = conn.cursor()
             # 优先匹配 short_id，然后 file_id
             cursor.execute(
-                "SELECT filename, filesize, upload_date, file_id, short_id, channel_name, tags "
-                "FROM files WHERE short_id = ? OR file_id = ?",
+                "SELECT filename, filesize, upload_date, file_id, short_id, channel_name, tags, "
+                "mime_type, previewable FROM files WHERE short_id = ? OR file_id = ?",
                 (identifier, identifier),
             )
             result = cursor.fetchone()
@@ -197,11 +551,14 @@ def get_file_by_id(identifier: str) -> dict | None:
                     "short_id": result["short_id"],
                     "channel_name": result["channel_name"],
                     "tags": result["tags"],
+                    "mime_type": result["mime_type"],
+                    "previewable": bool(result["previewable"]),
                 }
             return None
         finally:
             conn.close()
 
+@_timed
 def delete_file_metadata(file_id: str) -> bool:
     """
     根据 file_id 从数据库中删除文件元数据。
@@ -211,6 +568,7 @@ def delete_file_metadata(file_id: str) -> bool:
         conn = get_db_connection()
         try:
             cursor = conn.cursor()
+            _log_file_change(cursor, "delete", file_id)
             cursor.execute("DELETE FROM files WHERE file_id = ?", (file_id,))
             conn.commit()
             # cursor.rowcount 会返回受影响的行数
@@ -218,6 +576,7 @@ def delete_file_metadata(file_id: str) -> bool:
         finally:
             conn.close()
 
+@_timed
 def delete_file_by_message_id(message_id: int) -> str | None:
     """
     根据 message_id 从数据库中删除文件元数据，并返回其 file_id。
@@ -235,6 +594,7 @@ def delete_file_by_message_id(message_id: int) -> str | None:
             if result:
                 file_id_to_delete = result[0]
                 # 然后，删除这条记录
+                _log_file_change(cursor, "delete", file_id_to_delete)
                 cursor.execute("DELETE FROM files WHERE file_id = ?", (file_id_to_delete,))
                 conn.commit()
                 logger.info("已从数据库中删除与消息ID %s 关联的文件: %s", message_id, file_id_to_delete)
@@ -242,6 +602,7 @@ def delete_file_by_message_id(message_id: int) -> str | None:
         finally:
             conn.close()
 
+@_timed
 def get_app_settings_from_db() -> dict:
     """获取应用设置（从数据库单行配置）。"""
     with db_lock:
@@ -262,6 +623,7 @@ def get_app_settings_from_db() -> dict:
         finally:
             conn.close()
 
+@_timed
 def save_app_settings_to_db(payload: dict) -> None:
     """保存应用设置到数据库（单行更新）。"""
     with db_lock:
@@ -294,6 +656,12 @@ def save_app_settings_to_db(payload: dict) -> None:
         finally:
             conn.close()
 
+    # 配置已变更：刷新内存中的配置快照（必须在释放 db_lock 之后进行）
+    from .core.config import reload_app_settings
+
+    reload_app_settings()
+
+@_timed
 def update_file_tags(file_id: str, tags: list[str] | None) -> bool:
     """
     更新指定文件的标签（以逗号分隔存储在 tags 字段中）。
@@ -323,8 +691,11 @@ def update_file_tags(file_id: str, tags: list[str] | None) -> bool:
                 "UPDATE files SET tags = ? WHERE file_id = ?",
                 (tags_str, file_id),
             )
+            updated = cursor.rowcount > 0
+            if updated:
+                _log_file_change(cursor, "tags", file_id)
             conn.commit()
-            return cursor.rowcount > 0
+            return updated
         finally:
             conn.close()
 
@@ -340,3 +711,497 @@ def reset_app_settings_in_db() -> None:
             "BASE_URL": None,
         }
     )
+
+
+@_timed
+def append_event(kind: str, payload: str) -> int:
+    """向跨进程事件日志追加一条事件，返回其自增 ID。"""
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO event_log (kind, payload) VALUES (?, ?)", (kind, payload))
+            conn.commit()
+            return cursor.lastrowid
+        finally:
+            conn.close()
+
+
+@_timed
+def get_events_after(last_id: int, limit: int = 500) -> list[tuple[int, str, str]]:
+    """按 ID 顺序获取 last_id 之后的事件，返回 (id, kind, payload) 列表。"""
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id, kind, payload FROM event_log WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, limit),
+            )
+            return [(row[0], row[1], row[2]) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+
+@_timed
+def get_last_event_id() -> int:
+    """获取事件日志中最新一条事件的 ID（为空时为 0）。"""
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT MAX(id) FROM event_log")
+            row = cursor.fetchone()
+            return row[0] or 0
+        finally:
+            conn.close()
+
+
+@_timed
+def prune_event_log(keep_seconds: int = 600) -> int:
+    """删除早于 keep_seconds 秒的事件，返回删除的行数。"""
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "DELETE FROM event_log WHERE created_at < datetime('now', ?)",
+                (f"-{int(keep_seconds)} seconds",),
+            )
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+
+def _get_changes_watermark(cursor: sqlite3.Cursor) -> int:
+    cursor.execute("SELECT value FROM app_state WHERE key = 'file_changes_watermark'")
+    row = cursor.fetchone()
+    return int(row[0]) if row and row[0] else 0
+
+
+def _get_latest_change_version(cursor: sqlite3.Cursor) -> int:
+    # sqlite_sequence 在记录被压缩删除后仍保留最大版本号
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'file_changes'")
+    row = cursor.fetchone()
+    return row[0] if row and row[0] else 0
+
+
+@_timed
+def get_files_version() -> int:
+    """获取文件列表当前的版本号（最新一条变更记录的版本）。"""
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            return _get_latest_change_version(conn.cursor())
+        finally:
+            conn.close()
+
+
+@_timed
+def get_file_changes(since: int, limit: int = 1000) -> dict:
+    """
+    获取版本号大于 since 的文件变更。
+
+    返回:
+    - version: 客户端下次请求应使用的 since
+    - reset: since 之后的部分变更已被压缩清理（或 since 无效），客户端需全量重新同步
+    - has_more: 是否还有更多变更（按 version 继续请求）
+    - changes: 变更列表，action 为 add / tags（携带完整行，按 upsert 处理）或 delete
+    """
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            latest = _get_latest_change_version(cursor)
+            if since < _get_changes_watermark(cursor) or since > latest:
+                return {"version": latest, "reset": True, "has_more": False, "changes": []}
+
+            cursor.execute(
+                "SELECT version, action, file_id, short_id, filename, filesize, upload_date, channel_name, tags "
+                "FROM file_changes WHERE version > ? ORDER BY version LIMIT ?",
+                (since, limit + 1),
+            )
+            rows = [dict(row) for row in cursor.fetchall()]
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            version = rows[-1]["version"] if has_more else latest
+            return {"version": version, "reset": False, "has_more": has_more, "changes": rows}
+        finally:
+            conn.close()
+
+
+@_timed
+def compact_file_changes(tombstone_retention_days: int = 30) -> int:
+    """
+    压缩文件变更日志，返回删除的记录数。
+
+    1. 同一文件只保留最新一条记录（add / tags 携带完整行，delete 覆盖之前的记录），
+       这不改变任何 since 的同步结果；
+    2. 清理超过保留期的 delete 记录，并把水位线推进到被清理的最大版本号，
+       since 早于水位线的客户端会收到 reset。
+    """
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                DELETE FROM file_changes
+                WHERE version NOT IN (SELECT MAX(version) FROM file_changes GROUP BY file_id)
+                """
+            )
+            removed = cursor.rowcount
+
+            cursor.execute(
+                "SELECT MAX(version) FROM file_changes WHERE action = 'delete' AND changed_at < datetime('now', ?)",
+                (f"-{int(tombstone_retention_days)} days",),
+            )
+            row = cursor.fetchone()
+            if row and row[0]:
+                cursor.execute(
+                    "DELETE FROM file_changes WHERE action = 'delete' AND version <= ?",
+                    (row[0],),
+                )
+                removed += cursor.rowcount
+                watermark = max(row[0], _get_changes_watermark(cursor))
+                cursor.execute(
+                    "INSERT OR REPLACE INTO app_state (key, value) VALUES ('file_changes_watermark', ?)",
+                    (str(watermark),),
+                )
+            conn.commit()
+            return removed
+        finally:
+            conn.close()
+
+
+@_timed
+def create_upload_journal(
+    staged_path: str, filename: str, filesize: int, chunk_size: int, channel_name: str, owner: str
+) -> int:
+    """为一次上传创建日志记录，返回其 ID。"""
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO upload_journal (staged_path, filename, filesize, chunk_size, channel_name, owner) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (staged_path, filename, filesize, chunk_size, channel_name, owner),
+            )
+            conn.commit()
+            return cursor.lastrowid
+        finally:
+            conn.close()
+
+
+@_timed
+def add_upload_journal_part(upload_id: int, part_number: int, message_id: int, file_id: str) -> None:
+    """记录一个已发送成功的分块（分块消息发送后立即调用），同时记入消息台账。"""
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO upload_journal_parts (upload_id, part_number, message_id, file_id) "
+                "VALUES (?, ?, ?, ?)",
+                (upload_id, part_number, message_id, file_id),
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO message_ledger (channel_name, message_id, kind) "
+                "SELECT channel_name, ?, 'chunk' FROM upload_journal WHERE id = ?",
+                (message_id, upload_id),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+
+@_timed
+def set_upload_journal_file_id(upload_id: int, file_id: str) -> None:
+    """
+    记录最终的复合 ID（清单或单个文件消息已发送，只差写入 files 表）。
+
+    该消息同时记入消息台账，已发送的分块标记为属于该清单。
+    """
+    message_id = int(file_id.split(":", 1)[0])
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE upload_journal SET file_id = ? WHERE id = ?", (file_id, upload_id))
+            cursor.execute(
+                "INSERT OR IGNORE INTO message_ledger (channel_name, message_id, kind) "
+                "SELECT channel_name, ?, 'file' FROM upload_journal WHERE id = ?",
+                (message_id, upload_id),
+            )
+            cursor.execute(
+                """
+                UPDATE message_ledger SET manifest_message_id = ?
+                WHERE channel_name = (SELECT channel_name FROM upload_journal WHERE id = ?)
+                  AND message_id IN (SELECT message_id FROM upload_journal_parts WHERE upload_id = ?)
+                """,
+                (message_id, upload_id, upload_id),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def _journal_from_row(row: sqlite3.Row, parts: list[sqlite3.Row]) -> dict:
+    journal = dict(row)
+    journal["parts"] = {part["part_number"]: (part["message_id"], part["file_id"]) for part in parts}
+    return journal
+
+
+@_timed
+def get_upload_journals() -> list[dict]:
+    """
+    获取所有未完成的上传日志（按创建顺序）。
+
+    每条记录的 parts 为 {part_number: (message_id, file_id)}。
+    """
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM upload_journal ORDER BY id")
+            rows = cursor.fetchall()
+            cursor.execute("SELECT * FROM upload_journal_parts ORDER BY upload_id, part_number")
+            parts_by_upload: dict[int, list[sqlite3.Row]] = {}
+            for part in cursor.fetchall():
+                parts_by_upload.setdefault(part["upload_id"], []).append(part)
+            return [_journal_from_row(row, parts_by_upload.get(row["id"], [])) for row in rows]
+        finally:
+            conn.close()
+
+
+@_timed
+def claim_upload_journal(upload_id: int, old_owner: str, new_owner: str) -> bool:
+    """将日志转移给新的持有进程；仅当持有者仍是 old_owner 时成功，多个 worker 同时接管时只有一个成功。"""
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE upload_journal SET owner = ? WHERE id = ? AND owner = ?",
+                (new_owner, upload_id, old_owner),
+            )
+            conn.commit()
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+
+@_timed
+def complete_upload_journal(upload_id: int) -> None:
+    """上传已写入 files 表：从消息台账中移除该上传的所有消息，然后删除日志。"""
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                DELETE FROM message_ledger
+                WHERE channel_name = (SELECT channel_name FROM upload_journal WHERE id = ?)
+                  AND (
+                    message_id IN (SELECT message_id FROM upload_journal_parts WHERE upload_id = ?)
+                    OR message_id = (
+                        SELECT CAST(substr(file_id, 1, instr(file_id, ':') - 1) AS INTEGER)
+                        FROM upload_journal WHERE id = ?
+                    )
+                  )
+                """,
+                (upload_id, upload_id, upload_id),
+            )
+            cursor.execute("DELETE FROM upload_journal_parts WHERE upload_id = ?", (upload_id,))
+            cursor.execute("DELETE FROM upload_journal WHERE id = ?", (upload_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+
+@_timed
+def delete_upload_journal(upload_id: int) -> None:
+    """
+    放弃上传后删除日志及其分块记录。
+
+    已发送的消息保留在消息台账中（删除成功的消息已由 remove_ledger_messages 移除），由孤儿回收器清理。
+    """
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM upload_journal_parts WHERE upload_id = ?", (upload_id,))
+            cursor.execute("DELETE FROM upload_journal WHERE id = ?", (upload_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+
+@_timed
+def add_ledger_messages(
+    channel_name: str, message_ids: list[int], kind: str, manifest_message_id: int | None = None
+) -> None:
+    """将消息记入消息台账（例如删除失败的分块与文件消息），已存在的记录保持不变。"""
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO message_ledger (channel_name, message_id, kind, manifest_message_id) "
+                "VALUES (?, ?, ?, ?)",
+                [(channel_name, message_id, kind, manifest_message_id) for message_id in message_ids],
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+
+@_timed
+def remove_ledger_messages(channel_name: str, message_ids: list[int]) -> None:
+    """消息已删除（或已被 files 表引用）后从消息台账中移除。"""
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            conn.executemany(
+                "DELETE FROM message_ledger WHERE channel_name = ? AND message_id = ?",
+                [(channel_name, message_id) for message_id in message_ids],
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+
+# 复合 ID 以 "<message_id>:" 开头；按 [id:, id;) 的范围比较可以走 file_id 上的唯一索引
+_REFERENCED_SQL = """
+    EXISTS (SELECT 1 FROM files WHERE file_id >= ({id} || ':') AND file_id < ({id} || ';'))
+    OR EXISTS (SELECT 1 FROM upload_journal WHERE file_id >= ({id} || ':') AND file_id < ({id} || ';'))
+"""
+
+
+@_timed
+def scan_message_ledger(after: tuple[str, int] | None, min_age_seconds: int, limit: int) -> list[dict]:
+    """
+    按 (channel_name, message_id) 顺序返回游标 after 之后、记入台账超过 min_age_seconds 秒的最多 limit 条消息。
+
+    每条记录的 state：
+    - referenced：自身或所属清单被 files 表 / 上传日志引用（不是孤儿，可以从台账移除）；
+    - uploading：属于未完成的上传日志；
+    - orphan：没有任何引用，可以删除。
+
+    files 表中的频道标识格式可能与台账不同，因此引用判断不区分频道：
+    不同频道的消息 ID 碰巧相同时宁可保留，也不误删。
+    """
+    referenced = " OR ".join([
+        _REFERENCED_SQL.format(id="m.message_id"),
+        "(m.manifest_message_id IS NOT NULL AND (" + _REFERENCED_SQL.format(id="m.manifest_message_id") + "))",
+    ])
+    channel, message_id = after or ("", 0)
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"""
+                SELECT m.channel_name, m.message_id, m.kind, m.created_at,
+                    CASE
+                        WHEN {referenced} THEN 'referenced'
+                        WHEN EXISTS (
+                            SELECT 1 FROM upload_journal_parts p JOIN upload_journal j ON j.id = p.upload_id
+                            WHERE j.channel_name = m.channel_name AND p.message_id = m.message_id
+                        ) THEN 'uploading'
+                        ELSE 'orphan'
+                    END AS state
+                FROM message_ledger m
+                WHERE (m.channel_name, m.message_id) > (?, ?)
+                  AND m.created_at < datetime('now', ?)
+                ORDER BY m.channel_name, m.message_id
+                LIMIT ?
+                """,
+                (channel, message_id, f"-{int(min_age_seconds)} seconds", limit),
+            )
+            return [dict(row) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+
+@_timed
+def count_ledger_messages() -> int:
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM message_ledger").fetchone()[0]
+        finally:
+            conn.close()
+
+
+@_timed
+def get_state_value(key: str) -> str | None:
+    """读取 app_state 中的值（不存在时返回 None）。"""
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            row = conn.execute("SELECT value FROM app_state WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else None
+        finally:
+            conn.close()
+
+
+@_timed
+def set_state_value(key: str, value: str | None) -> None:
+    """写入 app_state 中的值；value 为 None 时删除该键。"""
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            if value is None:
+                conn.execute("DELETE FROM app_state WHERE key = ?", (key,))
+            else:
+                conn.execute("INSERT OR REPLACE INTO app_state (key, value) VALUES (?, ?)", (key, value))
+            conn.commit()
+        finally:
+            conn.close()
+
+
+@_timed
+def save_metrics_snapshot(process_id: str, payload: str) -> None:
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO metrics_snapshots (process_id, payload, updated_at) "
+                "VALUES (?, ?, CURRENT_TIMESTAMP)",
+                (process_id, payload),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+
+@_timed
+def get_metrics_snapshots() -> list[tuple[str, str]]:
+    """返回所有 (process_id, payload)。"""
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            return [tuple(row) for row in conn.execute("SELECT process_id, payload FROM metrics_snapshots")]
+        finally:
+            conn.close()
+
+
+@_timed
+def replace_metrics_archive(archive_id: str, payload: str, folded_ids: list[str]) -> None:
+    """在同一事务中写入合并后的归档快照并删除已并入归档的进程快照，汇总值不会重复或丢失。"""
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT OR REPLACE INTO metrics_snapshots (process_id, payload, updated_at) "
+                "VALUES (?, ?, CURRENT_TIMESTAMP)",
+                (archive_id, payload),
+            )
+            cursor.executemany(
+                "DELETE FROM metrics_snapshots WHERE process_id = ?", [(process_id,) for process_id in folded_ids]
+            )
+            conn.commit()
+        finally:
+            conn.close()
@@ -1,43 +1,138 @@
 import asyncio
+import time
+from collections import deque
+
+from .core.config import get_settings
+from .core.filetypes import classify_file
+from .core.metrics import Gauge, registry, sse_resyncs
+
 
 class BroadcastEventBus:
-    def __init__(self, queue_maxsize: int = 200):
-        self._queue_maxsize = queue_maxsize
-        self._subscribers: set[asyncio.Queue[str]] = set()
-        self._lock = asyncio.Lock()
+    """
+    带编号与回放能力的事件总线。
+
+    每个事件分配单调递增的 ID，并保存在有界环形缓冲区中。订阅者不再各自持有队列，
+    而是用游标（最后收到的事件 ID）从缓冲区读取，断线重连时可从 Last-Event-ID 继续；
+    游标已落后于缓冲区时 read_since() 返回 resync=True，由调用方通知客户端全量刷新。
+    """
+
+    def __init__(self, history_size: int = 1000):
+        self._history: deque[tuple[int, str]] = deque(maxlen=max(1, history_size))
+        # 单进程模式下 ID 以启动时刻（微秒）为起点，重启后旧 ID 必然落在缓冲区之外
+        self._last_id = int(time.time() * 1_000_000)
+        # 小于 _floor 的事件已不在缓冲区中，无法回放
+        self._floor = self._last_id
+        self._changed = asyncio.Event()
+        self._subscriber_count = 0
+        self._relay = None
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    @property
+    def subscriber_count(self) -> int:
+        return self._subscriber_count
+
+    def reset(self, last_id: int) -> None:
+        """清空缓冲区并将游标起点设为 last_id（切换到跨进程中继时使用）。"""
+        self._history.clear()
+        self._last_id = last_id
+        self._floor = last_id
+
+    async def subscribe(self) -> int:
+        """登记一个订阅者，返回当前最新事件 ID 作为其初始游标。"""
+        self._subscriber_count += 1
+        return self._last_id
+
+    async def unsubscribe(self) -> None:
+        self._subscriber_count = max(0, self._subscriber_count - 1)
 
-    async def subscribe(self) -> asyncio.Queue[str]:
-        q: asyncio.Queue[str] = asyncio.Queue(maxsize=self._queue_maxsize)
-        async with self._lock:
-            self._subscribers.add(q)
-        return q
+    def attach_relay(self, relay) -> None:
+        """
+        多 worker 模式：事件经跨进程中继（SQLiteEventRelay）发布，
+        由中继回调 deliver() 分发给本进程的订阅者，事件 ID 使用事件日志的全局 ID。
+        """
+        self._relay = relay
+        relay.register("file", self._on_relay_event)
 
-    async def unsubscribe(self, q: asyncio.Queue[str]) -> None:
-        async with self._lock:
-            self._subscribers.discard(q)
+    def detach_relay(self) -> None:
+        self._relay = None
+
+    async def _on_relay_event(self, event_id: int, data: str) -> None:
+        await self.deliver(data, event_id=event_id)
 
     async def publish(self, data: str) -> None:
-        async with self._lock:
-            subscribers = list(self._subscribers)
-
-        for q in subscribers:
-            try:
-                q.put_nowait(data)
-            except asyncio.QueueFull:
-                try:
-                    q.get_nowait()
-                except asyncio.QueueEmpty:
-                    pass
-                try:
-                    q.put_nowait(data)
-                except asyncio.QueueFull:
-                    pass
+        if self._relay is not None:
+            await self._relay.append("file", data)
+            return
+        await self.deliver(data)
+
+    async def deliver(self, data: str, *, event_id: int | None = None) -> int:
+        """将事件写入本进程的回放缓冲区并唤醒所有订阅者，返回事件 ID。"""
+        if event_id is None:
+            event_id = self._last_id + 1
+        if len(self._history) == self._history.maxlen:
+            self._floor = self._history[0][0]
+        self._history.append((event_id, data))
+        self._last_id = event_id
+
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+        return event_id
+
+    def read_since(self, cursor: int) -> tuple[list[tuple[int, str]], bool]:
+        """
+        返回 ID 大于 cursor 的事件列表，以及是否需要全量重新同步。
+
+        cursor 早于缓冲区起点（事件已被淘汰）或大于最新 ID（来自重启前的进程）时需要重新同步。
+        多 worker 模式下 ID 由事件日志全局分配，客户端可能从更新较快的 worker 切换过来，
+        cursor 大于本进程最新 ID 时视为暂无新事件，等待中继追上；重连游标是否有效由 is_ahead() 判断。
+        """
+        if cursor == self._last_id:
+            return [], False
+        if cursor > self._last_id and self._relay is not None:
+            return [], False
+        if cursor < self._floor or cursor > self._last_id:
+            sse_resyncs.inc()
+            return [], True
+        return [item for item in self._history if item[0] > cursor], False
+
+    async def is_ahead(self, cursor: int) -> bool:
+        """
+        重连游标是否超出所有已发布的事件，需要重新同步。
+
+        多 worker 模式下先重新读取事件日志的最新 ID，只有仍大于它时才认为游标无效
+        （例如来自已重建的数据目录）。
+        """
+        if cursor <= self._last_id:
+            return False
+        if self._relay is not None and cursor <= await self._relay.latest_id():
+            return False
+        sse_resyncs.inc()
+        return True
+
+    async def wait(self, cursor: int, timeout: float) -> bool:
+        """等待直到出现 ID 大于 cursor 的事件；超时返回 False。"""
+        if cursor < self._last_id:
+            return True
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
 
     async def put(self, data: str) -> None:
         await self.publish(data)
 
 
-file_update_queue = BroadcastEventBus()
+file_update_queue = BroadcastEventBus(history_size=get_settings().SSE_REPLAY_SIZE)
+
+registry.register(Gauge(
+    "tgstate_sse_subscribers",
+    "当前连接的 SSE 订阅者数量",
+    lambda: file_update_queue.subscriber_count,
+))
 
 
 def build_file_event(
@@ -60,4 +155,5 @@ def build_file_event(
         "short_id": short_id,
         "channel_name": channel_name,
         "tags": tags,
+        "category": classify_file(filename).category if filename else None,
     }
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+
+from . import database
+from .core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class MetadataWriteBehind:
+    """
+    文件元数据的写缓冲队列。
+
+    机器人每收到一个文件就提交一行，连续转发大量文件时会产生大量独立事务（每次一次 fsync）。
+    这里把短时间内到达的写入合并为一个事务：攒满 max_batch 条或距第一条超过
+    flush_interval 秒即提交。submit() 会等待所在批次真正提交后才返回 short_id，
+    因此调用方在拿到结果时数据已经落盘。
+    """
+
+    def __init__(self, max_batch: int = 200, flush_interval: float = 0.2):
+        self._max_batch = max(1, max_batch)
+        self._flush_interval = max(0.0, flush_interval)
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+
+    def _ensure_worker(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        return self._queue
+
+    async def submit(
+        self, *, filename: str, file_id: str, filesize: int, channel_name: str | None = None
+    ) -> str | None:
+        """排队写入一行元数据，返回提交后的 short_id（失败时为 None）。"""
+        queue = self._ensure_worker()
+        fut = asyncio.get_running_loop().create_future()
+        row = {
+            "filename": filename,
+            "file_id": file_id,
+            "filesize": filesize,
+            "channel_name": channel_name,
+        }
+        queue.put_nowait((row, fut))
+        return await fut
+
+    async def _run(self) -> None:
+        queue = self._queue
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+
+            batch = [item]
+            stopping = False
+            deadline = loop.time() + self._flush_interval
+            while len(batch) < self._max_batch:
+                timeout = deadline - loop.time()
+                try:
+                    if timeout <= 0:
+                        item = queue.get_nowait()
+                    else:
+                        item = await asyncio.wait_for(queue.get(), timeout)
+                except (asyncio.QueueEmpty, TimeoutError):
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+            if stopping:
+                return
+
+    async def _flush(self, batch: list) -> None:
+        rows = [row for row, _ in batch]
+        try:
+            short_ids = await asyncio.to_thread(database.add_files_metadata_batch, rows)
+        except Exception as e:
+            logger.error("批量提交文件元数据失败 (%s 条): %s", len(rows), e)
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+
+        for (_, fut), short_id in zip(batch, short_ids, strict=True):
+            if not fut.done():
+                fut.set_result(short_id)
+
+    async def close(self) -> None:
+        """提交队列中剩余的写入并停止后台任务。"""
+        if self._worker is None or self._worker.done():
+            return
+        self._queue.put_nowait(None)
+        await self._worker
+        self._worker = None
+
+
+metadata_writer = MetadataWriteBehind(
+    max_batch=get_settings().INGEST_BATCH_SIZE,
+    flush_interval=get_settings().INGEST_FLUSH_INTERVAL,
+)
@@ -5,9 +5,11 @@ from urllib.parse import quote
 
 from . import database
 from .core.config import get_active_password, get_app_settings
+from .core.static_assets import static_assets
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
+templates.env.globals["static_url"] = static_assets.url_for
 
 
 from .core.channels import split_channel_config, get_primary_channel
@@ -49,8 +51,17 @@ async def main_page(request: Request):
     """
     提供主页。鉴权由中间件处理。
     """
-    files = database.get_all_files()
-    return templates.TemplateResponse("index.html", {"request": request, "files": files, "cfg": _page_cfg(request)})
+    # 只渲染第一页，后续页面由前端滚动时通过 /api/files/page 加载
+    files, next_after = database.get_files_page()
+    return templates.TemplateResponse(
+        "index.html",
+        {
+            "request": request,
+            "files": files,
+            "next_cursor": database.encode_page_cursor(next_after),
+            "cfg": _page_cfg(request),
+        },
+    )
 
 
 @router.get("/settings", response_class=HTMLResponse)
@@ -75,20 +86,19 @@ async def get_password_page(request: Request):
 @router.get("/image_hosting", response_class=HTMLResponse)
 async def image_hosting_page(request: Request):
     """
-    提供图床页面，并展示所有已上传的图片。
+    提供图床页面，并展示已上传的图片。
     权限验证已移至全局中间件。
     """
-    all_files = database.get_all_files()
-    # 定义图片文件后缀
-    image_extensions = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp')
-    # 为模板准备图片数据，只筛选图片文件
-    files = [
-        file for file in all_files 
-        if file["filename"].lower().endswith(image_extensions)
-    ]
+    # 只渲染第一页图片，图片筛选在 SQL 中完成
+    files, next_after = database.get_files_page(categories=["image"])
     return templates.TemplateResponse(
         "image_hosting.html",
-        {"request": request, "files": files, "cfg": _page_cfg(request)},
+        {
+            "request": request,
+            "files": files,
+            "next_cursor": database.encode_page_cursor(next_after),
+            "cfg": _page_cfg(request),
+        },
     )
 
 
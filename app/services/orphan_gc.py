@@ -0,0 +1,208 @@
+"""
+孤儿消息回收。
+
+Bot API 无法列出频道历史，因此回收器只处理消息台账（message_ledger）中的消息：
+上传过程中发送的分块与文件消息在写入 files 表之前都记在台账里，删除失败的分块与主消息也会记入台账。
+台账中超过 ORPHAN_GC_MIN_AGE 秒、既不被 files 表引用也不属于未完成上传的消息即为孤儿，
+按频道用 deleteMessages 批量删除（每次最多 100 条，每分钟最多 ORPHAN_GC_MAX_CALLS_PER_MINUTE 次）。
+
+扫描按 (channel_name, message_id) 顺序进行，每批之后把游标写入 app_state，
+进程重启后从上次的位置继续；只有机器人 leader 进程在后台运行回收。
+"""
+
+import asyncio
+import json
+import logging
+import time
+
+from .. import database
+from ..core.config import get_settings
+from ..core.metrics import orphan_messages
+from .telegram_service import DELETE_MESSAGES_BATCH_SIZE, get_telegram_service_for_channel
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_KEY = "orphan_gc_cursor"
+# 报告中最多列出的孤儿消息数
+MAX_REPORT_SAMPLES = 50
+# 启动后第一轮回收最多等待的秒数
+FIRST_PASS_DELAY = 300
+
+
+class OrphanCollectorBusy(RuntimeError):
+    pass
+
+
+class OrphanCollector:
+    def __init__(self):
+        self._running = False
+        self._task: asyncio.Task | None = None
+        self._last_call = 0.0
+        self.current: dict | None = None
+        self.last_report: dict | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    async def _load_checkpoint(self) -> tuple[str, int] | None:
+        value = await asyncio.to_thread(database.get_state_value, CHECKPOINT_KEY)
+        if not value:
+            return None
+        try:
+            channel_name, message_id = json.loads(value)
+            return str(channel_name), int(message_id)
+        except (ValueError, TypeError):
+            logger.warning("孤儿回收游标无效，从头开始: %s", value)
+            return None
+
+    async def _save_checkpoint(self, cursor: tuple[str, int] | None) -> None:
+        value = json.dumps(list(cursor)) if cursor else None
+        await asyncio.to_thread(database.set_state_value, CHECKPOINT_KEY, value)
+
+    async def _throttle(self) -> None:
+        """按 ORPHAN_GC_MAX_CALLS_PER_MINUTE 限制 deleteMessages 的调用频率。"""
+        rate = get_settings().ORPHAN_GC_MAX_CALLS_PER_MINUTE
+        if rate > 0:
+            delay = self._last_call + 60 / rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        self._last_call = time.monotonic()
+
+    async def _delete(self, report: dict, channel_name: str, message_ids: list[int]) -> None:
+        await self._throttle()
+        service = get_telegram_service_for_channel(channel_name)
+        deleted = len(await service.delete_messages(message_ids))
+        failed = len(message_ids) - deleted
+        report["deleted"] += deleted
+        report["failed"] += failed
+        orphan_messages.labels("deleted").inc(deleted)
+        if failed:
+            orphan_messages.labels("failed").inc(failed)
+
+    async def run_pass(self, *, dry_run: bool) -> dict:
+        """
+        扫描一遍消息台账并返回报告。
+
+        dry_run 时只统计孤儿消息，不删除、不修改台账，也不读写游标（总是从头扫描）；
+        否则从上次的游标继续，扫描到末尾后清除游标。
+        """
+        if self._running:
+            raise OrphanCollectorBusy("孤儿回收正在进行")
+        self._running = True
+        settings = get_settings()
+        report = {
+            "dry_run": dry_run,
+            "started_at": time.time(),
+            "finished_at": None,
+            "scanned": 0,
+            "orphans": 0,
+            "deleted": 0,
+            "failed": 0,
+            "settled": 0,
+            "samples": [],
+        }
+        self.current = report
+        try:
+            cursor = None if dry_run else await self._load_checkpoint()
+            report["resumed_from"] = list(cursor) if cursor else None
+            while True:
+                rows = await asyncio.to_thread(
+                    database.scan_message_ledger, cursor, settings.ORPHAN_GC_MIN_AGE, DELETE_MESSAGES_BATCH_SIZE
+                )
+                if not rows:
+                    break
+                report["scanned"] += len(rows)
+
+                settled: dict[str, list[int]] = {}
+                orphans: dict[str, list[int]] = {}
+                for row in rows:
+                    if row["state"] == "referenced":
+                        settled.setdefault(row["channel_name"], []).append(row["message_id"])
+                    elif row["state"] == "orphan":
+                        orphans.setdefault(row["channel_name"], []).append(row["message_id"])
+                        if len(report["samples"]) < MAX_REPORT_SAMPLES:
+                            report["samples"].append({
+                                "channel_name": row["channel_name"],
+                                "message_id": row["message_id"],
+                                "kind": row["kind"],
+                                "created_at": row["created_at"],
+                            })
+                found = sum(len(ids) for ids in orphans.values())
+                report["orphans"] += found
+                orphan_messages.labels("found").inc(found)
+
+                if not dry_run:
+                    # 已被文件引用的消息不再是回收对象
+                    for channel_name, message_ids in settled.items():
+                        await asyncio.to_thread(database.remove_ledger_messages, channel_name, message_ids)
+                        report["settled"] += len(message_ids)
+                    for channel_name, message_ids in orphans.items():
+                        await self._delete(report, channel_name, message_ids)
+
+                cursor = (rows[-1]["channel_name"], rows[-1]["message_id"])
+                if len(rows) < DELETE_MESSAGES_BATCH_SIZE:
+                    break
+                if not dry_run:
+                    await self._save_checkpoint(cursor)
+
+            if not dry_run:
+                await self._save_checkpoint(None)
+            return report
+        finally:
+            report["finished_at"] = time.time()
+            self.last_report = report
+            self.current = None
+            self._running = False
+
+    def start_pass(self) -> None:
+        """在后台执行一轮回收（供管理接口手动触发）。"""
+        if self._running:
+            raise OrphanCollectorBusy("孤儿回收正在进行")
+        self._task = asyncio.create_task(self._run_logged(dry_run=False))
+
+    async def _run_logged(self, *, dry_run: bool) -> None:
+        try:
+            report = await self.run_pass(dry_run=dry_run)
+        except OrphanCollectorBusy:
+            return
+        except Exception as e:
+            logger.error("孤儿回收出错: %s", e)
+            return
+        if report["orphans"]:
+            if dry_run:
+                logger.info("孤儿回收（仅报告）: 发现 %d 条孤儿消息", report["orphans"])
+            else:
+                logger.info(
+                    "孤儿回收完成: 发现 %d 条孤儿消息，删除 %d 条，失败 %d 条",
+                    report["orphans"], report["deleted"], report["failed"],
+                )
+
+    async def run_forever(self, app) -> None:
+        """后台定期回收；只在机器人 leader 进程且机器人配置完成时执行。"""
+        settings = get_settings()
+        interval = settings.ORPHAN_GC_INTERVAL
+        if interval <= 0:
+            return
+        await asyncio.sleep(min(interval, FIRST_PASS_DELAY))
+        while True:
+            if getattr(app.state, "bot_leader", False) and getattr(app.state, "bot_ready", False):
+                await self._run_logged(dry_run=settings.ORPHAN_GC_DRY_RUN)
+            await asyncio.sleep(interval)
+
+    async def stats(self) -> dict:
+        settings = get_settings()
+        ledger_size = await asyncio.to_thread(database.count_ledger_messages)
+        return {
+            "running": self._running,
+            "ledger_size": ledger_size,
+            "checkpoint": await self._load_checkpoint(),
+            "current": self.current,
+            "last_report": self.last_report,
+            "interval": settings.ORPHAN_GC_INTERVAL,
+            "min_age": settings.ORPHAN_GC_MIN_AGE,
+            "dry_run": settings.ORPHAN_GC_DRY_RUN,
+        }
+
+
+orphan_collector = OrphanCollector()
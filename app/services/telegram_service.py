@@ -1,130 +1,160 @@
 import asyncio
 import io
+import json
 import logging
 import os
 from functools import lru_cache
 
+import httpx
 import telegram
-from telegram.request import HTTPXRequest
+from telegram import InputFile
 
-from ..core.config import get_app_settings
+from ..core.admission import telegram_upload_budget
+from ..core.config import get_app_settings, get_settings
+from ..core.metrics import register_lru_cache
 from ..core.channels import get_primary_channel
+from ..core.transport import bot_api_options, telegram_request, telegram_transport
+from ..core.upload_staging import is_owner_alive, remove_staged_file, sweep_staging_dir, upload_owner_id
+from ..events import build_file_event, file_update_queue
 from .. import database
 
 # Telegram Bot API 对通过 getFile 方法下载的文件有 20MB 的限制。
 # tgState 将文件按 19.5MB 分块上传，并通过 .manifest 文件记录原始文件名与分块列表。
-CHUNK_SIZE_BYTES = int(19.5 * 1024 * 1024)
+CLOUD_CHUNK_SIZE_BYTES = int(19.5 * 1024 * 1024)
+# 本地模式的自建 Bot API 服务器（--local）上传与下载上限为 2000MB
+LOCAL_CHUNK_SIZE_BYTES = 1950 * 1024 * 1024
+
+
+def _resolve_chunk_size() -> int:
+    settings = get_settings()
+    ceiling = LOCAL_CHUNK_SIZE_BYTES if settings.TELEGRAM_LOCAL_MODE else CLOUD_CHUNK_SIZE_BYTES
+    if settings.TELEGRAM_CHUNK_SIZE_MB:
+        return max(1024 * 1024, min(int(settings.TELEGRAM_CHUNK_SIZE_MB * 1024 * 1024), ceiling))
+    return ceiling
+
+
+# 新上传文件使用的分块大小
+CHUNK_SIZE_BYTES = _resolve_chunk_size()
+# 可能是清单的最小原始文件大小：切换到本地模式前按 19.5MB 分块上传的文件仍需识别为清单
+MANIFEST_MIN_FILESIZE = min(CHUNK_SIZE_BYTES, CLOUD_CHUNK_SIZE_BYTES)
+
+# 清单文件的开头；判断是否为清单时只读取这么多字节
+MANIFEST_HEADER = b"tgstate-blob\n"
+
+# deleteMessages 单次最多删除的消息数
+DELETE_MESSAGES_BATCH_SIZE = 100
+# 客户端断开时取消上传任务使用的原因：此时放弃上传并删除已发送的分块，其他原因的取消保留上传日志
+UPLOAD_CANCELLED_BY_CLIENT = "client_disconnected"
 
 logger = logging.getLogger(__name__)
 
+
+def is_local_file_path(download_url: str) -> bool:
+    """本地模式下 getFile 返回 Bot API 服务器上的绝对路径，而不是 HTTPS 链接。"""
+    return download_url.startswith("/")
+
+
+def parse_manifest(content: bytes) -> tuple[str, list[str]]:
+    """
+    解析清单文件：依次为 tgstate-blob 标识、原始文件名、每行一个分块的复合 ID（message_id:file_id）。
+
+    返回 (原始文件名, 分块 ID 列表)；格式不正确时抛出 ValueError。
+    """
+    lines = content.decode("utf-8").strip().split("\n")
+    if len(lines) < 3 or lines[0] != "tgstate-blob":
+        raise ValueError("manifest is malformed")
+    return lines[1].strip(), [cid for cid in lines[2:] if cid.strip()]
+
+
+def read_local_file(path: str, limit: int = -1) -> bytes:
+    with open(path, "rb") as f:
+        return f.read(limit)
+
+
+class FileSlice(io.RawIOBase):
+    """
+    暂存文件中 [offset, offset + length) 区间的只读视图，用作上传的文件对象。
+
+    配合 InputFile(read_file_handle=False) 使用时，httpx 在发送 multipart 请求体时按 64KB 逐段读取，
+    每个进行中的分块只占用一个小缓冲区，而不必把整个分块（最大约 19.5MB / 1950MB）读入内存。
+    不提供 fileno()，httpx 通过 seek/tell 得到的是分块长度而不是整个文件的大小；
+    seek(0) 后可重新读取，请求重发时同样适用。
+    """
+
+    def __init__(self, path: str, offset: int, length: int):
+        super().__init__()
+        self._file = open(path, "rb", buffering=0)
+        self._start = offset
+        self._length = length
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_SET:
+            pos = offset
+        elif whence == os.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == os.SEEK_END:
+            pos = self._length + offset
+        else:
+            raise ValueError(f"invalid whence: {whence}")
+        self._pos = max(0, min(pos, self._length))
+        return self._pos
+
+    def read(self, size: int = -1) -> bytes:
+        remaining = self._length - self._pos
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        if size <= 0:
+            return b""
+        self._file.seek(self._start + self._pos)
+        data = self._file.read(size)
+        self._pos += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+    def close(self) -> None:
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+
 class TelegramService:
     """
     用于与 Telegram Bot API 交互的服务。
     """
     def __init__(self, bot_token: str, channel_name: str):
-        # 为大文件上传设置更长的超时时间 (例如 5 分钟)
-        request = HTTPXRequest(
-            connect_timeout=300.0,
-            read_timeout=300.0,
-            write_timeout=300.0
+        # 使用共享传输层：普通调用与上传（带文件的请求）分别套用 api / upload 超时配置
+        self.bot = telegram.Bot(
+            token=bot_token,
+            request=telegram_request("api", media_profile="upload"),
+            get_updates_request=telegram_request("polling"),
+            **bot_api_options(),
         )
-        self.bot = telegram.Bot(token=bot_token, request=request)
         # 注意：这里的 channel_name 表示“当前操作的频道/群组”，
         # 可以针对不同文件所在的频道创建多个 TelegramService 实例。
         self.channel_name = channel_name
 
-    async def _upload_chunk(self, chunk_data: bytes, chunk_name: str) -> str | None:
-        """一个上传单个数据块的辅助函数。"""
-        try:
-            with io.BytesIO(chunk_data) as document_chunk:
-                message = await self.bot.send_document(
-                    chat_id=self.channel_name,
-                    document=document_chunk,
-                    filename=chunk_name
-                )
-            if message.document:
-                return message.document.file_id
-        except Exception as e:
-            logger.error("上传分块 %s 到 Telegram 时出错: %s", chunk_name, e)
-        return None
-
-    async def _upload_as_chunks(self, file_path: str, original_filename: str) -> str | None:
-        """
-        将大文件分割成块，并通过回复链将所有部分聚合起来。
-        """
-        chunk_file_ids = []
-        first_message_id = None
-        
-        try:
-            with open(file_path, "rb") as f:
-                chunk_number = 1
-                while True:
-                    chunk = f.read(CHUNK_SIZE_BYTES)
-                    if not chunk:
-                        break
-                    
-                    chunk_name = f"{original_filename}.part{chunk_number}"
-                    logger.info("正在上传分块: %s", chunk_name)
-                    
-                    with io.BytesIO(chunk) as chunk_io:
-                        # 如果是第一个块，正常发送。否则，作为对第一个块的回复发送。
-                        reply_to_id = first_message_id if first_message_id else None
-                        message = await self.bot.send_document(
-                            chat_id=self.channel_name,
-                            document=chunk_io,
-                            filename=chunk_name,
-                            reply_to_message_id=reply_to_id
-                        )
-                    
-                    # 如果是第一个块，保存其 message_id
-                    if not first_message_id:
-                        first_message_id = message.message_id
-                    
-                    # 关键变更：存储复合ID (message_id:file_id) 而不是只有 file_id
-                    chunk_file_ids.append(f"{message.message_id}:{message.document.file_id}")
-                    chunk_number += 1
-        except IOError as e:
-            logger.error("读取或上传文件块时出错: %s", e)
-            return None
-        except Exception as e:
-            logger.error("发送文件块时出错: %s", e)
-            return None
-
-        # 生成并上传清单文件，同样作为对第一个块的回复
-        manifest_content = f"tgstate-blob\n{original_filename}\n" + "\n".join(chunk_file_ids)
-        manifest_name = f"{original_filename}.manifest"
-        
-        logger.info("所有分块上传完毕。正在上传清单文件")
-        try:
-            with io.BytesIO(manifest_content.encode('utf-8')) as manifest_file:
-                message = await self.bot.send_document(
-                    chat_id=self.channel_name,
-                    document=manifest_file,
-                    filename=manifest_name,
-                    reply_to_message_id=first_message_id
-                )
-            if message.document:
-                logger.info("清单文件上传成功")
-                # 将大文件的元数据存入数据库
-                total_size = os.path.getsize(file_path)
-                # 创建复合ID，格式为 "message_id:file_id"
-                composite_id = f"{message.message_id}:{message.document.file_id}"
-                short_id = database.add_file_metadata(
-                    filename=original_filename,
-                    file_id=composite_id,  # 我们存储复合ID
-                    filesize=total_size,
-                    channel_name=self.channel_name,
-                )
-                return short_id  # 返回 short_id
-        except Exception as e:
-            logger.error("上传清单文件时出错: %s", e)
-        
-        return None
-
     async def upload_file(self, file_path: str, file_name: str) -> str | None:
         """
         将文件上传到指定的 Telegram 频道。
-        如果文件大小大于等于 CHUNK_SIZE_BYTES (约 19.5MB)，则使用分块 + manifest 机制上传。
+        如果文件大小大于等于 CHUNK_SIZE_BYTES（官方服务器约 19.5MB，本地模式约 1950MB），
+        则使用分块 + manifest 机制上传。
+
+        上传过程记录在 upload_journal 中；进程在上传中途退出时，重启后由 resume_interrupted_uploads()
+        从下一个缺失的分块继续，因此 file_path 应位于持久的暂存目录（UPLOAD_STAGING_DIR）。
         
         参数:
             file_path: 文件的本地路径。
@@ -138,7 +168,7 @@ class TelegramService:
             return None
         
         try:
-            file_size = os.path.getsize(file_path)
+            file_size = await asyncio.to_thread(os.path.getsize, file_path)
         except OSError as e:
             logger.error("无法获取文件大小: %s", e)
             return None
@@ -149,35 +179,153 @@ class TelegramService:
                 file_size / 1024 / 1024,
                 CHUNK_SIZE_BYTES / 1024 / 1024,
             )
-            return await self._upload_as_chunks(file_path, file_name)
-        
-        logger.info(
-            "文件大小 %.2fMB < %.2fMB，直接上传",
-            file_size / 1024 / 1024,
-            CHUNK_SIZE_BYTES / 1024 / 1024,
+        else:
+            logger.info(
+                "文件大小 %.2fMB < %.2fMB，直接上传",
+                file_size / 1024 / 1024,
+                CHUNK_SIZE_BYTES / 1024 / 1024,
+            )
+
+        owner = upload_owner_id()
+        journal_id = await asyncio.to_thread(
+            database.create_upload_journal, file_path, file_name, file_size, CHUNK_SIZE_BYTES, self.channel_name, owner
         )
+        journal = {
+            "id": journal_id,
+            "staged_path": file_path,
+            "filename": file_name,
+            "filesize": file_size,
+            "chunk_size": CHUNK_SIZE_BYTES,
+            "channel_name": self.channel_name,
+            "owner": owner,
+            "file_id": None,
+            "parts": {},
+        }
+        return await self.run_journaled_upload(journal)
+
+    async def run_journaled_upload(self, journal: dict) -> str | None:
+        """
+        按上传日志执行（或继续）一次上传：跳过日志中已有的分块，完成后写入 files 表并删除日志。
+
+        失败或因客户端断开被取消（取消原因为 UPLOAD_CANCELLED_BY_CLIENT）时，删除已发送的消息并放弃日志；
+        其他原因的取消（例如服务关闭）保留日志，由重启后的进程续传。
+        """
         try:
-            with open(file_path, "rb") as document_file:
-                message = await self.bot.send_document(
-                    chat_id=self.channel_name,
-                    document=document_file,
-                    filename=file_name
-                )
-            if message.document:
-                # 将小文件的元数据存入数据库
-                # 创建复合ID，格式为 "message_id:file_id"
-                composite_id = f"{message.message_id}:{message.document.file_id}"
-                short_id = database.add_file_metadata(
-                    filename=file_name,
-                    file_id=composite_id,  # 存储复合ID
-                    filesize=file_size,
-                    channel_name=self.channel_name,
-                )
-                return short_id  # 返回 short_id
+            file_id = journal["file_id"] or await self._send_journaled(journal)
+            if not file_id:
+                await self.discard_journal(journal, "失败")
+                return None
+            return await self.finish_journal(journal)
+        except asyncio.CancelledError as e:
+            if journal["file_id"]:
+                # 文件已完整发送，只差入库：照常完成，避免频道中留下没有记录的文件
+                await asyncio.shield(self.finish_journal(journal))
+            elif e.args == (UPLOAD_CANCELLED_BY_CLIENT,):
+                await asyncio.shield(self.discard_journal(journal, "已取消"))
+            else:
+                logger.info("上传被中断，已保留上传日志以便续传: %s", journal["filename"])
+            raise
         except Exception as e:
             logger.error("上传文件到 Telegram 时出错: %s", e)
-        
-        return None
+            if journal["file_id"]:
+                # 只有入库失败：保留日志，重启后重新入库
+                return None
+            await self.discard_journal(journal, "失败")
+            return None
+
+    async def _send_journaled(self, journal: dict) -> str | None:
+        """
+        发送日志中尚未发送的部分，返回最终的复合 ID（message_id:file_id）。
+
+        大文件依次发送分块（通过回复链聚合到第一个分块）与清单，每个分块发送后立即写入日志；
+        分块与小文件都是暂存文件上的 FileSlice 视图，由 httpx 边读边发，不会读入内存。
+        """
+        file_path = journal["staged_path"]
+        filename = journal["filename"]
+        file_size = journal["filesize"]
+        chunk_size = journal["chunk_size"]
+
+        if file_size < chunk_size:
+            async with telegram_upload_budget.hold(file_size):
+                with FileSlice(file_path, 0, file_size) as file_slice:
+                    message = await self.bot.send_document(
+                        chat_id=self.channel_name,
+                        document=InputFile(file_slice, filename=filename, read_file_handle=False),
+                    )
+            if not message.document:
+                return None
+            return await self._record_file_id(journal, f"{message.message_id}:{message.document.file_id}")
+
+        parts = journal["parts"]
+        first_message_id = parts[1][0] if 1 in parts else None
+        for chunk_number, offset in enumerate(range(0, file_size, chunk_size), start=1):
+            if chunk_number in parts:
+                continue
+            length = min(chunk_size, file_size - offset)
+            chunk_name = f"{filename}.part{chunk_number}"
+            logger.info("正在上传分块: %s", chunk_name)
+
+            # 同时发往 Telegram 的分块字节数受 UPLOAD_MAX_INFLIGHT_MB 限制
+            async with telegram_upload_budget.hold(length):
+                with FileSlice(file_path, offset, length) as chunk_slice:
+                    # 如果是第一个块，正常发送。否则，作为对第一个块的回复发送。
+                    message = await self.bot.send_document(
+                        chat_id=self.channel_name,
+                        document=InputFile(chunk_slice, filename=chunk_name, read_file_handle=False),
+                        reply_to_message_id=first_message_id
+                    )
+
+            # 先记入内存中的日志，发送后被取消时也能删除该分块
+            parts[chunk_number] = (message.message_id, message.document.file_id)
+            await asyncio.to_thread(
+                database.add_upload_journal_part, journal["id"], chunk_number, message.message_id, message.document.file_id
+            )
+            if first_message_id is None:
+                first_message_id = message.message_id
+
+        # 生成并上传清单文件，同样作为对第一个块的回复
+        # 存储复合ID (message_id:file_id) 而不是只有 file_id
+        chunk_file_ids = [f"{message_id}:{file_id}" for _, (message_id, file_id) in sorted(parts.items())]
+        manifest_content = f"tgstate-blob\n{filename}\n" + "\n".join(chunk_file_ids)
+        manifest_name = f"{filename}.manifest"
+
+        logger.info("所有分块上传完毕。正在上传清单文件")
+        with io.BytesIO(manifest_content.encode('utf-8')) as manifest_file:
+            message = await self.bot.send_document(
+                chat_id=self.channel_name,
+                document=manifest_file,
+                filename=manifest_name,
+                reply_to_message_id=first_message_id
+            )
+        if not message.document:
+            return None
+        logger.info("清单文件上传成功")
+        return await self._record_file_id(journal, f"{message.message_id}:{message.document.file_id}")
+
+    async def _record_file_id(self, journal: dict, composite_id: str) -> str:
+        journal["file_id"] = composite_id
+        await asyncio.to_thread(database.set_upload_journal_file_id, journal["id"], composite_id)
+        return composite_id
+
+    async def finish_journal(self, journal: dict) -> str:
+        """将已完整发送的文件写入 files 表（file_id 已存在时返回原 short_id），然后删除日志。"""
+        short_id = await asyncio.to_thread(
+            database.add_file_metadata,
+            filename=journal["filename"],
+            file_id=journal["file_id"],  # 存储复合ID
+            filesize=journal["filesize"],
+            channel_name=self.channel_name,
+        )
+        await asyncio.to_thread(database.complete_upload_journal, journal["id"])
+        return short_id
+
+    async def discard_journal(self, journal: dict, reason: str) -> None:
+        """放弃一次上传：删除日志中已发送的分块消息，然后删除日志。"""
+        message_ids = [message_id for message_id, _ in journal["parts"].values()]
+        if message_ids:
+            logger.info("上传%s，正在删除已发送的 %d 条消息: %s", reason, len(message_ids), journal["filename"])
+            await self.delete_messages(message_ids)
+        await asyncio.to_thread(database.delete_upload_journal, journal["id"])
 
     async def get_download_url(self, file_id: str) -> str | None:
         """
@@ -187,7 +335,7 @@ class TelegramService:
             file_id: 来自 Telegram 的文件 ID。
 
         返回:
-            如果成功，则返回临时下载链接，否则返回 None。
+            如果成功，则返回临时下载链接（本地模式下为服务器上的文件路径），否则返回 None。
         """
         try:
             file = await self.bot.get_file(file_id)
@@ -196,21 +344,43 @@ class TelegramService:
             logger.error("从 Telegram 获取下载链接时出错: %s", e)
             return None
 
+    async def read_file(self, download_url: str, limit: int = -1) -> bytes:
+        """
+        读取 get_download_url 返回的文件内容（limit 为最多读取的字节数，-1 表示全部）。
+        本地模式直接读取磁盘，否则经共享客户端下载；失败时抛出 httpx.HTTPError / OSError。
+        """
+        if is_local_file_path(download_url):
+            return await asyncio.to_thread(read_local_file, download_url, limit)
+        headers = {"Range": f"bytes=0-{limit - 1}"} if limit > 0 else None
+        resp = await telegram_transport.client.get(download_url, headers=headers)
+        resp.raise_for_status()
+        return resp.content
+
+    async def read_manifest(self, download_url: str) -> bytes | None:
+        """
+        先读取开头几个字节判断是否为清单，是清单时才读取全部内容，否则返回 None。
+
+        本地模式下普通文件可达 1950MB，不能为了判断类型把整个文件读入内存。
+        """
+        head = await self.read_file(download_url, len(MANIFEST_HEADER))
+        if not head.startswith(MANIFEST_HEADER):
+            return None
+        if len(head) > len(MANIFEST_HEADER):
+            # 服务器忽略了 Range，已经拿到全部内容
+            return head
+        return await self.read_file(download_url)
+
     async def try_get_manifest_original_filename(self, manifest_file_id: str) -> tuple[bool, str | None, str | None]:
         download_url = await self.get_download_url(manifest_file_id)
         if not download_url:
             return False, None, "无法获取下载链接（文件可能已过期或不存在）"
 
         try:
-            import httpx
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                resp = await client.get(download_url)
-                resp.raise_for_status()
+            content = await self.read_manifest(download_url)
         except Exception as e:
             return False, None, f"下载清单失败：{e}"
 
-        content = resp.content
-        if not content.startswith(b"tgstate-blob\n"):
+        if content is None:
             return False, None, "清单格式不正确（缺少 tgstate-blob 头）"
 
         try:
@@ -251,6 +421,24 @@ class TelegramService:
             logger.error("删除消息 %s 时发生未知错误: %s", message_id, e)
             return (False, "error")
 
+    async def delete_messages(self, message_ids: list[int]) -> list[int]:
+        """
+        使用 deleteMessages 批量删除当前频道/群组中的消息（每批最多 100 条，找不到的消息会被跳过）。
+
+        返回所在批次删除成功的消息 ID，并将其从消息台账中移除；失败的批次只记录日志。
+        """
+        deleted: list[int] = []
+        for start in range(0, len(message_ids), DELETE_MESSAGES_BATCH_SIZE):
+            batch = message_ids[start:start + DELETE_MESSAGES_BATCH_SIZE]
+            try:
+                await self.bot.delete_messages(chat_id=self.channel_name, message_ids=batch)
+            except Exception as e:
+                logger.warning("批量删除 %d 条消息失败: %s", len(batch), e)
+                continue
+            deleted.extend(batch)
+            await asyncio.to_thread(database.remove_ledger_messages, self.channel_name, batch)
+        return deleted
+
     async def delete_file_with_chunks(self, file_id: str) -> dict:
         """
         完全删除一个文件，包括其所有可能的分块。
@@ -288,43 +476,36 @@ class TelegramService:
             results["reason"] = f"Could not get download URL for {main_actual_file_id}."
         else:
             try:
-                import httpx
-                async with httpx.AsyncClient(timeout=60.0) as client:
-                    response = await client.get(download_url)
-                    if response.status_code == 200 and response.content.startswith(b'tgstate-blob\n'):
-                        results["is_manifest"] = True
-                        logger.info("文件 %s 是清单文件，开始删除分块", file_id)
+                content = await self.read_manifest(download_url)
+                if content is not None:
+                    results["is_manifest"] = True
+                    logger.info("文件 %s 是清单文件，开始删除分块", file_id)
                         
-                        manifest_content = response.content.decode('utf-8')
-                        lines = manifest_content.strip().split('\n')
-                        chunk_composite_ids = [cid for cid in lines[2:] if cid.strip()]
-
-                        chunk_items: list[tuple[str, int]] = []
-                        for chunk_id in chunk_composite_ids:
-                            try:
-                                chunk_message_id_str, _ = chunk_id.split(":", 1)
-                                chunk_items.append((chunk_id, int(chunk_message_id_str)))
-                            except Exception as e:
-                                logger.warning("处理分块ID %s 时出错: %s", chunk_id, e)
-                                results["failed_chunks"].append(chunk_id)
-
-                        semaphore = asyncio.Semaphore(10)
-
-                        async def delete_one(chunk_id: str, message_id: int) -> tuple[str, bool]:
-                            async with semaphore:
-                                ok, _ = await self.delete_message(message_id)
-                                return chunk_id, ok
-
-                        tasks = [asyncio.create_task(delete_one(chunk_id, mid)) for chunk_id, mid in chunk_items]
-                        for fut in asyncio.as_completed(tasks):
-                            try:
-                                chunk_id, ok = await fut
-                                if ok:
-                                    results["deleted_chunks"].append(chunk_id)
-                                else:
-                                    results["failed_chunks"].append(chunk_id)
-                            except Exception as e:
-                                logger.error("删除分块时出错: %s", e)
+                    manifest_content = content.decode('utf-8')
+                    lines = manifest_content.strip().split('\n')
+                    chunk_composite_ids = [cid for cid in lines[2:] if cid.strip()]
+
+                    chunk_items: list[tuple[str, int]] = []
+                    for chunk_id in chunk_composite_ids:
+                        try:
+                            chunk_message_id_str, _ = chunk_id.split(":", 1)
+                            chunk_items.append((chunk_id, int(chunk_message_id_str)))
+                        except Exception as e:
+                            logger.warning("处理分块ID %s 时出错: %s", chunk_id, e)
+                            results["failed_chunks"].append(chunk_id)
+
+                    # 分块用 deleteMessages 批量删除；失败的分块记入消息台账，由孤儿回收器稍后重试
+                    deleted = set(await self.delete_messages([mid for _, mid in chunk_items]))
+                    for chunk_id, mid in chunk_items:
+                        if mid in deleted:
+                            results["deleted_chunks"].append(chunk_id)
+                        else:
+                            results["failed_chunks"].append(chunk_id)
+                    leftover = [mid for _, mid in chunk_items if mid not in deleted]
+                    if leftover:
+                        await asyncio.to_thread(
+                            database.add_ledger_messages, self.channel_name, leftover, "chunk", main_message_id
+                        )
             except Exception as e:
                 error_message = f"下载或解析清单文件 {file_id} 时出错: {e}"
                 logger.error(error_message)
@@ -343,6 +524,7 @@ class TelegramService:
                 logger.info("主消息 %s 在 Telegram 中未找到，视为成功", main_message_id)
         else:
             logger.warning("删除主消息 %s 失败", main_message_id)
+            await asyncio.to_thread(database.add_ledger_messages, self.channel_name, [main_message_id], "file")
 
         # 步骤 3: 决定最终状态
         if results["main_message_deleted"] and (not results["is_manifest"] or not results["failed_chunks"]):
@@ -406,21 +588,19 @@ class TelegramService:
                         manifest_url = await self.get_download_url(doc.file_id)
                         if not manifest_url: continue
                         
-                        import httpx
-                        async with httpx.AsyncClient() as client:
-                            try:
-                                resp = await client.get(manifest_url)
-                                if resp.status_code == 200 and resp.content.startswith(b'tgstate-blob\n'):
-                                    lines = resp.content.decode('utf-8').strip().split('\n')
-                                    original_filename = lines[1]
-                                    # 注意：这里我们无法轻易获得原始总大小，暂时留空
-                                    files.append({
-                                        "name": original_filename,
-                                        "file_id": doc.file_id, # 关键：使用清单文件的ID
-                                        "size": None # 标记为未知大小
-                                    })
-                            except httpx.RequestError:
-                                continue
+                        try:
+                            content = await self.read_manifest(manifest_url)
+                            if content is not None:
+                                lines = content.decode('utf-8').strip().split('\n')
+                                original_filename = lines[1]
+                                # 注意：这里我们无法轻易获得原始总大小，暂时留空
+                                files.append({
+                                    "name": original_filename,
+                                    "file_id": doc.file_id, # 关键：使用清单文件的ID
+                                    "size": None # 标记为未知大小
+                                })
+                        except (httpx.HTTPError, OSError):
+                            continue
             
             # 设置下一次迭代的偏移量
             last_message_id = messages[-1].message_id
@@ -437,6 +617,9 @@ def _get_telegram_service(bot_token: str, channel_name: str) -> TelegramService:
     return TelegramService(bot_token=bot_token, channel_name=channel_name)
 
 
+register_lru_cache("telegram_service", _get_telegram_service)
+
+
 def get_telegram_service() -> TelegramService:
     """
     获取“默认频道”的 TelegramService 实例。
@@ -465,3 +648,75 @@ def get_telegram_service_for_channel(channel_name: str) -> TelegramService:
     if not bot_token or not ch:
         raise RuntimeError("Telegram 未配置完成")
     return _get_telegram_service(bot_token=bot_token, channel_name=ch)
+
+
+def _staged_file_intact(path: str, expected_size: int) -> bool:
+    try:
+        return os.path.getsize(path) == expected_size
+    except OSError:
+        return False
+
+
+async def _publish_added(short_id: str) -> None:
+    row = await asyncio.to_thread(database.get_file_by_id, short_id)
+    if not row:
+        return
+    event = build_file_event(
+        action="add",
+        file_id=row["file_id"],
+        filename=row["filename"],
+        filesize=row["filesize"],
+        upload_date=row["upload_date"],
+        short_id=row["short_id"],
+        channel_name=row.get("channel_name"),
+        tags=row.get("tags"),
+    )
+    await file_update_queue.put(json.dumps(event))
+
+
+async def resume_interrupted_uploads() -> None:
+    """
+    接管已退出进程留下的上传日志（启动时在后台运行）：
+
+    - 文件已全部发送、只差入库：直接入库；
+    - 暂存文件完好：从下一个缺失的分块继续上传；
+    - 暂存文件已丢失：删除已发送的分块并放弃。
+
+    完成后删除对应的暂存文件，并清理已退出进程留下的、没有日志的暂存文件。
+    """
+    owner = upload_owner_id()
+    journals = await asyncio.to_thread(database.get_upload_journals)
+    for journal in journals:
+        if is_owner_alive(journal["owner"]):
+            continue
+        # 多个 worker 同时启动时只有一个能接管
+        if not await asyncio.to_thread(database.claim_upload_journal, journal["id"], journal["owner"], owner):
+            continue
+        journal["owner"] = owner
+        filename = journal["filename"]
+        try:
+            service = get_telegram_service_for_channel(journal["channel_name"])
+            if journal["file_id"]:
+                logger.info("完成中断的上传（仅入库）: %s", filename)
+                short_id = await service.finish_journal(journal)
+            elif _staged_file_intact(journal["staged_path"], journal["filesize"]):
+                logger.info("续传中断的上传: %s（已发送 %d 个分块）", filename, len(journal["parts"]))
+                short_id = await service.run_journaled_upload(journal)
+            else:
+                logger.warning("暂存文件已丢失，放弃中断的上传: %s", filename)
+                await service.discard_journal(journal, "无法续传")
+                short_id = None
+        except Exception as e:
+            logger.error("处理中断的上传 %s 时出错: %s", filename, e)
+            continue
+
+        if short_id:
+            logger.info("中断的上传已完成: %s -> %s", filename, short_id)
+            await _publish_added(short_id)
+        # 日志已完成或放弃（入库失败时日志保留，暂存文件已无用）
+        await asyncio.to_thread(remove_staged_file, journal["staged_path"])
+
+    remaining = await asyncio.to_thread(database.get_upload_journals)
+    removed = await asyncio.to_thread(sweep_staging_dir, {j["staged_path"] for j in remaining})
+    if removed:
+        logger.info("已清理 %d 个无主的暂存文件", removed)
@@ -5,6 +5,19 @@ document.addEventListener('DOMContentLoaded', () => {
     const progressArea = document.getElementById('prog-zone');
     const doneArea = document.getElementById('done-zone');
     const searchInput = document.getElementById('file-search');
+    const fileListContainer = document.getElementById('file-list-disk');
+    const isGridView = document.querySelector('.image-grid') !== null;
+
+    // 文件列表数据：按上传时间倒序，DOM 只渲染其中位于视口附近的部分
+    const listState = {
+        items: [],
+        index: new Map(),     // file_id -> file
+        selected: new Set(),  // 已勾选的 file_id（虚拟列表中的行会被回收，不能依赖 DOM 勾选状态）
+        nextCursor: null,
+        loading: false,
+        retryAt: 0,
+        generation: 0,        // 每次重新加载时递增，用于丢弃过期的分页响应
+    };
 
     // Channel selection (for multi-channel uploads)
     const channelInput = document.getElementById('upload-channel-input');
@@ -81,24 +94,12 @@ document.addEventListener('DOMContentLoaded', () => {
                         return;
                     }
                     const tagStr = (data.tags || []).join(',');
-                    item.dataset.tags = tagStr;
-
-                    // 更新标签显示
-                    const display = item.querySelector('.file-tags-display');
-                    if (display) {
-                        if (!tagStr) {
-                            display.textContent = '-';
-                        } else {
-                            const parts = tagStr.split(',').map(t => t.trim()).filter(Boolean);
-                            display.innerHTML = parts
-                                .map(t => `<span class="tag-chip" style="display:inline-block;padding:2px 6px;margin:0 4px 4px 0;border-radius:999px;background:var(--bg-surface-hover);font-size:11px;color:var(--text-secondary);">${t}</span>`)
-                                .join('');
-                        }
-                    }
+                    const file = listState.index.get(fileId);
+                    if (file) file.tags = tagStr;
+                    renderFileWindow(true);
 
-                    // 重新构建过滤选项并应用过滤
-                    rebuildFilterOptionsFromItems();
-                    applyFilters();
+                    // 重新加载过滤选项
+                    loadFilterFacets();
 
                     if (window.Toast) Toast.show('标签已更新');
                 })
@@ -176,6 +177,7 @@ document.addEventListener('DOMContentLoaded', () => {
     });
 
     // --- Helper: type categorization ---
+    // 服务端返回的文件带有入库时计算的 category，这里仅作兜底（与 app/core/filetypes.py 保持一致）
     function getFileCategory(filename) {
         if (!filename) return 'other';
         const name = filename.toLowerCase();
@@ -196,122 +198,115 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     // --- Filters Application ---
-    function applyFilters() {
-        const items = document.querySelectorAll('.file-item, .image-card');
-
-        items.forEach(item => {
-            const name = (item.dataset.filename || '').toLowerCase();
-            const channel = (item.dataset.channelName || '').toLowerCase();
-            const tagsStr = item.dataset.tags || '';
-            const tagsArr = tagsStr ? tagsStr.split(',').map(t => t.trim().toLowerCase()).filter(Boolean) : [];
-            const sizeBytes = parseInt(item.dataset.filesize || '0', 10) || 0;
-            const uploadDateRaw = item.dataset.uploadDate || '';
-            const category = getFileCategory(item.dataset.filename || '');
-
-            let visible = true;
-
-            // Text search: name / channel / tags
-            if (filterState.search) {
-                const term = filterState.search;
-                const inName = name.includes(term);
-                const inChannel = channel.includes(term);
-                const inTags = tagsArr.some(t => t.includes(term));
-                if (!inName && !inChannel && !inTags) visible = false;
-            }
+    // 列表筛选在服务端完成（/api/files/page）；本函数只用于判断实时推送的新文件是否应插入当前列表
+    function matchesFilters(file) {
+        const name = (file.filename || '').toLowerCase();
+        const channel = (file.channel_name || '').toLowerCase();
+        const tagsStr = file.tags || '';
+        const tagsArr = tagsStr ? tagsStr.split(',').map(t => t.trim().toLowerCase()).filter(Boolean) : [];
+        const sizeBytes = Number(file.filesize) || 0;
+        const uploadDateRaw = file.upload_date || '';
+        const category = file.category || getFileCategory(file.filename || '');
+
+        if (isGridView && category !== 'image') return false;
+
+        // Text search: name / channel / tags
+        if (filterState.search) {
+            const term = filterState.search;
+            const inName = name.includes(term);
+            const inChannel = channel.includes(term);
+            const inTags = tagsArr.some(t => t.includes(term));
+            if (!inName && !inChannel && !inTags) return false;
+        }
 
-            // Date range (based on YYYY-MM-DD)
-            if (visible && (filterState.dateFrom || filterState.dateTo) && uploadDateRaw) {
-                const dStr = uploadDateRaw.split(' ')[0].split('T')[0];
-                const d = dStr;
-                if (filterState.dateFrom && d < filterState.dateFrom) visible = false;
-                if (filterState.dateTo && d > filterState.dateTo) visible = false;
-            }
+        // Date range (based on YYYY-MM-DD)
+        if ((filterState.dateFrom || filterState.dateTo) && uploadDateRaw) {
+            const d = formatDateValue(uploadDateRaw);
+            if (filterState.dateFrom && d < filterState.dateFrom) return false;
+            if (filterState.dateTo && d > filterState.dateTo) return false;
+        }
 
-            // Size range (MB)
-            if (visible && (filterState.sizeMin != null || filterState.sizeMax != null) && sizeBytes > 0) {
-                const sizeMB = sizeBytes / (1024 * 1024);
-                if (filterState.sizeMin != null && sizeMB < filterState.sizeMin) visible = false;
-                if (filterState.sizeMax != null && sizeMB > filterState.sizeMax) visible = false;
-            }
+        // Size range (MB)
+        if (filterState.sizeMin != null || filterState.sizeMax != null) {
+            const sizeMB = sizeBytes / (1024 * 1024);
+            if (filterState.sizeMin != null && sizeMB < filterState.sizeMin) return false;
+            if (filterState.sizeMax != null && sizeMB > filterState.sizeMax) return false;
+        }
 
-            // Type filter
-            if (visible && filterState.types.size > 0) {
-                if (!filterState.types.has(category)) visible = false;
-            }
+        // Type filter
+        if (filterState.types.size > 0 && !filterState.types.has(category)) return false;
 
-            // Source filter
-            if (visible && filterState.sources.size > 0) {
-                const rawChannel = (item.dataset.channelName || '').trim();
-                if (!filterState.sources.has(rawChannel)) visible = false;
-            }
+        // Source filter
+        if (filterState.sources.size > 0 && !filterState.sources.has((file.channel_name || '').trim())) return false;
 
-            // Tags filter (multi-select)
-            if (visible && filterState.tags.size > 0) {
-                const hasAnyTag = tagsArr.some(t => filterState.tags.has(t));
-                if (!hasAnyTag) visible = false;
-            }
+        // Tags filter (multi-select)
+        if (filterState.tags.size > 0 && !tagsArr.some(t => filterState.tags.has(t))) return false;
 
-            item.style.display = visible ? '' : 'none';
-        });
+        return true;
     }
 
-    function rebuildFilterOptionsFromItems() {
-        const items = document.querySelectorAll('.file-item, .image-card');
-        const sourcesSet = new Set();
-        const tagsSet = new Set();
+    // 将当前筛选条件转换为 /api/files/page 的查询参数；结果必然为空时返回 null
+    function buildFilterQuery() {
+        const params = new URLSearchParams();
+        if (filterState.search) params.set('q', filterState.search);
+        if (filterState.dateFrom) params.set('date_from', filterState.dateFrom);
+        if (filterState.dateTo) params.set('date_to', filterState.dateTo);
+        if (filterState.sizeMin != null) params.set('size_min', Math.ceil(filterState.sizeMin * 1024 * 1024));
+        if (filterState.sizeMax != null) params.set('size_max', Math.floor(filterState.sizeMax * 1024 * 1024));
 
-        items.forEach(item => {
-            const ch = (item.dataset.channelName || '').trim();
-            if (ch) sourcesSet.add(ch);
+        let types = Array.from(filterState.types);
+        if (isGridView) {
+            // 图床页面只展示图片
+            types = types.length === 0 || types.includes('image') ? ['image'] : [];
+            if (types.length === 0) return null;
+        }
+        if (types.length > 0) params.set('types', types.join(','));
+        if (filterState.sources.size > 0) params.set('sources', Array.from(filterState.sources).join(','));
+        if (filterState.tags.size > 0) params.set('tags', Array.from(filterState.tags).join(','));
+        return params;
+    }
 
-            const tagsStr = item.dataset.tags || '';
-            if (tagsStr) {
-                tagsStr.split(',').forEach(raw => {
-                    const t = (raw || '').trim();
-                    if (t) tagsSet.add(t);
-                });
-            }
+    // 筛选条件变化后重新从第一页加载（输入过程中做简单防抖）
+    let applyFiltersTimer = null;
+    function applyFilters() {
+        clearTimeout(applyFiltersTimer);
+        applyFiltersTimer = setTimeout(reloadFileList, 250);
+    }
+
+    function renderFacetChips(container, values, onPick) {
+        if (!container) return;
+        container.innerHTML = '';
+        values.forEach(value => {
+            const chip = document.createElement('button');
+            chip.type = 'button';
+            chip.className = 'btn btn-ghost btn-xs';
+            chip.style.fontSize = '11px';
+            chip.style.padding = '2px 6px';
+            chip.textContent = value;
+            chip.addEventListener('click', () => onPick(value));
+            container.appendChild(chip);
         });
+    }
 
-        // 渲染来源建议 chips
-        if (filterSourcesSuggestions) {
-            filterSourcesSuggestions.innerHTML = '';
-            Array.from(sourcesSet).sort().forEach(src => {
-                const chip = document.createElement('button');
-                chip.type = 'button';
-                chip.className = 'btn btn-ghost btn-xs';
-                chip.style.fontSize = '11px';
-                chip.style.padding = '2px 6px';
-                chip.textContent = src;
-                chip.addEventListener('click', () => {
-                    // 点击 chip 即加入 sources 过滤，并同步到输入框
+    function loadFilterFacets() {
+        if (!filterSourcesSuggestions && !filterTagsSuggestions) return;
+        fetch('/api/files/facets')
+            .then(res => (res.ok ? res.json() : null))
+            .then(facets => {
+                if (!facets) return;
+                // 点击 chip 即加入过滤条件，并同步到输入框
+                renderFacetChips(filterSourcesSuggestions, facets.sources || [], (src) => {
                     filterState.sources.add(src);
                     syncSourcesInputFromState();
                     applyFilters();
                 });
-                filterSourcesSuggestions.appendChild(chip);
-            });
-        }
-
-        // 渲染标签建议 chips
-        if (filterTagsSuggestions) {
-            filterTagsSuggestions.innerHTML = '';
-            Array.from(tagsSet).sort().forEach(tag => {
-                const chip = document.createElement('button');
-                chip.type = 'button';
-                chip.className = 'btn btn-ghost btn-xs';
-                chip.style.fontSize = '11px';
-                chip.style.padding = '2px 6px';
-                chip.textContent = tag;
-                chip.addEventListener('click', () => {
-                    const v = tag.toLowerCase();
-                    filterState.tags.add(v);
+                renderFacetChips(filterTagsSuggestions, facets.tags || [], (tag) => {
+                    filterState.tags.add(tag.toLowerCase());
                     syncTagsInputFromState();
                     applyFilters();
                 });
-                filterTagsSuggestions.appendChild(chip);
-            });
-        }
+            })
+            .catch(() => {});
     }
 
     function parseCommaInput(value) {
@@ -414,7 +409,7 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     // 构建初始来源 / 标签建议 chips
-    rebuildFilterOptionsFromItems();
+    loadFilterFacets();
 
     // --- Channel Combobox Logic ---
     function renderChannelDropdown(filterText) {
@@ -650,9 +645,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const formatOptions = document.querySelectorAll('.format-option');
 
     function updateBatchControls() {
-        const checkboxes = document.querySelectorAll('.file-checkbox');
-        const checked = document.querySelectorAll('.file-checkbox:checked');
-        const count = checked.length;
+        const count = listState.selected.size;
         
         if (selectionCounter) selectionCounter.textContent = count > 0 ? `${count} 项已选` : '0 项已选';
         
@@ -664,14 +657,17 @@ document.addEventListener('DOMContentLoaded', () => {
             }
         }
 
-        if (selectAllCheckbox) selectAllCheckbox.checked = (count > 0 && count === checkboxes.length);
+        if (selectAllCheckbox) selectAllCheckbox.checked = (count > 0 && count === listState.items.length);
     }
 
     if (selectAllCheckbox) {
+        // 全选作用于已加载的文件
         selectAllCheckbox.addEventListener('change', (e) => {
-            document.querySelectorAll('.file-checkbox').forEach(cb => {
-                cb.checked = e.target.checked;
-            });
+            listState.selected.clear();
+            if (e.target.checked) {
+                listState.items.forEach(file => listState.selected.add(file.file_id));
+            }
+            renderFileWindow(true);
             updateBatchControls();
         });
     }
@@ -679,6 +675,12 @@ document.addEventListener('DOMContentLoaded', () => {
     // Delegation for dynamic checkboxes
     document.addEventListener('change', (e) => {
         if (e.target.classList.contains('file-checkbox')) {
+            const fileId = e.target.dataset.fileId;
+            if (e.target.checked) {
+                listState.selected.add(fileId);
+            } else {
+                listState.selected.delete(fileId);
+            }
             updateBatchControls();
         }
     });
@@ -696,55 +698,22 @@ document.addEventListener('DOMContentLoaded', () => {
     // Batch Copy
     if (copyLinksBtn) {
         copyLinksBtn.addEventListener('click', () => {
-            const checked = document.querySelectorAll('.file-checkbox:checked');
-            if (checked.length === 0) return;
+            if (listState.selected.size === 0) return;
 
             const activeFormatBtn = document.querySelector('.format-option.active');
             const format = activeFormatBtn ? activeFormatBtn.dataset.format : 'url';
             
-            const links = Array.from(checked).map(cb => {
-                const item = cb.closest('.file-item, .image-card');
-                let url = '';
-
-                // 1. 尝试获取下载按钮
-                const downloadLink = item.querySelector('a[href^="/d/"]');
-                if (downloadLink && downloadLink.href) {
-                    url = downloadLink.href;
-                }
-                
-                // 2. 尝试获取图片 src
-                if (!url) {
-                    const img = item.querySelector('img[src^="/d/"]');
-                    if (img && img.src) {
-                        url = img.src;
-                    }
-                }
-                
-                // 3. Fallback: Dataset
-                if (!url) {
-                    const dsUrl = item.dataset.fileUrl;
-                    if (dsUrl && dsUrl !== 'undefined') {
-                        url = dsUrl;
-                        if (url.startsWith('/')) {
-                            url = window.location.origin + url;
-                        }
-                    }
-                }
-                
-                // 4. Final Fallback
-                if (!url || url.includes('undefined')) {
-                    const shortId = item.dataset.shortId;
-                    const fileId = item.dataset.fileId;
-                    const id = (shortId && shortId !== 'None' && shortId !== '') ? shortId : fileId;
-                    url = window.location.origin + `/d/${id}`;
-                }
-                
-                const name = item.dataset.filename;
-
-                if (format === 'markdown') return `![${name}](${url})`;
-                if (format === 'html') return `<img src="${url}" alt="${name}">`;
-                return url;
-            });
+            const links = Array.from(listState.selected)
+                .map(id => listState.index.get(id))
+                .filter(Boolean)
+                .map(file => {
+                    const url = window.location.origin + getFileUrl(file);
+                    const name = file.filename;
+
+                    if (format === 'markdown') return `![${name}](${url})`;
+                    if (format === 'html') return `<img src="${url}" alt="${name}">`;
+                    return url;
+                });
 
             Utils.copy(links.join('\n'));
         });
@@ -753,13 +722,11 @@ document.addEventListener('DOMContentLoaded', () => {
     // Batch Delete
     if (batchDeleteBtn) {
         batchDeleteBtn.addEventListener('click', async () => {
-            const checked = document.querySelectorAll('.file-checkbox:checked');
-            if (checked.length === 0) return;
+            const fileIds = Array.from(listState.selected);
+            if (fileIds.length === 0) return;
 
-            const confirmed = await Modal.confirm('批量删除', `确定要删除选中的 ${checked.length} 个文件吗？`);
+            const confirmed = await Modal.confirm('批量删除', `确定要删除选中的 ${fileIds.length} 个文件吗？`);
             if (!confirmed) return;
-
-            const fileIds = Array.from(checked).map(cb => cb.dataset.fileId);
             
             fetch('/api/batch_delete', {
                 method: 'POST',
@@ -780,122 +747,118 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
-    // --- SSE & Realtime Updates ---
-    const fileListContainer = document.getElementById('file-list-disk');
-    if (fileListContainer) {
-        let eventSource = null;
-
-        const connectSSE = () => {
-            if (eventSource) {
-                eventSource.close();
-            }
-            eventSource = new EventSource('/api/file-updates');
-
-            eventSource.onmessage = (event) => {
-                const msg = JSON.parse(event.data);
-                const action = msg && msg.action ? msg.action : 'add';
-                if (action === 'delete') {
-                    removeFileElement(msg.file_id);
-                    updateBatchControls();
-                    return;
-                }
-                addNewFileElement(msg);
-            };
-
-            eventSource.onerror = () => {
-                try { eventSource.close(); } catch (_) {}
-                setTimeout(connectSSE, 5000);
-            };
-        };
+    // --- File List Rendering & Virtualization ---
+    const GRID_GAP = 16;
+    const virtual = { start: -1, end: -1, columns: 1, rowHeight: 0, overscan: 6 };
+    let renderScheduled = false;
+    let renderForced = false;
+    let facetsTimer = null;
+
+    function escapeHtml(value) {
+        return String(value == null ? '' : value)
+            .replace(/&/g, '&amp;')
+            .replace(/</g, '&lt;')
+            .replace(/>/g, '&gt;')
+            .replace(/"/g, '&quot;')
+            .replace(/'/g, '&#39;');
+    }
 
-        connectSSE();
+    function getFileUrl(file) {
+        // 回滚：只使用 /d/{id} 格式，不再拼接文件名或 slug
+        return `/d/${file.short_id || file.file_id}`;
     }
 
     function formatDateValue(value) {
         if (!value) return '';
+        const s = String(value);
+        const m = /^\d{4}-\d{2}-\d{2}/.exec(s);
+        if (m) return m[0];
         const d = new Date(value);
         if (!isNaN(d.getTime())) return d.toISOString().split('T')[0];
-        const s = String(value);
         return s.split(' ')[0].split('T')[0];
     }
 
-    function addNewFileElement(file) {
-        const isGridView = document.querySelector('.image-grid') !== null;
-        const container = document.getElementById('file-list-disk');
-        
-        // Remove empty state if exists
-        const emptyState = container.querySelector('div[style*="text-align: center"]');
-        if (emptyState) emptyState.remove();
+    function readFileFromElement(el) {
+        const ds = el.dataset;
+        return {
+            file_id: ds.fileId,
+            short_id: ds.shortId || null,
+            filename: ds.filename || '',
+            filesize: Number(ds.filesize) || 0,
+            upload_date: ds.uploadDate || '',
+            channel_name: ds.channelName || '',
+            tags: ds.tags || '',
+        };
+    }
 
-        const formattedSize = (file.filesize / (1024 * 1024)).toFixed(2) + " MB";
+    function appendFile(file) {
+        if (!file || !file.file_id || listState.index.has(file.file_id)) return;
+        listState.items.push(file);
+        listState.index.set(file.file_id, file);
+    }
+
+    function setFileList(files, nextCursor) {
+        listState.items = [];
+        listState.index.clear();
+        files.forEach(appendFile);
+        listState.nextCursor = nextCursor || null;
+    }
+
+    function renderTagChips(tagsStr) {
+        const parts = (tagsStr || '').split(',').map(t => t.trim()).filter(Boolean);
+        if (parts.length === 0) return '-';
+        return parts
+            .map(t => `<span class="tag-chip" style="display:inline-block;padding:2px 6px;margin:0 4px 4px 0;border-radius:999px;background:var(--bg-surface-hover);font-size:11px;color:var(--text-secondary);">${escapeHtml(t)}</span>`)
+            .join('');
+    }
+
+    function renderFileHTML(file) {
+        const formattedSize = ((Number(file.filesize) || 0) / (1024 * 1024)).toFixed(2) + " MB";
         const formattedDate = formatDateValue(file.upload_date);
-        const safeId = file.file_id.replace(':', '-');
-        const channelName = file.channel_name || '';
-        const tagsStr = file.tags || '';
-        
-        // URL construction: Always use /d/{file_id} (short_id preferred)
-        // 回滚：只使用 /d/{id} 格式，不再拼接文件名或 slug
-        let fileUrl = `/d/${file.short_id || file.file_id}`;
+        const safeId = escapeHtml(file.file_id.replace(':', '-'));
+        const fileId = escapeHtml(file.file_id);
+        const filename = escapeHtml(file.filename);
+        const channelName = escapeHtml(file.channel_name || '');
+        const fileUrl = escapeHtml(getFileUrl(file));
+        const checked = listState.selected.has(file.file_id) ? ' checked' : '';
+        const dataAttrs = `id="file-item-${safeId}" data-file-id="${fileId}" data-file-url="${fileUrl}" data-filename="${filename}" data-short-id="${escapeHtml(file.short_id || '')}" data-channel-name="${channelName}" data-filesize="${escapeHtml(file.filesize)}" data-upload-date="${escapeHtml(file.upload_date || '')}" data-tags="${escapeHtml(file.tags || '')}"`;
 
-        let html = '';
         if (isGridView) {
-             html = `
-                <div class="file-item" style="border: 1px solid var(--border-color); border-radius: var(--radius-md); overflow: hidden; background: var(--bg-body);" id="file-item-${safeId}" data-file-id="${file.file_id}" data-file-url="${fileUrl}" data-filename="${file.filename}" data-short-id="${file.short_id || ''}" data-channel-name="${channelName}" data-filesize="${file.filesize}" data-upload-date="${file.upload_date || ''}" data-tags="${tagsStr}">
+            return `
+                <div class="file-item image-card" style="border: 1px solid var(--border-color); border-radius: var(--radius-md); overflow: hidden; background: var(--bg-body);" ${dataAttrs}>
                     <div style="position: relative; aspect-ratio: 16/9; background: #000;">
-                        <img src="${fileUrl}" loading="lazy" style="width: 100%; height: 100%; object-fit: contain;" alt="${file.filename}">
+                        <img src="${fileUrl}" loading="lazy" style="width: 100%; height: 100%; object-fit: contain;" alt="${filename}">
                         <div style="position: absolute; top: 8px; left: 8px;">
-                            <input type="checkbox" class="file-checkbox" data-file-id="${file.file_id}" style="width: 16px; height: 16px; cursor: pointer;">
+                            <input type="checkbox" class="file-checkbox" data-file-id="${fileId}" style="width: 20px; height: 20px; cursor: pointer; border-radius: 4px;"${checked}>
                         </div>
                     </div>
                     <div style="padding: 12px;">
-                        <div class="text-sm font-medium" style="white-space: nowrap; overflow: hidden; text-overflow: ellipsis; margin-bottom: 4px;" title="${file.filename}">${file.filename}</div>
+                        <div class="text-sm font-medium" style="white-space: nowrap; overflow: hidden; text-overflow: ellipsis; margin-bottom: 4px;" title="${filename}">${filename}</div>
                         <div class="text-sm text-muted" style="margin-bottom: 4px;">${formattedSize}</div>
-                        <div class="text-sm text-muted file-tags-display" style="margin-bottom: 4px;">
-                            ${
-                                tagsStr
-                                    ? tagsStr
-                                        .split(',')
-                                        .map(t => t.trim())
-                                        .filter(Boolean)
-                                        .map(t => `<span class="tag-chip" style="display:inline-block;padding:2px 6px;margin:0 4px 4px 0;border-radius:999px;background:var(--bg-surface-hover);font-size:11px;color:var(--text-secondary);">${t}</span>`)
-                                        .join('')
-                                    : '-'
-                            }
-                        </div>
+                        <div class="text-sm text-muted file-tags-display" style="margin-bottom: 4px;">${renderTagChips(file.tags)}</div>
                         <div class="text-sm text-muted" style="margin-bottom: 8px;">${channelName || '-'}</div>
                         <div style="display: flex; gap: 8px;">
                             <button class="btn btn-secondary btn-sm copy-link-btn" style="flex: 1; height: 32px;">复制</button>
                             <button class="btn btn-secondary btn-sm edit-tags-btn" style="height: 32px; font-size: 12px;">标记</button>
-                            <button class="btn btn-secondary btn-sm delete" style="height: 32px; color: var(--danger-color);" onclick="deleteFile('${file.file_id}')">
+                            <button class="btn btn-secondary btn-sm delete" style="height: 32px; color: var(--danger-color);" onclick="deleteFile('${fileId}')">
                                 <svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2"><polyline points="3 6 5 6 21 6"></polyline><path d="M19 6v14a2 2 0 0 1-2 2H7a2 2 0 0 1-2-2V6m3 0V4a2 2 0 0 1 2-2h4a2 2 0 0 1 2 2v2"></path></svg>
                             </button>
                         </div>
                     </div>
                 </div>`;
-        } else {
-            html = `
-                <tr class="file-item" style="border-bottom: 1px solid var(--border-color);" id="file-item-${safeId}" data-file-id="${file.file_id}" data-file-url="${fileUrl}" data-filename="${file.filename}" data-short-id="${file.short_id || ''}" data-channel-name="${channelName}" data-filesize="${file.filesize}" data-upload-date="${file.upload_date || ''}" data-tags="${tagsStr}">
-                    <td style="padding: 12px 16px;"><input type="checkbox" class="file-checkbox" data-file-id="${file.file_id}"></td>
+        }
+        return `
+                <tr class="file-item" style="border-bottom: 1px solid var(--border-color);" ${dataAttrs}>
+                    <td style="padding: 12px 16px;"><input type="checkbox" class="file-checkbox" data-file-id="${fileId}"${checked}></td>
                     <td style="padding: 12px 16px;">
                         <div style="display: flex; align-items: center; gap: 8px;">
                             <svg width="20" height="20" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" style="color: var(--primary-color);"><path d="M13 2H6a2 2 0 0 0-2 2v16a2 2 0 0 0 2 2h12a2 2 0 0 0 2-2V9z"></path><polyline points="13 2 13 9 20 9"></polyline></svg>
-                            <span class="text-sm font-medium" style="color: var(--text-primary);">${file.filename}</span>
+                            <span class="text-sm font-medium" style="color: var(--text-primary);">${filename}</span>
                         </div>
                     </td>
                     <td style="padding: 12px 16px;" class="text-sm text-muted">${channelName || '-'}</td>
                     <td style="padding: 12px 16px;" class="text-sm text-muted">
-                        <span class="file-tags-display">
-                            ${
-                                tagsStr
-                                    ? tagsStr
-                                        .split(',')
-                                        .map(t => t.trim())
-                                        .filter(Boolean)
-                                        .map(t => `<span class="tag-chip" style="display:inline-block;padding:2px 6px;margin:0 4px 4px 0;border-radius:999px;background:var(--bg-surface-hover);font-size:11px;color:var(--text-secondary);">${t}</span>`)
-                                        .join('')
-                                    : '-'
-                            }
-                        </span>
+                        <span class="file-tags-display">${renderTagChips(file.tags)}</span>
                         <button class="btn btn-ghost btn-xs edit-tags-btn" style="margin-left: 4px; font-size: 11px; padding: 2px 6px; height: 22px;">标记</button>
                     </td>
                     <td style="padding: 12px 16px;" class="text-sm text-muted">${formattedSize}</td>
@@ -908,19 +871,251 @@ document.addEventListener('DOMContentLoaded', () => {
                             <button class="btn btn-ghost copy-link-btn" style="padding: 4px 8px; height: 28px;" title="复制链接">
                                 <svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2"><rect x="9" y="9" width="13" height="13" rx="2" ry="2"></rect><path d="M5 15H4a2 2 0 0 1-2-2V4a2 2 0 0 1 2-2h9a2 2 0 0 1 2 2v1"></path></svg>
                             </button>
-                            <button class="btn btn-ghost delete" style="padding: 4px 8px; height: 28px; color: var(--danger-color);" onclick="deleteFile('${file.file_id}')" title="删除">
+                            <button class="btn btn-ghost delete" style="padding: 4px 8px; height: 28px; color: var(--danger-color);" onclick="deleteFile('${fileId}')" title="删除">
                                 <svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2"><polyline points="3 6 5 6 21 6"></polyline><path d="M19 6v14a2 2 0 0 1-2 2H7a2 2 0 0 1-2-2V6m3 0V4a2 2 0 0 1 2-2h4a2 2 0 0 1 2 2v2"></path></svg>
                             </button>
                         </div>
                     </td>
                 </tr>`;
+    }
+
+    function renderEmptyState() {
+        if (isGridView) {
+            return `
+                <div style="grid-column: 1/-1; padding: 40px; text-align: center; color: var(--text-tertiary);">
+                    <p>暂无图片</p>
+                </div>`;
+        }
+        return `
+                <tr>
+                    <td colspan="6" style="padding: 48px; text-align: center;">
+                        <div class="text-muted">暂无文件</div>
+                    </td>
+                </tr>`;
+    }
+
+    // 占位元素撑起未渲染部分的高度；网格中占位元素自身也会带一个 gap
+    function renderSpacer(height) {
+        if (height <= 0) return '';
+        if (isGridView) {
+            return `<div class="virtual-spacer" aria-hidden="true" style="grid-column: 1/-1; height: ${Math.max(0, height - GRID_GAP)}px;"></div>`;
+        }
+        return `<tr class="virtual-spacer" aria-hidden="true"><td colspan="7" style="padding: 0; border: 0; height: ${height}px;"></td></tr>`;
+    }
+
+    function getColumnCount() {
+        if (!isGridView) return 1;
+        const tracks = getComputedStyle(fileListContainer).gridTemplateColumns || '';
+        return Math.max(1, tracks.split(' ').filter(Boolean).length);
+    }
+
+    // 以已渲染行的实际间距校准行高（表格行高随标签换行略有差异，取平均值）
+    function measureRowHeight(columns) {
+        const rendered = fileListContainer.querySelectorAll('.file-item');
+        if (rendered.length === 0) return;
+        const first = rendered[0].getBoundingClientRect();
+        const rows = Math.ceil(rendered.length / columns);
+        const measured = rows > 1
+            ? (rendered[rendered.length - 1].getBoundingClientRect().top - first.top) / (rows - 1)
+            : first.height + (isGridView ? GRID_GAP : 0);
+        if (measured <= 0 || Math.abs(measured - virtual.rowHeight) <= 1) return;
+        const firstMeasure = !virtual.rowHeight;
+        virtual.rowHeight = measured;
+        if (firstMeasure) scheduleRender(true);
+    }
+
+    function renderFileWindow(force) {
+        if (!fileListContainer) return;
+        const items = listState.items;
+        if (items.length === 0) {
+            virtual.start = virtual.end = -1;
+            fileListContainer.innerHTML = listState.loading ? '' : renderEmptyState();
+            return;
         }
 
-        container.insertAdjacentHTML('afterbegin', html);
+        const columns = getColumnCount();
+        const rowHeight = virtual.rowHeight || (isGridView ? 280 : 57);
+        const totalRows = Math.ceil(items.length / columns);
+        const rect = fileListContainer.getBoundingClientRect();
+        const viewTop = Math.max(0, -rect.top);
+        const viewBottom = Math.max(0, window.innerHeight - rect.top);
+        const firstRow = Math.min(totalRows, Math.max(0, Math.floor(viewTop / rowHeight) - virtual.overscan));
+        const lastRow = Math.min(totalRows, Math.max(firstRow + 1, Math.ceil(viewBottom / rowHeight) + virtual.overscan));
+        const start = Math.min(items.length, firstRow * columns);
+        const end = Math.min(items.length, lastRow * columns);
+
+        if (force || start !== virtual.start || end !== virtual.end || columns !== virtual.columns) {
+            virtual.start = start;
+            virtual.end = end;
+            virtual.columns = columns;
+            fileListContainer.innerHTML =
+                renderSpacer(firstRow * rowHeight) +
+                items.slice(start, end).map(renderFileHTML).join('') +
+                renderSpacer((totalRows - lastRow) * rowHeight);
+            measureRowHeight(columns);
+        }
+        maybeLoadMore(end);
+    }
 
-        // 新元素加入后，更新过滤选项并应用过滤
-        rebuildFilterOptionsFromItems();
-        applyFilters();
+    function scheduleRender(force) {
+        if (force === true) renderForced = true;
+        if (renderScheduled) return;
+        renderScheduled = true;
+        requestAnimationFrame(() => {
+            renderScheduled = false;
+            const forced = renderForced;
+            renderForced = false;
+            renderFileWindow(forced);
+        });
+    }
+
+    // --- Paging ---
+    function maybeLoadMore(renderedEnd) {
+        if (!listState.nextCursor || listState.loading || Date.now() < listState.retryAt) return;
+        if (renderedEnd < listState.items.length - virtual.overscan * virtual.columns) return;
+        const params = buildFilterQuery();
+        if (!params) return;
+        params.set('cursor', listState.nextCursor);
+        fetchFilePage(params, false);
+    }
+
+    function fetchFilePage(params, replace) {
+        if (replace) listState.generation += 1;
+        const generation = listState.generation;
+        listState.loading = true;
+
+        fetch(`/api/files/page?${params.toString()}`)
+            .then(res => (res.ok ? res.json() : null))
+            .then(page => {
+                if (generation !== listState.generation) return; // 筛选条件已变化，丢弃过期结果
+                listState.loading = false;
+                if (!page) {
+                    listState.retryAt = Date.now() + 3000;
+                    return;
+                }
+                if (replace) {
+                    setFileList(page.files || [], page.next_cursor);
+                } else {
+                    (page.files || []).forEach(appendFile);
+                    listState.nextCursor = page.next_cursor || null;
+                }
+                renderFileWindow(true);
+                updateBatchControls();
+            })
+            .catch(() => {
+                if (generation !== listState.generation) return;
+                listState.loading = false;
+                listState.retryAt = Date.now() + 3000;
+            });
+    }
+
+    // 按当前筛选条件从第一页重新加载
+    function reloadFileList() {
+        if (!fileListContainer) return;
+        listState.selected.clear();
+        setFileList([], null);
+        listState.retryAt = 0;
+
+        // 列表顶部已滚出视口时回到列表开头
+        const rect = fileListContainer.getBoundingClientRect();
+        if (rect.top < 0) window.scrollTo(0, Math.max(0, window.scrollY + rect.top - 80));
+
+        const params = buildFilterQuery();
+        if (params) {
+            fetchFilePage(params, true);
+        } else {
+            listState.generation += 1;
+            listState.loading = false;
+        }
+        renderFileWindow(true);
+        updateBatchControls();
+    }
+
+    function resyncFileList() {
+        reloadFileList();
+        loadFilterFacets();
+    }
+
+    function addNewFileElement(file) {
+        if (!file || !file.file_id) return;
+        // 重连补发的事件可能已经处理过
+        const existing = listState.index.get(file.file_id);
+        if (existing) {
+            Object.assign(existing, file);
+        } else {
+            if (!matchesFilters(file)) return;
+            listState.items.unshift(file);
+            listState.index.set(file.file_id, file);
+        }
+        renderFileWindow(true);
+
+        // 新文件可能带来新的来源 / 标签
+        clearTimeout(facetsTimer);
+        facetsTimer = setTimeout(loadFilterFacets, 1000);
+    }
+
+    function removeFileElement(fileId) {
+        const file = listState.index.get(fileId);
+        if (file) {
+            listState.index.delete(fileId);
+            const i = listState.items.indexOf(file);
+            if (i >= 0) listState.items.splice(i, 1);
+        }
+        listState.selected.delete(fileId);
+        renderFileWindow(true);
+    }
+
+    if (fileListContainer) {
+        // 服务端只渲染了第一页：以这些行初始化列表数据，之后由虚拟列表接管渲染
+        const initialFiles = Array.from(fileListContainer.querySelectorAll('.file-item')).map(readFileFromElement);
+        setFileList(initialFiles, fileListContainer.dataset.nextCursor);
+        renderFileWindow(true);
+
+        window.addEventListener('scroll', scheduleRender, { passive: true });
+        window.addEventListener('resize', () => {
+            virtual.rowHeight = 0;
+            scheduleRender(true);
+        });
+    }
+
+    // --- SSE & Realtime Updates ---
+    if (fileListContainer) {
+        let eventSource = null;
+        let lastEventId = '';
+
+        const connectSSE = () => {
+            if (eventSource) {
+                eventSource.close();
+            }
+            // 手动重连时浏览器不会自动携带 Last-Event-ID，通过查询参数补发断线期间的事件
+            const query = lastEventId ? `?last_event_id=${encodeURIComponent(lastEventId)}` : '';
+            eventSource = new EventSource(`/api/file-updates${query}`);
+
+            // 服务端无法补发（断线太久或服务已重启）时，重新拉取列表
+            eventSource.addEventListener('resync', (event) => {
+                if (event.lastEventId) lastEventId = event.lastEventId;
+                resyncFileList();
+            });
+
+            eventSource.onmessage = (event) => {
+                if (event.lastEventId) lastEventId = event.lastEventId;
+                const msg = JSON.parse(event.data);
+                const action = msg && msg.action ? msg.action : 'add';
+                if (action === 'delete') {
+                    removeFileElement(msg.file_id);
+                    updateBatchControls();
+                    return;
+                }
+                addNewFileElement(msg);
+            };
+
+            eventSource.onerror = () => {
+                try { eventSource.close(); } catch (_) {}
+                setTimeout(connectSSE, 5000);
+            };
+        };
+
+        connectSSE();
     }
 
     // --- Global Helpers ---
@@ -944,30 +1139,4 @@ document.addEventListener('DOMContentLoaded', () => {
                 }
             });
     };
-
-    function removeFileElement(fileId) {
-        const el = document.getElementById(`file-item-${fileId.replace(':', '-')}`);
-        if (el) el.remove();
-        
-        // Check if empty
-        const container = document.getElementById('file-list-disk');
-        if (container && container.children.length === 0) {
-            // Re-render empty state logic if needed, or let user refresh
-            // Simple text fallback
-            const isGridView = document.querySelector('.image-grid') !== null;
-            if (isGridView) {
-                 container.innerHTML = `
-                    <div style="grid-column: 1/-1; padding: 40px; text-align: center; color: var(--text-tertiary);">
-                        <p>暂无图片</p>
-                    </div>`;
-            } else {
-                 container.innerHTML = `
-                    <tr>
-                        <td colspan="6" style="padding: 48px; text-align: center;">
-                            <div class="text-muted">暂无文件</div>
-                        </td>
-                    </tr>`;
-            }
-        }
-    }
 });
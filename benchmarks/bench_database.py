@@ -0,0 +1,48 @@
+"""database 模块热点查询在不同数据规模下的耗时。"""
+
+import itertools
+import random
+
+import pytest
+
+from app import database
+from conftest import short_id_for
+
+
+@pytest.mark.benchmark(group="db.get_file_by_id")
+def bench_get_file_by_id(benchmark, populated_db, rows):
+    rng = random.Random(0)
+    ids = [short_id_for(rng.randrange(rows)) for _ in range(1000)]
+    cycle = itertools.cycle(ids)
+
+    result = benchmark(lambda: database.get_file_by_id(next(cycle)))
+    assert result is not None
+
+
+@pytest.mark.benchmark(group="db.get_file_by_id")
+def bench_get_file_by_id_miss(benchmark, populated_db, rows):
+    assert benchmark(database.get_file_by_id, "missing") is None
+
+
+@pytest.mark.benchmark(group="db.get_all_files")
+def bench_get_all_files(benchmark, populated_db, rows):
+    # 百万行时单次调用可达数秒，固定轮数避免自动校准耗时过长
+    result = benchmark.pedantic(database.get_all_files, rounds=3, iterations=1, warmup_rounds=1)
+    assert len(result) == rows
+
+
+@pytest.mark.benchmark(group="db.get_files_page")
+def bench_get_files_page(benchmark, populated_db, rows):
+    files, _ = benchmark(database.get_files_page, limit=database.DEFAULT_PAGE_SIZE)
+    assert len(files) == min(rows, database.DEFAULT_PAGE_SIZE)
+
+
+@pytest.mark.benchmark(group="db.add_file_metadata")
+def bench_add_file_metadata(benchmark, populated_db, rows):
+    counter = itertools.count()
+
+    def add():
+        i = next(counter)
+        return database.add_file_metadata(f"bench_{i}.jpg", f"9{i}:bench-{rows}-{i}", 1024, "@bench")
+
+    assert benchmark(add)
@@ -0,0 +1,44 @@
+"""BroadcastEventBus 向大量 SSE 订阅者扇出事件。"""
+
+import asyncio
+
+import pytest
+
+from app.events import BroadcastEventBus
+
+
+@pytest.mark.benchmark(group="events.fanout")
+@pytest.mark.parametrize("subscribers", [100, 1000])
+def bench_publish_fanout(benchmark, subscribers):
+    """发布一个事件，直到所有订阅者被唤醒并读到该事件为止。"""
+    loop = asyncio.new_event_loop()
+    bus = BroadcastEventBus(history_size=1000)
+    state = {"pending": 0, "done": None}
+
+    async def subscriber():
+        cursor = await bus.subscribe()
+        while True:
+            await bus.wait(cursor, timeout=60)
+            events, _ = bus.read_since(cursor)
+            if events:
+                cursor = events[-1][0]
+                state["pending"] -= 1
+                if state["pending"] == 0:
+                    state["done"].set()
+
+    async def publish_once():
+        state["pending"] = subscribers
+        state["done"] = asyncio.Event()
+        await bus.publish('{"action": "add"}')
+        await state["done"].wait()
+
+    tasks = [loop.create_task(subscriber()) for _ in range(subscribers)]
+    loop.run_until_complete(asyncio.sleep(0))
+    try:
+        benchmark(lambda: loop.run_until_complete(publish_once()))
+    finally:
+        for task in tasks:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        loop.close()
+    assert bus.subscriber_count == subscribers
@@ -0,0 +1,77 @@
+"""清单解析与 Range 请求处理。"""
+
+import asyncio
+
+import httpx
+import pytest
+from starlette.requests import Request
+
+from app.api.files import parse_range_header, serve_file
+from app.services.telegram_service import parse_manifest
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def _manifest(chunks: int) -> bytes:
+    lines = ["tgstate-blob", "big-video.mkv"] + [f"{1000 + i}:BQACAgUAAx0{i:020d}" for i in range(chunks)]
+    return "\n".join(lines).encode("utf-8")
+
+
+@pytest.mark.benchmark(group="manifest.parse")
+@pytest.mark.parametrize("chunks", [10, 100, 1000])
+def bench_parse_manifest(benchmark, chunks):
+    content = _manifest(chunks)
+    _, chunk_ids = benchmark(parse_manifest, content)
+    assert len(chunk_ids) == chunks
+
+
+@pytest.mark.benchmark(group="range.parse")
+@pytest.mark.parametrize("header", ["bytes=0-", "bytes=1048576-2097151", "bytes=-500", "items=0-1"])
+def bench_parse_range_header(benchmark, header):
+    benchmark(parse_range_header, header, 100 * CHUNK_SIZE)
+
+
+class _FakeTelegramService:
+    async def get_download_url(self, file_id: str) -> str:
+        return f"https://tg.invalid/file/bot/{file_id}"
+
+
+def _upstream(request: httpx.Request) -> httpx.Response:
+    start, end = request.headers["range"].split("=", 1)[1].split("-")
+    return httpx.Response(206, content=b"\0" * (int(end) - int(start) + 1))
+
+
+def _request(range_header: str) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/d/abc",
+        "query_string": b"",
+        "headers": [(b"range", range_header.encode("ascii"))],
+    })
+
+
+@pytest.mark.benchmark(group="range.serve_file")
+@pytest.mark.parametrize("length", [64 * 1024, CHUNK_SIZE])
+def bench_serve_file_range(benchmark, length):
+    """serve_file 处理单段 Range 请求（上游为内存中的模拟服务器），包含消费完整响应体。"""
+    loop = asyncio.new_event_loop()
+    client = httpx.AsyncClient(transport=httpx.MockTransport(_upstream))
+    service = _FakeTelegramService()
+
+    async def serve_once():
+        response = await serve_file(
+            "1:abc", "video.mp4", service, client, _request(f"bytes=0-{length - 1}"),
+            filesize=100 * CHUNK_SIZE, is_manifest=False,
+        )
+        received = 0
+        async for chunk in response.body_iterator:
+            received += len(chunk)
+        return response.status_code, received
+
+    try:
+        status, received = benchmark(lambda: loop.run_until_complete(serve_once()))
+    finally:
+        loop.run_until_complete(client.aclose())
+        loop.close()
+    assert status == 206 and received == length
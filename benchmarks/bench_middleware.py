@@ -0,0 +1,61 @@
+"""中间件栈（追踪 + 安全头 / 鉴权）在每个请求上的开销。"""
+
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+from app.core.middleware import SecurityAuthMiddleware
+from app.core.tracing import TracingMiddleware
+
+SESSION_COOKIE = "tgstate_session=" + hashlib.sha256(os.environ["PASS_WORD"].encode("utf-8")).hexdigest()
+
+
+async def _endpoint(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def _scope(path: str, cookie: str | None) -> dict:
+    headers = [(b"host", b"bench"), (b"accept-encoding", b"gzip, br")]
+    if cookie:
+        headers.append((b"cookie", cookie.encode("ascii")))
+    return {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "scheme": "http",
+        "query_string": b"",
+        "headers": headers,
+    }
+
+
+@pytest.mark.benchmark(group="middleware")
+@pytest.mark.parametrize(
+    "path,cookie",
+    [("/api/files/page", SESSION_COOKIE), ("/d/abc123", None), ("/", None)],
+    ids=["protected-api", "public-download", "redirect-login"],
+)
+@pytest.mark.parametrize("tracing", [False, True], ids=["tracing-off", "tracing-on"])
+def bench_middleware_stack(benchmark, monkeypatch, path, cookie, tracing):
+    from app.core.config import get_settings
+
+    monkeypatch.setattr(get_settings(), "TRACE_SAMPLE_RATE", 1.0 if tracing else 0.0)
+    app = TracingMiddleware(SecurityAuthMiddleware(_endpoint))
+    loop = asyncio.new_event_loop()
+    scope = _scope(path, cookie)
+    statuses = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    try:
+        benchmark(lambda: loop.run_until_complete(app(dict(scope), receive, send)))
+    finally:
+        loop.close()
+    assert statuses and statuses[-1] in (200, 307)
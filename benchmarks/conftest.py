@@ -0,0 +1,99 @@
+"""
+基准测试公共夹具。
+
+在导入 app 之前把 DATA_DIR 指向临时目录，避免读写真实数据库；
+按 --bench-rows 指定的行数生成测试数据库（每种规模在一次运行中只生成一次）。
+"""
+
+import os
+import sqlite3
+import string
+import tempfile
+from datetime import datetime, timedelta
+
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="tgstate-bench-"))
+os.environ.setdefault("PASS_WORD", "bench-password")
+
+import pytest  # noqa: E402
+
+from app import database  # noqa: E402
+from app.core.filetypes import classify_file  # noqa: E402
+
+DEFAULT_ROWS = "10000,100000,1000000"
+_ALPHABET = string.ascii_letters + string.digits
+_SAMPLE_NAMES = ("photo.jpg", "movie.mp4", "notes.txt", "archive.zip", "report.pdf", "song.mp3", "data.bin")
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--bench-rows",
+        default=os.getenv("BENCH_ROWS", DEFAULT_ROWS),
+        help=f"数据库基准的行数规模，逗号分隔（默认 {DEFAULT_ROWS}）",
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if "rows" in metafunc.fixturenames:
+        scales = [int(v) for v in metafunc.config.getoption("--bench-rows").split(",") if v.strip()]
+        metafunc.parametrize("rows", scales, scope="session")
+
+
+def short_id_for(index: int) -> str:
+    """确定性的 6 位 short_id，保证生成的数据不冲突且可直接查询。"""
+    chars = []
+    for _ in range(6):
+        index, rem = divmod(index, len(_ALPHABET))
+        chars.append(_ALPHABET[rem])
+    return "".join(reversed(chars))
+
+
+def _populate(path: str, rows: int) -> None:
+    original_url = database.DATABASE_URL
+    database.DATABASE_URL = path
+    try:
+        database.init_db()
+    finally:
+        database.DATABASE_URL = original_url
+
+    start = datetime(2024, 1, 1)
+    conn = sqlite3.connect(path)
+    try:
+        def generate():
+            for i in range(rows):
+                name = f"{i}_{_SAMPLE_NAMES[i % len(_SAMPLE_NAMES)]}"
+                file_type = classify_file(name)
+                yield (
+                    name,
+                    f"{100000 + i}:BQACAgUAAx0{i:012d}",
+                    (i * 7919) % (50 * 1024 * 1024),
+                    (start + timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S"),
+                    short_id_for(i),
+                    "@bench",
+                    file_type.mime_type,
+                    file_type.category,
+                    int(file_type.previewable),
+                )
+
+        conn.executemany(
+            "INSERT INTO files (filename, file_id, filesize, upload_date, short_id, channel_name, "
+            "mime_type, category, previewable) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            generate(),
+        )
+        conn.commit()
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+
+@pytest.fixture(scope="session")
+def db_path(rows, tmp_path_factory):
+    """生成包含 rows 行文件记录的数据库，并返回其路径。"""
+    path = str(tmp_path_factory.mktemp(f"db-{rows}") / "file_metadata.db")
+    _populate(path, rows)
+    return path
+
+
+@pytest.fixture
+def populated_db(db_path, monkeypatch):
+    monkeypatch.setattr(database, "DATABASE_URL", db_path)
+    return db_path
@@ -0,0 +1,399 @@
+"""
+本地模拟的 Telegram Bot API 服务器，用于不依赖真实机器人的端到端压测。
+
+实现 tgState 用到的方法：getMe、sendDocument、sendMessage、getFile、deleteMessage、deleteMessages、getChat、
+getUpdates、setWebhook / deleteWebhook，以及支持 Range 的 /file/bot<token>/<file_path> 下载。
+上传的文件保存在本地磁盘，文件索引只保存在内存中（重启后清空）；启动时会加载存储目录下
+scripts/gen_catalogue.py --objects 生成的 seed.jsonl，使合成目录中的记录可以下载。
+
+可注入的故障与性能特征（环境变量或命令行参数）：
+    FAKE_TG_LATENCY_MS     每个请求的附加延迟（毫秒），默认 0
+    FAKE_TG_JITTER_MS      在附加延迟上叠加的随机抖动上限（毫秒），默认 0
+    FAKE_TG_BANDWIDTH      上传 / 下载带宽上限（字节/秒），0 表示不限，默认 0
+    FAKE_TG_RATE_LIMIT     Bot API 请求返回 429 的概率（0~1），默认 0
+    FAKE_TG_RETRY_AFTER    429 响应中的 retry_after（秒），默认 1
+    FAKE_TG_ERROR_RATE     Bot API 请求返回 500 的概率（0~1），默认 0
+    FAKE_TG_STORAGE        文件存放目录，默认为系统临时目录下的 tgstate-fake-bot-api
+
+使用方法:
+    python scripts/fake_bot_api.py --port 8081 --latency-ms 50 --bandwidth 20000000 --rate-limit 0.01
+    # tgState 中配置
+    TELEGRAM_API_BASE_URL=http://127.0.0.1:8081 BOT_TOKEN=123456:fake CHANNEL_NAME=@loadtest \\
+        uvicorn app.main:app
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import secrets
+import tempfile
+import time
+import zlib
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+STREAM_CHUNK_SIZE = 64 * 1024
+# 预置对象索引，每行一个 JSON：message_id、file_id、file_unique_id、file_name、file_size、mime_type
+SEED_INDEX_NAME = "seed.jsonl"
+
+
+class FakeConfig:
+    def __init__(self):
+        self.latency_ms = float(os.getenv("FAKE_TG_LATENCY_MS", "0"))
+        self.jitter_ms = float(os.getenv("FAKE_TG_JITTER_MS", "0"))
+        self.bandwidth = int(os.getenv("FAKE_TG_BANDWIDTH", "0"))
+        self.rate_limit = float(os.getenv("FAKE_TG_RATE_LIMIT", "0"))
+        self.retry_after = int(os.getenv("FAKE_TG_RETRY_AFTER", "1"))
+        self.error_rate = float(os.getenv("FAKE_TG_ERROR_RATE", "0"))
+        self.storage = os.getenv("FAKE_TG_STORAGE") or os.path.join(tempfile.gettempdir(), "tgstate-fake-bot-api")
+
+
+config = FakeConfig()
+app = FastAPI(title="Fake Telegram Bot API")
+
+# file_id -> {"path", "file_name", "file_size", "file_unique_id", "mime_type"}
+_files: dict[str, dict] = {}
+# message_id -> file_id（无文件的消息为 None）
+_messages: dict[int, str | None] = {}
+_message_ids = itertools.count(1)
+
+
+def _ok(result) -> JSONResponse:
+    return JSONResponse({"ok": True, "result": result})
+
+
+def _fail(status_code: int, description: str, **parameters) -> JSONResponse:
+    payload = {"ok": False, "error_code": status_code, "description": description}
+    if parameters:
+        payload["parameters"] = parameters
+    return JSONResponse(payload, status_code=status_code)
+
+
+def _chat(chat_id) -> dict:
+    """@username 形式的频道没有数字 ID，用其 CRC32 生成稳定的负数 ID。"""
+    text = str(chat_id)
+    try:
+        numeric_id = int(text)
+    except ValueError:
+        numeric_id = -1000000000000 - zlib.crc32(text.encode("utf-8"))
+    chat = {"id": numeric_id, "type": "channel", "title": text.lstrip("@")}
+    if text.startswith("@"):
+        chat["username"] = text[1:]
+    return chat
+
+
+def _message(chat_id, message_id: int, **extra) -> dict:
+    return {"message_id": message_id, "date": int(time.time()), "chat": _chat(chat_id), **extra}
+
+
+async def _inject_latency() -> None:
+    delay = config.latency_ms + (random.uniform(0, config.jitter_ms) if config.jitter_ms else 0)
+    if delay > 0:
+        await asyncio.sleep(delay / 1000)
+
+
+async def _throttle(nbytes: int) -> None:
+    if config.bandwidth > 0 and nbytes:
+        await asyncio.sleep(nbytes / config.bandwidth)
+
+
+async def _read_params(request: Request) -> tuple[dict, dict]:
+    """返回 (普通参数, 上传文件)；兼容 query、urlencoded、multipart 与 JSON。"""
+    params = dict(request.query_params)
+    uploads = {}
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("application/json"):
+        body = await request.body()
+        if body:
+            params.update(json.loads(body))
+    elif content_type.startswith(("multipart/form-data", "application/x-www-form-urlencoded")):
+        form = await request.form()
+        for key, value in form.multi_items():
+            if hasattr(value, "read"):
+                uploads[key] = value
+            else:
+                params[key] = value
+    return params, uploads
+
+
+async def _store_upload(upload) -> dict:
+    data = await upload.read()
+    await _throttle(len(data))
+    file_id = "FAKE" + secrets.token_urlsafe(24)
+    file_unique_id = secrets.token_urlsafe(8)
+    path = os.path.join(config.storage, file_unique_id)
+    await asyncio.to_thread(_write_file, path, data)
+    meta = {
+        "path": path,
+        "file_name": upload.filename or "document",
+        "file_size": len(data),
+        "file_unique_id": file_unique_id,
+        "mime_type": upload.content_type or "application/octet-stream",
+    }
+    _files[file_id] = meta
+    return {"file_id": file_id, **meta}
+
+
+def _write_file(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+async def _send_document(params: dict, uploads: dict) -> JSONResponse:
+    upload = uploads.get("document")
+    if upload is None:
+        return _fail(400, "Bad Request: there is no document in the request")
+    stored = await _store_upload(upload)
+    message_id = next(_message_ids)
+    _messages[message_id] = stored["file_id"]
+    document = {
+        "file_id": stored["file_id"],
+        "file_unique_id": stored["file_unique_id"],
+        "file_name": stored["file_name"],
+        "mime_type": stored["mime_type"],
+        "file_size": stored["file_size"],
+    }
+    return _ok(_message(params.get("chat_id"), message_id, document=document))
+
+
+async def _send_message(params: dict, uploads: dict) -> JSONResponse:
+    message_id = next(_message_ids)
+    _messages[message_id] = None
+    return _ok(_message(params.get("chat_id"), message_id, text=params.get("text", "")))
+
+
+async def _get_file(params: dict, uploads: dict) -> JSONResponse:
+    file_id = params.get("file_id", "")
+    meta = _files.get(file_id)
+    if meta is None:
+        return _fail(400, "Bad Request: invalid file_id")
+    return _ok({
+        "file_id": file_id,
+        "file_unique_id": meta["file_unique_id"],
+        "file_size": meta["file_size"],
+        "file_path": f"documents/{meta['file_unique_id']}",
+    })
+
+
+async def _delete_message(params: dict, uploads: dict) -> JSONResponse:
+    try:
+        message_id = int(params.get("message_id", 0))
+    except ValueError:
+        return _fail(400, "Bad Request: invalid message_id")
+    if message_id not in _messages:
+        return _fail(400, "Bad Request: message to delete not found")
+    file_id = _messages.pop(message_id)
+    meta = _files.pop(file_id, None) if file_id else None
+    if meta:
+        try:
+            os.unlink(meta["path"])
+        except OSError:
+            pass
+    return _ok(True)
+
+
+async def _delete_messages(params: dict, uploads: dict) -> JSONResponse:
+    # message_ids 以 JSON 数组传入；与官方一致，一次最多 100 条，找不到的消息直接跳过
+    try:
+        message_ids = params.get("message_ids", "[]")
+        if isinstance(message_ids, str):
+            message_ids = json.loads(message_ids)
+        message_ids = [int(m) for m in message_ids]
+    except (TypeError, ValueError):
+        return _fail(400, "Bad Request: invalid message_ids")
+    if not 1 <= len(message_ids) <= 100:
+        return _fail(400, "Bad Request: message_ids must contain 1-100 items")
+    for message_id in message_ids:
+        file_id = _messages.pop(message_id, None)
+        meta = _files.pop(file_id, None) if file_id else None
+        if meta:
+            try:
+                os.unlink(meta["path"])
+            except OSError:
+                pass
+    return _ok(True)
+
+
+async def _get_me(params: dict, uploads: dict) -> JSONResponse:
+    return _ok({
+        "id": 1000001,
+        "is_bot": True,
+        "first_name": "Fake tgState Bot",
+        "username": "fake_tgstate_bot",
+        "can_join_groups": True,
+        "can_read_all_group_messages": True,
+        "supports_inline_queries": False,
+    })
+
+
+async def _get_chat(params: dict, uploads: dict) -> JSONResponse:
+    chat = _chat(params.get("chat_id"))
+    chat["accent_color_id"] = 0
+    chat["max_reaction_count"] = 0
+    return _ok(chat)
+
+
+async def _get_updates(params: dict, uploads: dict) -> JSONResponse:
+    # 没有真实用户发消息，长轮询等待到超时后返回空列表
+    await asyncio.sleep(min(float(params.get("timeout", 0) or 0), 30))
+    return _ok([])
+
+
+async def _return_true(params: dict, uploads: dict) -> JSONResponse:
+    return _ok(True)
+
+
+_METHODS = {
+    "getme": _get_me,
+    "senddocument": _send_document,
+    "sendmessage": _send_message,
+    "getfile": _get_file,
+    "deletemessage": _delete_message,
+    "deletemessages": _delete_messages,
+    "getchat": _get_chat,
+    "getupdates": _get_updates,
+    "setwebhook": _return_true,
+    "deletewebhook": _return_true,
+    "setmycommands": _return_true,
+}
+
+
+@app.api_route("/bot{token}/{method}", methods=["GET", "POST"])
+async def bot_api(token: str, method: str, request: Request):
+    handler = _METHODS.get(method.lower())
+    if handler is None:
+        return _fail(404, "Not Found: method not found")
+
+    await _inject_latency()
+    # 长轮询不参与故障注入，否则机器人会不断重试刷屏
+    if handler is not _get_updates:
+        roll = random.random()
+        if roll < config.rate_limit:
+            return _fail(
+                429, f"Too Many Requests: retry after {config.retry_after}", retry_after=config.retry_after
+            )
+        if roll < config.rate_limit + config.error_rate:
+            return _fail(500, "Internal Server Error: injected failure")
+
+    params, uploads = await _read_params(request)
+    return await handler(params, uploads)
+
+
+def _parse_range(range_header: str, size: int) -> tuple[int, int] | None:
+    try:
+        unit, spec = range_header.split("=", 1)
+        if unit.strip() != "bytes":
+            return None
+        start_str, end_str = spec.split(",", 1)[0].strip().split("-", 1)
+        if not start_str:
+            start, end = max(0, size - int(end_str)), size - 1
+        else:
+            start = int(start_str)
+            end = min(int(end_str), size - 1) if end_str else size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        return None
+    return start, end
+
+
+@app.api_route("/file/bot{token}/{file_path:path}", methods=["GET", "HEAD"])
+async def download(token: str, file_path: str, request: Request):
+    unique_id = file_path.rsplit("/", 1)[-1]
+    path = os.path.join(config.storage, unique_id)
+    if not os.path.isfile(path):
+        return Response(status_code=404)
+    await _inject_latency()
+
+    size = os.path.getsize(path)
+    start, end, status = 0, size - 1, 200
+    headers = {"Accept-Ranges": "bytes"}
+    byte_range = _parse_range(request.headers.get("range", ""), size) if request.headers.get("range") else None
+    if byte_range:
+        start, end = byte_range
+        status = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    if request.method == "HEAD":
+        return Response(status_code=status, headers=headers)
+
+    async def body():
+        remaining = end - start + 1
+        with open(path, "rb") as f:
+            f.seek(start)
+            while remaining > 0:
+                data = await asyncio.to_thread(f.read, min(STREAM_CHUNK_SIZE, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                await _throttle(len(data))
+                yield data
+
+    return StreamingResponse(body(), status_code=status, headers=headers, media_type="application/octet-stream")
+
+
+def load_seed(storage: str) -> int:
+    """加载存储目录中的预置对象索引，返回加载的对象数。"""
+    global _message_ids
+    path = os.path.join(storage, SEED_INDEX_NAME)
+    if not os.path.isfile(path):
+        return 0
+    loaded = 0
+    last_message_id = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            _files[item["file_id"]] = {
+                "path": os.path.join(storage, item["file_unique_id"]),
+                "file_name": item["file_name"],
+                "file_size": item["file_size"],
+                "file_unique_id": item["file_unique_id"],
+                "mime_type": item["mime_type"],
+            }
+            _messages[item["message_id"]] = item["file_id"]
+            last_message_id = max(last_message_id, item["message_id"])
+            loaded += 1
+    # 新消息的 ID 接在预置消息之后
+    _message_ids = itertools.count(max(next(_message_ids), last_message_id + 1))
+    return loaded
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="模拟的 Telegram Bot API 服务器（压测用）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=config.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=config.jitter_ms)
+    parser.add_argument("--bandwidth", type=int, default=config.bandwidth, help="字节/秒，0 表示不限")
+    parser.add_argument("--rate-limit", type=float, default=config.rate_limit, help="返回 429 的概率")
+    parser.add_argument("--retry-after", type=int, default=config.retry_after)
+    parser.add_argument("--error-rate", type=float, default=config.error_rate, help="返回 500 的概率")
+    parser.add_argument("--storage", default=config.storage)
+    args = parser.parse_args()
+
+    config.latency_ms = args.latency_ms
+    config.jitter_ms = args.jitter_ms
+    config.bandwidth = args.bandwidth
+    config.rate_limit = args.rate_limit
+    config.retry_after = args.retry_after
+    config.error_rate = args.error_rate
+    config.storage = args.storage
+    seeded = load_seed(config.storage)
+    if seeded:
+        print(f"已加载 {seeded} 个预置对象（{SEED_INDEX_NAME}）")
+
+    import uvicorn
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""
+tgState 合成文件目录生成器
+
+向 file_metadata.db 批量写入大量“看起来真实”的文件记录，用于在预发环境复现大文件库下的
+列表、搜索、分页与页面渲染性能问题：
+- 文件大小按类别取对数正态分布（大量小图片 / 文档，少量大视频 / 压缩包），
+  超过分块阈值的文件按清单（manifest）文件记录；
+- 分布在多个频道（越靠前的频道文件越多），少量记录没有频道（旧数据）；
+- 标签按 Zipf 分布抽取，约四成文件没有标签；
+- 文件名混合中日韩文字与英文；
+- 上传时间分布在 --days 天内，越接近现在越密集，并按时间顺序插入（与真实数据的 id 顺序一致）。
+
+每 --batch 行在一个事务中提交，加载期间关闭同步写盘；百万行的耗时主要在 short_id / file_id 唯一索引的维护上，
+一般机器上约十几秒。
+写入后为新行补写 file_changes（增量同步）并执行 ANALYZE。
+
+可选 --objects：在模拟 Bot API 服务器（scripts/fake_bot_api.py）的存储目录中为前 --objects-limit
+条记录创建对应的文件（稀疏文件，不占用实际磁盘空间）与清单、分块，并追加到 seed.jsonl，
+模拟服务器启动时会加载它，于是这些记录可以真实地下载。
+
+使用方法:
+    # 写入 DATA_DIR（默认 app/data）下的数据库
+    python scripts/gen_catalogue.py --rows 1000000
+
+    # 写入指定数据库，并为前 1 万条记录创建模拟服务器中的文件
+    python scripts/gen_catalogue.py --rows 200000 --db /tmp/tgstate/file_metadata.db \\
+        --objects /tmp/tgstate-fake-bot-api --objects-limit 10000
+"""
+
+import argparse
+import base64
+import bisect
+import itertools
+import json
+import math
+import os
+import random
+import sqlite3
+import string
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import database  # noqa: E402
+from app.core.filetypes import classify_file  # noqa: E402
+from app.services.telegram_service import CHUNK_SIZE_BYTES  # noqa: E402
+
+# 与 scripts/fake_bot_api.py 中的 SEED_INDEX_NAME 保持一致
+SEED_INDEX_NAME = "seed.jsonl"
+
+_ALPHABET = string.ascii_letters + string.digits
+_SHORT_ID_SPACE = len(_ALPHABET) ** 6
+# 与 62^6 互素的乘数，把连续序号打散成看起来随机、但保证不重复的 short_id
+_SHORT_ID_MULTIPLIER = 1_000_000_007
+
+# 类别: (权重, 扩展名, 对数正态分布的中位数字节数, sigma)
+_CATEGORY_PROFILES = {
+    "image": (40, ("jpg", "jpg", "jpeg", "png", "png", "gif", "webp"), 900 * 1024, 1.0),
+    "document": (20, ("pdf", "pdf", "docx", "xlsx", "pptx", "txt", "md"), 300 * 1024, 1.4),
+    "video": (10, ("mp4", "mp4", "mkv", "mov", "webm"), 120 * 1024 * 1024, 1.3),
+    "audio": (8, ("mp3", "mp3", "flac", "m4a", "ogg"), 6 * 1024 * 1024, 0.8),
+    "archive": (10, ("zip", "zip", "rar", "7z", "tar", "gz"), 40 * 1024 * 1024, 1.8),
+    "other": (12, ("bin", "apk", "iso", "exe", "dmg", "json", "log"), 2 * 1024 * 1024, 2.0),
+}
+_MAX_FILESIZE = 8 * 1024 * 1024 * 1024
+
+_LATIN_WORDS = (
+    "report", "invoice", "holiday", "meeting", "backup", "screenshot", "draft", "final", "scan",
+    "photo", "video", "project", "design", "notes", "budget", "contract", "export", "release",
+    "lecture", "podcast", "album", "trip", "family", "wallpaper", "dataset", "archive", "log",
+)
+_CJK_WORDS = (
+    "年度报告", "会议记录", "旅行照片", "家庭视频", "设计稿", "合同扫描件", "课程讲义", "毕业照", "发票",
+    "东京", "上海", "北京", "台北", "香港", "周末", "备份", "草稿", "最终版", "截图", "壁纸", "歌单",
+    "発表資料", "写真", "議事録", "旅行", "사진", "회의록", "여행", "보고서",
+)
+_TAG_WORDS = (
+    "work", "personal", "photos", "video", "music", "docs", "backup", "important", "todo", "archive",
+    "2021", "2022", "2023", "2024", "2025", "travel", "family", "design", "receipts", "school",
+    "工作", "家庭", "旅行", "重要", "备份", "学习", "照片", "视频", "音乐", "待整理", "写真", "여행",
+)
+
+
+_PAIRS = [a + b for a in _ALPHABET for b in _ALPHABET]
+_PAIR_SPACE = len(_PAIRS)
+
+
+def short_id_for(index: int) -> str:
+    value = (index * _SHORT_ID_MULTIPLIER) % _SHORT_ID_SPACE
+    high, low = divmod(value, _PAIR_SPACE)
+    high, middle = divmod(high, _PAIR_SPACE)
+    return _PAIRS[high] + _PAIRS[middle] + _PAIRS[low]
+
+
+def fake_file_id(rng: random.Random) -> str:
+    """形如 Telegram document file_id 的随机字符串。"""
+    return "BQACAgUAAx0" + base64.urlsafe_b64encode(rng.getrandbits(360).to_bytes(45, "big")).decode("ascii")
+
+
+class CatalogueGenerator:
+    """按参数生成 files 表的行，以及（可选）模拟 Bot API 服务器中的对象。"""
+
+    def __init__(self, args: argparse.Namespace, first_index: int, first_message_id: int):
+        self.args = args
+        # 追加写入时随机序列随已有行数变化，避免生成与上次相同的 file_id
+        self.rng = random.Random(f"{args.seed}:{first_index}")
+        self.first_index = first_index
+        self.message_ids = itertools.count(first_message_id)
+
+        self.categories = list(_CATEGORY_PROFILES)
+        self.category_weights = list(itertools.accumulate(p[0] for p in _CATEGORY_PROFILES.values()))
+
+        # 频道按 1/k 分布：第一个频道的文件最多
+        self.channels = [f"@tgstate_lib{i + 1}" for i in range(args.channels)]
+        self.channel_weights = list(itertools.accumulate(1 / (k + 1) for k in range(args.channels)))
+
+        # 标签词表：常见词 + 编号标签，按 Zipf 分布抽取
+        vocabulary = list(_TAG_WORDS)
+        vocabulary += [f"tag{i}" for i in range(max(0, args.tags - len(vocabulary)))]
+        self.tags = vocabulary[: args.tags]
+        self.tag_weights = list(itertools.accumulate(1 / (k + 1) ** args.zipf for k in range(len(self.tags))))
+
+        self.end = datetime.now().replace(microsecond=0)
+        self.start = self.end.replace(hour=0, minute=0, second=0) - timedelta(days=args.days)
+        self._span = (self.end - self.start).total_seconds()
+        self._day_cache: dict[int, str] = {}
+
+        self.stats = {"manifests": 0, "chunks": 0, "objects": 0, "bytes": 0}
+        # 类型只取决于扩展名；文件名几乎都不相同，按扩展名缓存比 classify_file 自带的缓存有效得多
+        self._file_types: dict[str, tuple[str, str, int]] = {}
+
+    def _file_type(self, filename: str) -> tuple[str, str, int]:
+        ext = filename.rsplit(".", 1)[-1]
+        cached = self._file_types.get(ext)
+        if cached is None:
+            file_type = classify_file(filename)
+            cached = (file_type.mime_type, file_type.category, int(file_type.previewable))
+            self._file_types[ext] = cached
+        return cached
+
+    def _choice(self, items, cum_weights):
+        return items[bisect.bisect(cum_weights, self.rng.random() * cum_weights[-1])]
+
+    def _pick(self, items):
+        # 比 random.choice 快数倍，百万行时差别明显
+        return items[int(self.rng.random() * len(items))]
+
+    def _filename(self, category: str) -> str:
+        pick = self._pick
+        ext = pick(_CATEGORY_PROFILES[category][1])
+        if self.rng.random() < self.args.cjk_ratio:
+            stem = pick(_CJK_WORDS) + pick(("", "_", " ", "-")) + pick(_CJK_WORDS)
+        else:
+            stem = pick(_LATIN_WORDS) + pick(("_", "-", " ")) + pick(_LATIN_WORDS)
+        if self.rng.random() < 0.7:
+            stem += f"_{int(self.rng.random() * 9999) + 1}"
+        return f"{stem}.{ext}"
+
+    def _filesize(self, category: str) -> int:
+        _, _, median, sigma = _CATEGORY_PROFILES[category]
+        size = int(self.rng.lognormvariate(math.log(median), sigma))
+        return max(1, min(size, _MAX_FILESIZE))
+
+    def _tags(self) -> str | None:
+        rng = self.rng
+        if rng.random() < 0.4:
+            return None
+        picked = []
+        for _ in range(self._pick((1, 1, 1, 2, 2, 3))):
+            tag = self._choice(self.tags, self.tag_weights)
+            if tag not in picked:
+                picked.append(tag)
+        return ",".join(picked)
+
+    def _upload_date(self, position: int) -> str:
+        # 时间随序号按平方根增长：越接近现在，单位时间内的文件越多；并保持单调递增
+        offset = int(self._span * math.sqrt((position + 1) / self.args.rows))
+        days, seconds = divmod(offset, 86400)
+        day = self._day_cache.get(days)
+        if day is None:
+            day = self._day_cache[days] = (self.start + timedelta(days=days)).strftime("%Y-%m-%d")
+        # 起点取整到当天 00:00:00，方便按天缓存日期部分
+        hours, rest = divmod(seconds, 3600)
+        return f"{day} {hours:02d}:{rest // 60:02d}:{rest % 60:02d}"
+
+    def rows(self, seed_index=None):
+        """逐行生成 files 表的记录；seed_index 不为 None 时同时为前 objects_limit 行创建对象。"""
+        args = self.args
+        for position in range(args.rows):
+            category = self._choice(self.categories, self.category_weights)
+            filename = self._filename(category)
+            filesize = self._filesize(category)
+            is_manifest = filesize >= CHUNK_SIZE_BYTES
+            channel = None if self.rng.random() < 0.02 else self._choice(self.channels, self.channel_weights)
+            with_object = seed_index is not None and position < args.objects_limit
+
+            if is_manifest:
+                self.stats["manifests"] += 1
+                chunk_count = math.ceil(filesize / CHUNK_SIZE_BYTES)
+                self.stats["chunks"] += chunk_count
+                # 分块消息只存在于 Telegram 侧，数据库中不记录；不创建对象时只需跳过相应的消息 ID
+                chunk_ids = []
+                for chunk in range(chunk_count):
+                    message_id = next(self.message_ids)
+                    if with_object:
+                        chunk_id = f"{message_id}:{fake_file_id(self.rng)}"
+                        chunk_ids.append(chunk_id)
+                        chunk_size = min(CHUNK_SIZE_BYTES, filesize - chunk * CHUNK_SIZE_BYTES)
+                        self._write_object(seed_index, chunk_id, f"{filename}.part{chunk + 1}", chunk_size)
+                file_id = f"{next(self.message_ids)}:{fake_file_id(self.rng)}"
+                if with_object:
+                    manifest = f"tgstate-blob\n{filename}\n" + "\n".join(chunk_ids)
+                    self._write_object(seed_index, file_id, f"{filename}.manifest", content=manifest.encode("utf-8"))
+            else:
+                file_id = f"{next(self.message_ids)}:{fake_file_id(self.rng)}"
+                if with_object:
+                    self._write_object(seed_index, file_id, filename, filesize)
+
+            self.stats["bytes"] += filesize
+            mime_type, category, previewable = self._file_type(filename)
+            yield (
+                filename,
+                file_id,
+                filesize,
+                self._upload_date(position),
+                short_id_for(self.first_index + position),
+                channel,
+                self._tags(),
+                mime_type,
+                category,
+                previewable,
+            )
+
+    def _write_object(self, seed_index, composite_id: str, file_name: str, size: int = 0, content: bytes = b"") -> None:
+        """在模拟服务器的存储目录中创建对象：有内容时写入内容，否则创建指定大小的稀疏文件。"""
+        message_id, file_id = composite_id.split(":", 1)
+        file_unique_id = "seed" + file_id[-16:]
+        path = os.path.join(self.args.objects, file_unique_id)
+        with open(path, "wb") as f:
+            if content:
+                f.write(content)
+                size = len(content)
+            else:
+                f.truncate(size)
+        seed_index.write(json.dumps({
+            "message_id": int(message_id),
+            "file_id": file_id,
+            "file_unique_id": file_unique_id,
+            "file_name": file_name,
+            "file_size": size,
+            "mime_type": self._file_type(file_name)[0].split(";")[0],
+        }, ensure_ascii=False) + "\n")
+        self.stats["objects"] += 1
+
+
+_INSERT_SQL = (
+    "INSERT OR IGNORE INTO files (filename, file_id, filesize, upload_date, short_id, channel_name, tags, "
+    "mime_type, category, previewable) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def populate(args: argparse.Namespace) -> None:
+    db_path = args.db or database.DATABASE_URL
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    database.DATABASE_URL = db_path
+    database.init_db()
+
+    conn = sqlite3.connect(db_path)
+    # 加载期间不等待写盘；中途失败最多丢失未提交的批次
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-262144")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    try:
+        if args.truncate:
+            conn.execute("DELETE FROM files")
+            conn.execute("DELETE FROM file_changes")
+            conn.commit()
+        first_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM files").fetchone()[0]
+        # 复合 ID 的格式为 message_id:file_id，新消息 ID 接在已有的最大值之后
+        last_message_id = conn.execute(
+            "SELECT COALESCE(MAX(CAST(substr(file_id, 1, instr(file_id, ':') - 1) AS INTEGER)), 0) FROM files"
+        ).fetchone()[0]
+        generator = CatalogueGenerator(args, first_index=first_id, first_message_id=max(args.first_message_id, last_message_id + 1))
+
+        seed_index = None
+        if args.objects:
+            os.makedirs(args.objects, exist_ok=True)
+            seed_index = open(os.path.join(args.objects, SEED_INDEX_NAME), "a", encoding="utf-8")
+
+        started = time.perf_counter()
+        inserted = 0
+        try:
+            rows = generator.rows(seed_index)
+            while True:
+                batch = list(itertools.islice(rows, args.batch))
+                if not batch:
+                    break
+                with conn:
+                    before = conn.total_changes
+                    conn.executemany(_INSERT_SQL, batch)
+                    inserted += conn.total_changes - before
+                print(f"\r已写入 {inserted:,} / {args.rows:,} 行", end="", flush=True)
+        finally:
+            if seed_index is not None:
+                seed_index.close()
+        print()
+
+        with conn:
+            # 使 since=0 的增量同步也能得到这些记录
+            conn.execute(
+                "INSERT INTO file_changes (action, file_id, short_id, filename, filesize, upload_date, channel_name, tags) "
+                "SELECT 'add', file_id, short_id, filename, filesize, upload_date, channel_name, tags "
+                "FROM files WHERE id > ? ORDER BY id",
+                (first_id,),
+            )
+        conn.execute("ANALYZE")
+        elapsed = time.perf_counter() - started
+    finally:
+        conn.close()
+
+    stats = generator.stats
+    print(f"数据库: {db_path}")
+    print(f"新增 {inserted:,} 行（跳过 {args.rows - inserted:,} 行冲突），耗时 {elapsed:.1f}s，"
+          f"{inserted / elapsed if elapsed else 0:,.0f} 行/秒")
+    print(f"清单文件 {stats['manifests']:,} 个（共 {stats['chunks']:,} 个分块），"
+          f"合计 {stats['bytes'] / 1024 ** 4:.2f} TiB")
+    if args.objects:
+        print(f"模拟服务器对象 {stats['objects']:,} 个，已写入 {args.objects}（重启 fake_bot_api.py 后生效）")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="向 tgState 数据库写入合成的文件目录（规模测试用）")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="生成的文件记录数，默认 1000000")
+    parser.add_argument("--db", help="数据库路径，默认为 DATA_DIR 下的 file_metadata.db")
+    parser.add_argument("--truncate", action="store_true", help="写入前清空 files 与 file_changes 表")
+    parser.add_argument("--batch", type=int, default=100_000, help="每个事务写入的行数，默认 100000")
+    parser.add_argument("--channels", type=int, default=3, help="频道数，默认 3")
+    parser.add_argument("--tags", type=int, default=300, help="标签词表大小，默认 300")
+    parser.add_argument("--zipf", type=float, default=1.1, help="标签 Zipf 分布的指数，默认 1.1")
+    parser.add_argument("--cjk-ratio", type=float, default=0.35, help="中日韩文件名的比例，默认 0.35")
+    parser.add_argument("--days", type=int, default=1095, help="上传时间跨度（天），默认 1095")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子，默认 42")
+    parser.add_argument("--first-message-id", type=int, default=1_000_000, help="生成的消息 ID 下限，默认 1000000")
+    parser.add_argument("--objects", help="模拟 Bot API 服务器的存储目录（FAKE_TG_STORAGE）；指定时创建对应的文件")
+    parser.add_argument("--objects-limit", type=int, default=10_000, help="创建文件的记录数上限，默认 10000")
+    args = parser.parse_args()
+
+    if args.rows <= 0 or args.batch <= 0 or args.channels <= 0 or args.tags <= 0:
+        parser.error("--rows / --batch / --channels / --tags 必须为正数")
+    populate(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,81 @@
 """
 tgState 性能测试 - Locust 配置文件
 
+模拟真实的混合负载：浏览文件列表、完整下载、Range 下载（视频拖动）、不同大小的上传与删除。
+测试结束时输出 SLO 报告（各接口 p50/p95/p99、吞吐量、错误率），未达标时以非零退出码结束。
+
 使用方法:
 1. 安装 locust: pip install locust
-2. 运行测试: locust -f scripts/locustfile.py --host http://127.0.0.1:8000
-3. 访问 http://127.0.0.1:8089 进行 Web UI 控制测试
+2. 启动模拟的 Bot API 服务器（可选，避免依赖真实机器人）:
+   python scripts/fake_bot_api.py --port 8081 --latency-ms 50
+   并以 TELEGRAM_API_BASE_URL=http://127.0.0.1:8081 BOT_TOKEN=123456:fake CHANNEL_NAME=@loadtest 启动 tgState
+3. 运行测试: locust -f scripts/locustfile.py --host http://127.0.0.1:8000
+4. 访问 http://127.0.0.1:8089 进行 Web UI 控制测试
+
+环境变量:
+    LOCUST_PASSWORD          tgState 的访问密码（设置了密码时需要）
+    LOCUST_LARGE_UPLOAD_RATIO 上传中大文件（20~40MB，触发分块）的比例，默认 0.02
+    SLO_P95_MS / SLO_P99_MS  各接口 p95 / p99 延迟上限（毫秒），默认 1000 / 3000
+    SLO_ERROR_RATE           整体错误率上限，默认 0.01
+    SLO_REPORT_PATH          将 SLO 报告另存为 JSON 文件
 """
 
+import io
+import json
 import os
 import random
-import io
-from locust import HttpUser, task, between, events
-from locust.runners import MasterRunner
+import threading
+import time
+from collections import deque
+from urllib.parse import quote
+
+from locust import HttpUser, between, events, task
+from locust.runners import WorkerRunner
+
+PASSWORD = os.getenv("LOCUST_PASSWORD", "")
+LARGE_UPLOAD_RATIO = float(os.getenv("LOCUST_LARGE_UPLOAD_RATIO", "0.02"))
+SLO_P95_MS = float(os.getenv("SLO_P95_MS", "1000"))
+SLO_P99_MS = float(os.getenv("SLO_P99_MS", "3000"))
+SLO_ERROR_RATE = float(os.getenv("SLO_ERROR_RATE", "0.01"))
+SLO_REPORT_PATH = os.getenv("SLO_REPORT_PATH")
+
+# 所有虚拟用户共享的可下载文件池：(short_id, 大小, 复合 file_id)；刚上传的文件暂不知道 file_id
+_known_files: deque = deque(maxlen=2000)
+_known_files_lock = threading.Lock()
+
+# 下载类请求的字节数，用于计算吞吐量
+_DOWNLOAD_NAMES = ("GET /d/[id]", "GET /d/[id] (range)")
+_download_bytes = {"total": 0}
+_started_at = {"value": None}
+
+
+def _remember(short_id: str, size: int, file_id: str | None = None) -> None:
+    with _known_files_lock:
+        if not any(item[0] == short_id for item in _known_files):
+            _known_files.append((short_id, size, file_id))
+
+
+def _pick_file(deletable: bool = False):
+    with _known_files_lock:
+        candidates = [item for item in _known_files if item[2]] if deletable else _known_files
+        return random.choice(candidates) if candidates else None
+
+
+def _forget(short_id: str) -> None:
+    with _known_files_lock:
+        for item in list(_known_files):
+            if item[0] == short_id:
+                _known_files.remove(item)
+
+
+def _random_upload_size() -> int:
+    """大多数为图片 / 文档大小的小文件，少量中等文件，按比例混入需要分块的大文件。"""
+    roll = random.random()
+    if roll < LARGE_UPLOAD_RATIO:
+        return random.randint(20 * 1024 * 1024, 40 * 1024 * 1024)
+    if roll < LARGE_UPLOAD_RATIO + 0.15:
+        return random.randint(1024 * 1024, 8 * 1024 * 1024)
+    return random.randint(1024, 512 * 1024)
 
 
 class tgStateUser(HttpUser):
@@ -23,25 +87,76 @@ class tgStateUser(HttpUser):
 
     def on_start(self):
         """
-        用户开始时执行
+        用户开始时执行：按需登录，并在文件池为空时从列表接口预热
         """
-        self.uploaded_file_path = None
+        if PASSWORD:
+            self.client.post("/api/auth/login", json={"password": PASSWORD}, name="POST /api/auth/login")
+        if not _known_files:
+            self.browse_files()
 
-    def on_stop(self):
+    @task(5)
+    def browse_files(self):
         """
-        用户停止时执行，清理资源
+        分页浏览文件列表 (权重: 5)
         """
-        # 不需要清理，因为使用的是内存数据
-        pass
+        with self.client.get(
+            "/api/files/page?limit=100", catch_response=True, name="GET /api/files/page"
+        ) as response:
+            if response.status_code != 200:
+                response.failure(f"Got status code {response.status_code}")
+                return
+            try:
+                files = response.json().get("files", [])
+            except ValueError:
+                response.failure("Invalid JSON response")
+                return
+            for file_info in files[:20]:
+                if file_info.get("short_id"):
+                    _remember(file_info["short_id"], file_info.get("filesize") or 0, file_info.get("file_id"))
+            response.success()
 
-    @task(3)
-    def get_files_list(self):
+    @task(4)
+    def download_file(self):
         """
-        获取文件列表 (权重: 3)
+        完整下载一个文件 (权重: 4)，没有可下载文件时跳过
         """
-        with self.client.get("/api/files", catch_response=True, name="GET /api/files") as response:
+        picked = _pick_file()
+        if not picked:
+            return
+        short_id = picked[0]
+        with self.client.get(f"/d/{short_id}", catch_response=True, name="GET /d/[id]") as response:
             if response.status_code == 200:
                 response.success()
+            elif response.status_code == 404:
+                # 文件可能已被其他用户删除，不算失败
+                _forget(short_id)
+                response.success()
+            else:
+                response.failure(f"Got status code {response.status_code}")
+
+    @task(2)
+    def download_range(self):
+        """
+        Range 下载 (权重: 2)：模拟视频播放器拖动，读取随机位置的 1MB
+        """
+        picked = _pick_file()
+        if not picked or picked[1] < 2:
+            return
+        short_id, size, _ = picked
+        start = random.randrange(size)
+        end = min(size - 1, start + 1024 * 1024 - 1)
+        with self.client.get(
+            f"/d/{short_id}",
+            headers={"Range": f"bytes={start}-{end}"},
+            catch_response=True,
+            name="GET /d/[id] (range)",
+        ) as response:
+            # 分块上传的大文件不支持 Range，返回 200 也视为成功
+            if response.status_code in (200, 206):
+                response.success()
+            elif response.status_code == 404:
+                _forget(short_id)
+                response.success()
             else:
                 response.failure(f"Got status code {response.status_code}")
 
@@ -51,95 +166,146 @@ class tgStateUser(HttpUser):
         上传文件 (权重: 2)
         使用内存随机 bytes 生成，不依赖外部文件
         """
-        # 生成随机文件名
-        filename = f"test_{random.randint(1000, 9999)}.txt"
-
-        # 生成随机内容（使用内存 bytes）
-        content_size = random.randint(1000, 10000)
-        content = os.urandom(content_size)
-
-        # 创建内存文件对象
-        file_obj = io.BytesIO(content)
-        file_obj.name = filename
-
+        size = _random_upload_size()
+        filename = f"load_{random.randint(100000, 999999)}.bin"
+        file_obj = io.BytesIO(os.urandom(size))
         try:
-            files = {'file': (filename, file_obj, 'text/plain')}
             with self.client.post(
                 "/api/upload",
-                files=files,
+                files={"file": (filename, file_obj, "application/octet-stream")},
                 catch_response=True,
-                name="POST /api/upload"
+                name="POST /api/upload" if size < 20 * 1024 * 1024 else "POST /api/upload (chunked)",
             ) as response:
-                if response.status_code == 200:
-                    try:
-                        data = response.json()
-                        self.uploaded_file_path = data.get('path')
-                        response.success()
-                    except ValueError:
-                        response.failure("Invalid JSON response")
-                else:
+                if response.status_code != 200:
                     response.failure(f"Got status code {response.status_code}")
+                    return
+                try:
+                    short_id = response.json().get("short_id")
+                except ValueError:
+                    response.failure("Invalid JSON response")
+                    return
+                if short_id:
+                    _remember(short_id, size)
+                response.success()
         finally:
-            # 关闭文件对象
             file_obj.close()
 
     @task(1)
-    def download_file(self):
+    def delete_file(self):
         """
-        下载文件 (权重: 1)
-        先请求 /api/files 获取可下载文件，没有文件就跳过
+        删除一个文件 (权重: 1)，文件池较小时跳过以保证下载任务有数据
         """
-        # 先获取文件列表
-        with self.client.get("/api/files", catch_response=True, name="GET /api/files (for download)") as response:
-            if response.status_code == 200:
-                try:
-                    files = response.json()
-                    if isinstance(files, list) and len(files) > 0:
-                        # 随机选择一个文件下载
-                        file_info = random.choice(files)
-                        file_id = file_info.get('file_id')
-                        filename = file_info.get('filename', 'download.txt')
-
-                        # 构造下载路径
-                        from urllib.parse import quote
-                        download_path = f"/d/{file_id}/{quote(filename)}"
-
-                        # 下载文件
-                        with self.client.get(
-                            download_path,
-                            catch_response=True,
-                            name="GET /d/[file_id]/[filename]"
-                        ) as download_response:
-                            if download_response.status_code == 200:
-                                download_response.success()
-                            elif download_response.status_code == 404:
-                                # 文件可能已被删除，不算失败
-                                download_response.success()
-                            else:
-                                download_response.failure(f"Got status code {download_response.status_code}")
-                    else:
-                        # 没有文件，跳过下载任务
-                        pass
-                except ValueError:
-                    response.failure("Invalid JSON response")
+        if len(_known_files) < 50:
+            return
+        picked = _pick_file(deletable=True)
+        if not picked:
+            return
+        short_id, _, file_id = picked
+        _forget(short_id)
+        with self.client.delete(
+            f"/api/files/{quote(file_id, safe='')}", catch_response=True, name="DELETE /api/files/[id]"
+        ) as response:
+            if response.status_code in (200, 404):
+                response.success()
             else:
                 response.failure(f"Got status code {response.status_code}")
 
 
+@events.test_start.add_listener
+def on_test_start(environment, **kwargs):
+    _started_at["value"] = time.time()
+    _download_bytes["total"] = 0
+
+
+@events.request.add_listener
+def on_request(request_type, name, response_time, response_length, exception, **kwargs):
+    if exception is None and name in _DOWNLOAD_NAMES:
+        _download_bytes["total"] += response_length or 0
+
+
+def build_slo_report(stats, elapsed: float) -> dict:
+    """汇总各接口的延迟分位数、吞吐量与错误率，并与 SLO 阈值比较。"""
+    endpoints = []
+    violations = []
+    for entry in sorted(stats.entries.values(), key=lambda e: e.name):
+        if not entry.num_requests:
+            continue
+        item = {
+            "name": entry.name,
+            "method": entry.method,
+            "requests": entry.num_requests,
+            "failures": entry.num_failures,
+            "error_rate": entry.num_failures / entry.num_requests,
+            "rps": entry.num_requests / elapsed if elapsed > 0 else 0.0,
+            "p50_ms": entry.get_response_time_percentile(0.50),
+            "p95_ms": entry.get_response_time_percentile(0.95),
+            "p99_ms": entry.get_response_time_percentile(0.99),
+        }
+        # 大文件上传受带宽限制，不参与延迟 SLO
+        if "(chunked)" not in entry.name:
+            if item["p95_ms"] > SLO_P95_MS:
+                violations.append(f"{entry.name}: p95 {item['p95_ms']:.0f}ms > {SLO_P95_MS:.0f}ms")
+            if item["p99_ms"] > SLO_P99_MS:
+                violations.append(f"{entry.name}: p99 {item['p99_ms']:.0f}ms > {SLO_P99_MS:.0f}ms")
+        endpoints.append(item)
+
+    total = stats.total
+    error_rate = total.num_failures / total.num_requests if total.num_requests else 0.0
+    if error_rate > SLO_ERROR_RATE:
+        violations.append(f"error rate {error_rate:.2%} > {SLO_ERROR_RATE:.2%}")
+
+    return {
+        "duration_s": elapsed,
+        "requests": total.num_requests,
+        "failures": total.num_failures,
+        "error_rate": error_rate,
+        "rps": total.num_requests / elapsed if elapsed > 0 else 0.0,
+        "download_bytes_per_s": _download_bytes["total"] / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": total.get_response_time_percentile(0.50),
+        "p95_ms": total.get_response_time_percentile(0.95),
+        "p99_ms": total.get_response_time_percentile(0.99),
+        "slo": {"p95_ms": SLO_P95_MS, "p99_ms": SLO_P99_MS, "error_rate": SLO_ERROR_RATE},
+        "violations": violations,
+        "passed": not violations,
+        "endpoints": endpoints,
+    }
+
+
 @events.test_stop.add_listener
 def on_test_stop(environment, **kwargs):
     """
-    测试停止时执行
+    测试停止时输出 SLO 报告（分布式模式下只在 master 输出）
     """
-    if not isinstance(environment.runner, MasterRunner):
-        print("\n" + "=" * 50)
-        print("性能测试完成")
-        print("=" * 50)
-        print(f"总请求数: {environment.runner.stats.total.num_requests}")
-        print(f"失败请求数: {environment.runner.stats.total.num_failures}")
-        print(f"平均响应时间: {environment.runner.stats.total.avg_response_time:.2f}ms")
-        print(f"中位数响应时间: {environment.runner.stats.total.median_response_time:.2f}ms")
-        print(f"P95 响应时间: {environment.runner.stats.total.get_response_time_percentile(0.95):.2f}ms")
-        print(f"P99 响应时间: {environment.runner.stats.total.get_response_time_percentile(0.99):.2f}ms")
-        print(f"每秒请求数 (RPS): {environment.runner.stats.total.total_rps:.2f}")
-        print("=" * 50)
+    if isinstance(environment.runner, WorkerRunner):
+        return
+
+    elapsed = time.time() - (_started_at["value"] or time.time())
+    report = build_slo_report(environment.runner.stats, elapsed)
+
+    print("\n" + "=" * 96)
+    print("SLO 报告")
+    print("=" * 96)
+    print(f"{'接口':<36}{'请求数':>8}{'错误率':>9}{'RPS':>9}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for item in report["endpoints"]:
+        print(
+            f"{item['name']:<36}{item['requests']:>8}{item['error_rate']:>9.2%}{item['rps']:>9.2f}"
+            f"{item['p50_ms']:>8.0f}ms{item['p95_ms']:>8.0f}ms{item['p99_ms']:>8.0f}ms"
+        )
+    print("-" * 96)
+    print(f"总请求数: {report['requests']}  失败: {report['failures']}  错误率: {report['error_rate']:.2%}")
+    print(f"每秒请求数 (RPS): {report['rps']:.2f}  下载吞吐量: {report['download_bytes_per_s'] / 1024 / 1024:.2f} MB/s")
+    print(f"整体 p50 / p95 / p99: {report['p50_ms']:.0f} / {report['p95_ms']:.0f} / {report['p99_ms']:.0f} ms")
+    if report["passed"]:
+        print("SLO: 通过")
+    else:
+        print("SLO: 未通过")
+        for violation in report["violations"]:
+            print(f"  - {violation}")
+    print("=" * 96)
+
+    if SLO_REPORT_PATH:
+        with open(SLO_REPORT_PATH, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if not report["passed"]:
+        environment.process_exit_code = 1